@@ -0,0 +1,89 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+class TokenBucket:
+    """
+        Rate limit of `rate` calls by second, allowing bursts of `burst` calls (rate <= 0 disables the limit)
+        Can be shared by several threads
+    """
+    def __init__(self, rate: float, burst: int=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+            Wait until a call is allowed
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class BoundedExecutor:
+    """
+        Run a function for each item with at most `workers` concurrent calls, started at most at `rate` calls by second
+
+        map() yields the results in the order of the items, in the calling thread, so results can be handled (printed, counted, saved)
+        the same way as with a serial loop. At most 2 * workers items are pending, items can come from a long iterator.
+        With one worker, the calls are made in the calling thread.
+    """
+    def __init__(self, workers: int=1, rate: float=0, burst: int=1):
+        if workers < 1:
+            raise ValueError("Number of workers must be >= 1")
+        self.workers = workers
+        self.limiter = TokenBucket(rate, burst)
+
+    def call(self, func, item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    def map(self, func, items: Iterable, on_abandoned: Optional[Callable]=None):
+        """
+            Yield (item, result, error) for each item, error is the exception raised by func(item) (result is None)
+
+            If the iteration is stopped early (exception in the consumer, interruption, generator closed), the calls already started
+            are completed and not yielded, on_abandoned(item, result, error) is then called for each of them so their effect can be recorded.
+            Use contextlib.closing() to be sure it's done before the consumer's own cleanup.
+        """
+        if self.workers == 1:
+            for item in items:
+                self.limiter.acquire()
+                yield self.call(func, item)
+            return
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="executor")
+        pending = collections.deque()
+        try:
+            for item in items:
+                self.limiter.acquire()
+                pending.append(executor.submit(self.call, func, item))
+                while len(pending) >= 2 * self.workers:
+                    # Removed once its result is available, an interrupted wait leaves it pending
+                    result = pending[0].result()
+                    pending.popleft()
+                    yield result
+            while len(pending) > 0:
+                result = pending[0].result()
+                pending.popleft()
+                yield result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if on_abandoned is not None:
+                for future in pending:
+                    if not future.cancelled():
+                        on_abandoned(*future.result())
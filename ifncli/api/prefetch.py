@@ -0,0 +1,81 @@
+import queue
+import threading
+
+# Marker of the end of the pages in the queue
+_END = object()
+
+class PrefetchPager:
+    """
+        Iterate over a paginated request (like SurveyResponseJSONPaginated) fetching the next pages in a background thread
+        while the current page is processed. At most `depth` pages are fetched ahead, with depth 0 pages are fetched when requested (no thread).
+
+        Errors raised by the paginated request are raised by the iteration, at the page they occurred.
+        close() must be called if the iteration is stopped before the last page (it is called by the `with` statement).
+    """
+    def __init__(self, pager, depth: int=1):
+        if depth < 0:
+            raise ValueError("Prefetch depth must be >= 0")
+        self.pager = pager
+        self.depth = depth
+        self.pages = queue.Queue(maxsize=max(depth, 1))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fetch, name="prefetch", daemon=True)
+        self.iterator = None
+        self.started = False
+
+    def fetch(self):
+        try:
+            for page in self.pager:
+                if not self.put((page, None)):
+                    return
+        except Exception as e:
+            self.put((None, e))
+            return
+        self.put((_END, None))
+
+    def put(self, item):
+        """
+            Put an item in the queue, waiting for a free place until the pager is closed
+        """
+        while not self.stopped.is_set():
+            try:
+                self.pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        if not self.started:
+            self.started = True
+            if self.depth > 0:
+                self.thread.start()
+            else:
+                self.iterator = iter(self.pager)
+        return self
+
+    def __next__(self):
+        if self.stopped.is_set():
+            raise StopIteration()
+        if self.depth == 0:
+            return next(self.iterator)
+        page, error = self.pages.get()
+        if error is not None:
+            self.close()
+            raise error
+        if page is _END:
+            self.close()
+            raise StopIteration()
+        return page
+
+    def close(self):
+        """
+            Stop the background fetching (a page being fetched is discarded)
+        """
+        self.stopped.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,335 @@
+##
+# Management API client using a pooled http session (keep-alive, retry with backoff, request statistics)
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from influenzanet.api import ManagementAPIClient
+from influenzanet.api.management_api import ApiError, ReponseMeta
+
+# Options of the `http` entry of the configuration
+DEFAULT_HTTP_OPTIONS = {
+    'pool_size': 10, # Connections kept alive by host (use more than the number of threads of concurrent commands)
+    'retries': 3, # Retries on connection errors and on 502, 503, 504 status (status only for idempotent methods)
+    'backoff': 0.5, # Backoff factor in seconds between retries (0.5, 1, 2...)
+    'stats': True, # Show request statistics at the end of each command
+}
+
+RETRY_STATUS = [502, 503, 504]
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+def parse_http_options(conf: Optional[dict]):
+    options = dict(DEFAULT_HTTP_OPTIONS)
+    if conf is not None:
+        for name, value in conf.items():
+            if name not in DEFAULT_HTTP_OPTIONS:
+                raise ValueError("Unknown http option '{}', known: {}".format(name, ', '.join(DEFAULT_HTTP_OPTIONS.keys())))
+            options[name] = parse_option(name, DEFAULT_HTTP_OPTIONS[name], value)
+    return options
+
+def parse_option(name: str, default, value):
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in ('true', 'yes', 'on', '1'):
+            return True
+        if text in ('false', 'no', 'off', '0'):
+            return False
+        raise ValueError("Invalid boolean value '{}' for http option '{}'".format(value, name))
+    return type(default)(value)
+
+class RequestStats:
+    """
+        Counts and latency histogram of the requests sent by a session (can be updated by several threads)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.methods: dict[str, int] = {}
+        self.status: dict[str, int] = {}
+        self.errors = 0
+        self.time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, method: str, status: Optional[int], elapsed: float):
+        with self.lock:
+            self.methods[method] = self.methods.get(method, 0) + 1
+            if status is None:
+                self.errors += 1
+            else:
+                group = "{}xx".format(status // 100)
+                self.status[group] = self.status.get(group, 0) + 1
+            self.time += elapsed
+            index = 0
+            while index < len(LATENCY_BUCKETS) and elapsed > LATENCY_BUCKETS[index]:
+                index += 1
+            self.buckets[index] += 1
+
+    def count(self):
+        return sum(self.methods.values())
+
+    def histogram(self):
+        labels = ["<={}ms".format(int(b * 1000)) for b in LATENCY_BUCKETS] + [">{}ms".format(int(LATENCY_BUCKETS[-1] * 1000))]
+        return [(label, count) for label, count in zip(labels, self.buckets) if count > 0]
+
+    def show(self, file=sys.stderr):
+        count = self.count()
+        if count == 0:
+            return
+        methods = ", ".join(["{} {}".format(m, n) for m, n in sorted(self.methods.items())])
+        status = ", ".join(["{}={}".format(s, n) for s, n in sorted(self.status.items())])
+        print("API requests: %d (%s), status %s, errors %d, mean %.0fms" % (count, methods, status, self.errors, 1000 * self.time / count), file=file)
+        print("API latency: %s" % (", ".join(["{} {}".format(label, n) for label, n in self.histogram()])), file=file)
+
+class PooledSession(requests.Session):
+    """
+        Session keeping the connections alive in a pool, retrying failed requests with backoff and collecting request statistics
+    """
+    def __init__(self, options: Optional[dict]=None):
+        super(PooledSession, self).__init__()
+        self.options = parse_http_options(options)
+        retry = Retry(
+            total=self.options['retries'],
+            backoff_factor=self.options['backoff'],
+            status_forcelist=RETRY_STATUS,
+            raise_on_status=False,
+        )
+        size = self.options['pool_size']
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        self.stats = RequestStats()
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = super(PooledSession, self).request(method, url, *args, **kwargs)
+        except Exception:
+            self.stats.add(method.upper(), None, time.perf_counter() - start)
+            raise
+        self.stats.add(method.upper(), r.status_code, time.perf_counter() - start)
+        return r
+
+class PooledManagementAPIClient(ManagementAPIClient):
+    """
+        Management API client sending its requests with a PooledSession
+
+        The library calls the functions of the `requests` module and has no hook to give it a session,
+        so this subclass overrides the methods used by the commands (authentication, study rules, surveys,
+        responses and paginated requests) with versions calling `self.session`. Other library methods are
+        one-shot administrative calls, they are inherited unchanged and use plain `requests` (not in the stats).
+    """
+    def __init__(self, management_api_url, login_credentials=None, participant_api_url=None, use_external_idp=False, use_no_login=False, verbose=True, http_options: Optional[dict]=None):
+        self.session = PooledSession(http_options)
+        super(PooledManagementAPIClient, self).__init__(management_api_url, login_credentials, participant_api_url, use_external_idp=use_external_idp, use_no_login=use_no_login, verbose=verbose)
+
+    def _post_login(self, credentials):
+        r = self.session.post(self.management_api_url + '/v1/auth/login-with-email', data=json.dumps(credentials))
+        if r.status_code != 200:
+            print(r.content)
+            exit()
+        return r.json()
+
+    def login(self, credentials):
+        resp = self._post_login(credentials)
+        if 'secondFactorNeeded' in resp.keys() and resp['secondFactorNeeded']:
+            verification_code = input('Enter verification code:')
+            credentials['verificationCode'] = verification_code.replace('-', '').replace(' ', '').strip()
+            resp = self._post_login(credentials)
+        self.handle_token_response(resp['token'])
+        if self.verbose:
+            print('Successfully logged in.')
+
+    def renew_token(self):
+        self.check_auth()
+        if self.participant_api_url is None:
+            raise ValueError('missing common api url')
+        r = self.session.post(self.participant_api_url + '/v1/auth/renew-token', headers=self.auth_header, data=json.dumps({"refreshToken": self._refresh_token}))
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        self.handle_token_response(r.json())
+        return True
+
+    def get_studies(self):
+        self.check_auth()
+        r = self.session.get(self.management_api_url + '/v1/studies', headers=self.auth_header)
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        data = r.json()
+        if 'studies' in data:
+            return data['studies']
+        return []
+
+    def get_study(self, study_key):
+        self.check_auth()
+        r = self.session.get(self.management_api_url + '/v1/study/' + study_key, headers=self.auth_header)
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        return r.json()
+
+    def run_custom_study_rules(self, study_key, rules):
+        self.check_auth()
+        r = self.session.post(self.management_api_url + '/v1/study/' + study_key + '/run-rules', headers=self.auth_header,
+                          data=json.dumps({'studyKey': study_key, 'rules': rules}))
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        return r.json()
+
+    def run_custom_study_rules_for_single_participant(self, study_key, rules, pid: str):
+        self.check_auth()
+        r = self.session.post(self.management_api_url + '/v1/study/' + study_key + '/run-rules-for-single-participant', headers=self.auth_header,
+                          data=json.dumps({'studyKey': study_key, 'rules': rules, 'participantId': pid}))
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        return r.json()
+
+    def current_study_rules(self, study_key):
+        self.check_auth()
+        r = self.session.get(self.management_api_url + '/v1/study/' + study_key + '/rules', headers=self.auth_header)
+        if r.status_code != 200:
+            if self.is_mongo_empty_doc(r):
+                return []
+            raise ValueError(r.content)
+        return r.json()
+
+    def get_surveys_in_study(self, study_key, extract_infos=False):
+        self.check_auth()
+        r = self.session.get(self.management_api_url + '/v1/study/' + study_key + '/surveys', headers=self.auth_header)
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        data = r.json()
+        if extract_infos and 'infos' in data:
+            return data['infos']
+        return data
+
+    def _get_survey_document(self, url: str, missing: str):
+        self.check_auth()
+        r = self.session.get(url, headers={'Authorization': 'Bearer ' + self.token})
+        if r.status_code != 200:
+            if self.is_mongo_empty_doc(r):
+                print(missing)
+            else:
+                print(r.content)
+            return None
+        return r.json()
+
+    def get_survey_definition(self, study_key, survey_key, version_id=''):
+        url = self.management_api_url + '/v1/study/' + study_key + '/survey/' + survey_key
+        if version_id != "":
+            url += '/' + version_id
+        return self._get_survey_document(url, 'Survey key does not exist in this study yet.')
+
+    def get_survey_history(self, study_key, survey_key):
+        url = '{}/v1/study/{}/survey/{}/versions'.format(self.management_api_url, study_key, survey_key)
+        return self._get_survey_document(url, 'Survey does not exist in this study yet.')
+
+    def get_participant_state_paginated(self, study_key: str, page:int, page_size:int, query:dict=None, sorted_by:dict=None):
+        self.check_auth()
+        url = "{}/v1/data/{}/participants".format(self.management_api_url, study_key)
+        def encode_dict(d):
+            if d is None or len(d) == 0:
+                return ""
+            return json.dumps(d, indent=None)
+        params = {
+            "page": page,
+            "pageSize": page_size,
+            "query": encode_dict(query),
+            "sortedBy": encode_dict(sorted_by)
+        }
+        r = self.session.get(url, headers=self.auth_header, params=params)
+        if r.status_code != 200:
+            raise ApiError(r.content, r.status_code)
+        return r.json()
+
+    def get_response_statistics(self, study_key, start=None, end=None):
+        self.check_auth()
+        params = {}
+        if start is not None:
+            params["from"] = int(start)
+        if end is not None:
+            params["until"] = int(end)
+        r = self.session.get(self.management_api_url + '/v1/data/' + study_key + '/statistics', headers={'Authorization': 'Bearer ' + self.token}, params=params)
+        if r.status_code != 200:
+            raise ValueError(r.content)
+        return r.json()
+
+    def get_response_csv(self, study_key: str, survey_key: str, key_separator: str, format=str, short_keys=True, with_meta_infos=None, start=None, end=None):
+        self.check_auth()
+        params = {"sep": key_separator}
+        if with_meta_infos is not None:
+            params = {**params, **with_meta_infos}
+        if start is not None:
+            params["from"] = int(start)
+        if end is not None:
+            params["until"] = int(end)
+        params["shortKeys"] = "true" if short_keys else "false"
+        url = "{}/v1/data/{}/survey/{}/response".format(self.management_api_url, study_key, survey_key)
+        if format == "long":
+            url += "/long-format"
+        elif format == "json":
+            url += "/json"
+        r = self.session.get(url, headers=self.auth_header, params=params)
+        if r.status_code != 200:
+            print(r.content)
+            return None
+        r.encoding = 'utf-8'
+        return r.text
+
+    def _get_survey_info(self, study_key: str, survey_key: str, lang: str, short_keys: bool, path: str):
+        self.check_auth()
+        params = {"lang": lang, "shortKeys": "true" if short_keys else "false"}
+        url = "{}/v1/data/{}/survey/{}/{}".format(self.management_api_url, study_key, survey_key, path)
+        r = self.session.get(url, headers=self.auth_header, params=params)
+        if r.status_code != 200:
+            print(r.content)
+            return None
+        return r
+
+    def get_survey_info_preview_csv(self, study_key: str, survey_key: str, lang: str, short_keys=True):
+        r = self._get_survey_info(study_key, survey_key, lang, short_keys, 'survey-info/csv')
+        return None if r is None else r.text
+
+    def get_survey_info_preview(self, study_key: str, survey_key: str, lang: str, short_keys=True):
+        r = self._get_survey_info(study_key, survey_key, lang, short_keys, 'survey-info')
+        return None if r is None else r.json()
+
+    def get_survey_responses_json_paginated(self, study_key: str, survey_key: str, start:Optional[int]=None, end:Optional[int]=None,
+            page:Optional[int]=None, page_size:Optional[int]=None, key_separator:Optional[str]=None, short_keys:Optional[bool]=None, meta_infos:Optional[ReponseMeta]=None):
+        self.check_auth()
+        params = {"sep": key_separator}
+        if meta_infos is not None:
+            params.update(meta_infos.toQuery())
+        if start is not None:
+            params["from"] = int(start)
+        if end is not None:
+            params["until"] = int(end)
+        params["shortKeys"] = "true" if short_keys else "false"
+        params['page'] = page
+        params['pageSize'] = page_size
+        url = "{}/v1/data/{}/survey/{}/response-with-pagination/json".format(self.management_api_url, study_key, survey_key)
+        r = self.session.get(url, headers=self.auth_header, params=params)
+        if r.status_code != 200:
+            raise ApiError(r.content, r.status_code)
+        # Pagination infos and responses are two concatenated json documents
+        content = r.text
+        index = content.find('}')
+        return {
+            'pagination': json.loads(content[0:(index + 1)]),
+            'responses': json.loads(content[(index + 1):])
+        }
+
+    def show_stats(self):
+        if self.session.options['stats']:
+            self.session.stats.show()
+        self.session.stats.reset()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from .executor import BoundedExecutor, TokenBucket
+
+class FakeRules:
+    """
+        Fake run_custom_study_rules_for_single_participant, fails for ids in `errors`
+    """
+    def __init__(self, errors: set[str], delay: float=0):
+        self.errors = errors
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, pid: str):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if pid in self.errors:
+            raise ValueError("Rule failed for {}".format(pid))
+        return {'participantStateChangePerRule': [1], 'pid': pid}
+
+def results(executor: BoundedExecutor, func, items):
+    return [(item, r, str(e) if e is not None else None) for item, r, e in executor.map(func, items)]
+
+class TestBoundedExecutor(unittest.TestCase):
+
+    def test_same_as_serial(self):
+        pids = ['p{}'.format(i) for i in range(50)]
+        errors = set(pids[::7])
+        expected = results(BoundedExecutor(1), FakeRules(errors), pids)
+        self.assertEqual(len([r for r in expected if r[2] is not None]), len(errors))
+        func = FakeRules(errors, delay=0.005)
+        self.assertEqual(results(BoundedExecutor(4), func, iter(pids)), expected)
+        self.assertTrue(1 < func.max_running <= 4)
+
+    def test_rate_limit(self):
+        start = time.monotonic()
+        r = results(BoundedExecutor(4, rate=100, burst=5), FakeRules(set()), range(25))
+        elapsed = time.monotonic() - start
+        self.assertEqual([item for item, _, _ in r], list(range(25)))
+        # 5 calls at once, then 20 calls at 100/s
+        self.assertGreaterEqual(elapsed, 0.18)
+
+    def test_stop_early(self):
+        func = FakeRules(set())
+        for item, _, _ in BoundedExecutor(2).map(func, range(1000)):
+            if item == 3:
+                break
+        self.assertEqual(func.running, 0)
+
+    def test_abandoned(self):
+        func = FakeRules({'p5'}, delay=0.01)
+        handled = []
+        abandoned = []
+        pids = ['p{}'.format(i) for i in range(100)]
+        with self.assertRaises(KeyError):
+            for pid, _, _ in BoundedExecutor(3).map(func, pids, on_abandoned=lambda item, r, e: abandoned.append(item)):
+                handled.append(pid)
+                if pid == 'p4':
+                    raise KeyError(pid)
+        self.assertEqual(func.running, 0)
+        self.assertEqual(handled, pids[:5])
+        # Calls started after p4 are handed to on_abandoned, in order, none is lost or called twice
+        self.assertTrue(len(abandoned) > 0)
+        self.assertEqual(abandoned, pids[5:5 + len(abandoned)])
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(0)
+        for _ in range(100):
+            bucket.acquire()
+        bucket = TokenBucket(1000, burst=10)
+        start = time.monotonic()
+        for _ in range(10):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        with self.assertRaises(ValueError):
+            BoundedExecutor(0)
@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from .prefetch import PrefetchPager
+
+class FakePager:
+    """
+        Paginated request returning `count` pages, fails at page `fail_at` if set
+    """
+    def __init__(self, count: int, fail_at: int=0):
+        self.count = count
+        self.fail_at = fail_at
+        self.fetched = []
+        self.threads = set()
+
+    def __iter__(self):
+        for page in range(1, self.count + 1):
+            self.threads.add(threading.current_thread().name)
+            if page == self.fail_at:
+                raise ValueError("API failure")
+            self.fetched.append(page)
+            yield page
+
+class TestPrefetchPager(unittest.TestCase):
+
+    def test_pages_in_order(self):
+        for depth in [0, 1, 3]:
+            pager = FakePager(10)
+            with PrefetchPager(pager, depth) as pages:
+                self.assertEqual(list(pages), list(range(1, 11)))
+            expected = 'MainThread' if depth == 0 else 'prefetch'
+            self.assertEqual(pager.threads, {expected})
+
+    def test_depth(self):
+        pager = FakePager(10)
+        with PrefetchPager(pager, 2) as pages:
+            self.assertEqual(next(iter(pages)), 1)
+            time.sleep(0.2)
+            # Page returned, 2 pages in queue and 1 waiting for a free place
+            self.assertEqual(pager.fetched, [1, 2, 3, 4])
+
+    def test_error(self):
+        pages = []
+        with self.assertRaises(ValueError):
+            with PrefetchPager(FakePager(10, fail_at=4), 2) as pager:
+                for page in pager:
+                    pages.append(page)
+        self.assertEqual(pages, [1, 2, 3])
+
+    def test_close(self):
+        pager = FakePager(100)
+        prefetch = PrefetchPager(pager, 1)
+        with prefetch as pages:
+            for page in pages:
+                if page == 2:
+                    break
+        prefetch.thread.join(1)
+        self.assertFalse(prefetch.thread.is_alive())
+        self.assertLess(len(pager.fetched), 5)
+        self.assertEqual(list(prefetch), [])
+
+    def test_invalid_depth(self):
+        with self.assertRaises(ValueError):
+            PrefetchPager(FakePager(1), -1)
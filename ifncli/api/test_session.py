@@ -0,0 +1,115 @@
+import gzip
+import io
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from influenzanet.api import management_api
+
+from .session import PooledManagementAPIClient, PooledSession, RequestStats, parse_http_options
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """
+        /v1/studies returns a gzip compressed list of studies, /unavailable fails with 503 the first `failures` times
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, body: bytes, headers: dict={}):
+        self.server.connections.add(self.client_address)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/unavailable':
+            self.server.calls += 1
+            if self.server.calls <= self.server.failures:
+                self.send(503, b'')
+                return
+        self.server.encodings.append(self.headers.get('Accept-Encoding'))
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+            f.write(json.dumps({'studies': [{'key': 'study'}]}).encode('utf-8'))
+        self.send(200, buf.getvalue(), {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'})
+
+class TestPooledSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+        self.server.connections = set()
+        self.server.encodings = []
+        self.server.calls = 0
+        self.server.failures = 2
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_stats(self):
+        session = PooledSession({'backoff': 0})
+        for _ in range(5):
+            r = session.get(self.url + '/v1/studies')
+            self.assertEqual(r.json(), {'studies': [{'key': 'study'}]})
+        # Retried on 503 status
+        self.assertEqual(session.get(self.url + '/unavailable').status_code, 200)
+        self.assertEqual(self.server.calls, 3)
+        # All requests on the same connection
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertIn('gzip', self.server.encodings[0])
+        self.assertEqual(session.stats.count(), 6)
+        self.assertEqual(session.stats.status, {'2xx': 6})
+        self.assertEqual(sum([n for _, n in session.stats.histogram()]), 6)
+
+    def test_client_uses_session(self):
+        client = PooledManagementAPIClient(self.url, participant_api_url=self.url, use_no_login=True, verbose=False)
+        client.auth_header = {'Authorization': 'Bearer token'}
+        self.assertEqual(client.get_studies(), [{'key': 'study'}])
+        self.assertEqual(client.get_studies(), [{'key': 'study'}])
+        self.assertEqual(client.session.stats.methods, {'GET': 2})
+        self.assertEqual(len(self.server.connections), 1)
+        client.show_stats()
+        self.assertEqual(client.session.stats.count(), 0)
+        # The library module and plain clients are unchanged
+        self.assertIs(management_api.requests, requests)
+        plain = management_api.ManagementAPIClient(self.url, participant_api_url=self.url, use_no_login=True, verbose=False)
+        plain.auth_header = client.auth_header
+        self.assertEqual(plain.get_studies(), [{'key': 'study'}])
+        self.assertEqual(client.session.stats.count(), 0)
+        self.assertFalse(hasattr(plain, 'session'))
+
+    def test_subclass_override(self):
+        class PluginClient(PooledManagementAPIClient):
+            def get_studies(self):
+                return 'plugin'
+        client = PluginClient(self.url, participant_api_url=self.url, use_no_login=True, verbose=False)
+        self.assertEqual(client.get_studies(), 'plugin')
+
+    def test_errors(self):
+        session = PooledSession({'retries': 0})
+        with self.assertRaises(requests.ConnectionError):
+            session.get('http://127.0.0.1:1/')
+        self.assertEqual(session.stats.errors, 1)
+        with self.assertRaises(ValueError):
+            parse_http_options({'pool': 2})
+        self.assertFalse(parse_http_options({'stats': 'false'})['stats'])
+        self.assertTrue(parse_http_options({'stats': 'yes'})['stats'])
+        self.assertEqual(parse_http_options({'pool_size': '4'})['pool_size'], 4)
+        with self.assertRaises(ValueError):
+            parse_http_options({'stats': 'maybe'})
+
+    def test_histogram(self):
+        stats = RequestStats()
+        for elapsed in [0.01, 0.02, 0.3, 10]:
+            stats.add('POST', 200, elapsed)
+        self.assertEqual(stats.histogram(), [('<=50ms', 2), ('<=500ms', 1), ('>5000ms', 1)])
@@ -6,7 +6,7 @@ import sys
 
 from .config import ConfigManager, ConfigException
 from .platform import PlatformResources
-from influenzanet.api import ManagementAPIClient
+from .api.session import PooledManagementAPIClient
 
 class AppConfigManager(ConfigManager):
 
@@ -17,7 +17,7 @@ class AppConfigManager(ConfigManager):
         self._apis = {}
         self.api_shown = False 
         if api_class is None:
-            self.api_class = ManagementAPIClient
+            self.api_class = PooledManagementAPIClient
         else:
             self.api_class = api_class
 
@@ -46,7 +46,10 @@ class AppConfigManager(ConfigManager):
 
         api_class = self.api_class
 
-        client = api_class(management_api_url, user_credentials, participant_api_url, verbose=False)
+        if issubclass(api_class, PooledManagementAPIClient):
+            client = api_class(management_api_url, user_credentials, participant_api_url, verbose=False, http_options=self._configs.get('http'))
+        else:
+            client = api_class(management_api_url, user_credentials, participant_api_url, verbose=False)
         self._apis['management'] = client
 
         if not self.api_shown:
@@ -56,6 +59,14 @@ class AppConfigManager(ConfigManager):
 
         return client
 
+    def show_api_stats(self):
+        """
+            Show the statistics of the requests sent by the client since the last call (if the client collects them)
+        """
+        client = self._apis.get('management')
+        if client is not None and hasattr(client, 'show_stats'):
+            client.show_stats()
+
     def get_configs(self, what=None, must_exist=True):
         """
         Get App configs
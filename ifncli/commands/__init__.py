@@ -4,6 +4,16 @@ COMMANDS = []
 def register(klass):
     COMMANDS.append(klass)
 
+# Common option of commands iterating over paginated requests (see ifncli.api.prefetch.PrefetchPager)
+def add_prefetch_argument(parser, default: int=0):
+    parser.add_argument("--prefetch", help="Number of pages fetched in background while a page is processed (0 to disable, default {})".format(default), type=int, default=default)
+
+# Common options of commands calling the API for each participant (see ifncli.api.executor.BoundedExecutor)
+def add_executor_arguments(parser):
+    parser.add_argument("--workers", help="Number of concurrent API calls (default 1)", type=int, default=1)
+    parser.add_argument("--rate", help="Maximum API calls by second (0 for no limit, default)", type=float, default=0)
+    parser.add_argument("--burst", help="Calls allowed at once over the rate (default 10)", type=int, default=10)
+
 # Load module to be able to register (autoloader)
 from . import config, study, email, user, response, survey, stats, participants, survey_repository, export
 
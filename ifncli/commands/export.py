@@ -1,14 +1,14 @@
 import os
 from datetime import datetime
 from cliff.command import Command
-from . import register
+from . import register, add_prefetch_argument
 from ifncli.utils import read_yaml, readable_yaml, read_json, write_content, Output, from_iso_time, parse_tokens
 from ifncli.managers.export import ExportProfile
 try:
-    from ifncli.managers.export.db import DbExporter, ExportDatabase, ExportSqlite, ExportSetupGenerator
+    from ifncli.managers.export.db import DbExporter, MultiSurveyExporter, ExportDatabase, ExportSqlite, ExportSetupGenerator
     from ifncli.managers.export.db.compress import CompressEvaluator
     from ifncli.managers.export.db.describe import describe_database, DatabaseDescriber
-    from ifncli.managers.export.db.builder import DatabaseBuilder, BuilderProfile, BuilderPlan, SurveySchema, VersionSelectorParser, fake, PrintWriter
+    from ifncli.managers.export.db.builder import DatabaseBuilder, create_builder, BuilderProfile, BuilderPlan, SurveySchema, VersionSelectorParser, fake, PrintWriter
     from influenzanet.surveys.preview.schema import ReadableSchema
     export_module_available = True
     missing_module = None
@@ -58,6 +58,10 @@ class ResponseDbExport(Command):
         
         # Options
         parser.add_argument("--page-size", help="page size", type=int, default=1000)
+        parser.add_argument("--parallel", help="Number of periods fetched concurrently (default 1)", type=int, default=1)
+        parser.add_argument("--bulk", help="Bulk mode: tuned sqlite settings, one transaction by period, indexes created after the initial load", action="store_true")
+        add_prefetch_argument(parser)
+        parser.add_argument("--concurrent-surveys", help="Export the surveys of a multiple survey profile concurrently (one database writer)", action="store_true")
         
         g = parser.add_mutually_exclusive_group()   
         g.add_argument("--start-from", help="restart export from this time (iso time string)", default=None)
@@ -99,12 +103,19 @@ class ResponseDbExport(Command):
             print("Profile short_keys set to False is ignored")
             profile.short_keys = True # Avoid warning on each download loop
 
+        if args.concurrent_surveys and len(surveys) > 1:
+            if restart:
+                start_time = profile.start_time
+            exporter = MultiSurveyExporter(profile, client, study_key, args.db_path, page_size, surveys, bulk=args.bulk, prefetch=args.prefetch)
+            exporter.export_all(start_time, parallel=args.parallel)
+            return
+
         for survey in surveys:
             profile.configure_for_survey(survey)
-            exporter = DbExporter(profile, client, study_key, args.db_path, page_size)
+            exporter = DbExporter(profile, client, study_key, args.db_path, page_size, bulk=args.bulk, prefetch=args.prefetch)
             if restart:
                 start_time = profile.start_time
-            exporter.export_all(start_time)
+            exporter.export_all(start_time, parallel=args.parallel)
 
 class ResponseExportSchema(Command):
     """
@@ -207,7 +218,14 @@ class ResponseDbBuildFlat(Command):
         parser.add_argument("--source-table", help="Table name to import data into in the target database (default is responses_$(survey))", required=False)
         parser.add_argument("--profile", help="Yaml file defining the import profile (all parameters can be in it)", required=False)
         parser.add_argument("--offset", help="Starting offset", type=int, default=0)
+        parser.add_argument("--pagination", help="How to fetch source rows by batch 'keyset' (default) or 'offset'", choices=['keyset', 'offset'], required=False)
         parser.add_argument("--batch-size", help="Number of rows to load at once", type=int, default=5000)
+        parser.add_argument("--engine", help="Build engine 'pandas' (default) or 'duckdb' (source db attached and transformed in duckdb)", choices=['pandas', 'duckdb'], required=False)
+        parser.add_argument("--workers", help="Number of processes used to decompress and parse raw data", type=int, required=False)
+        parser.add_argument("--pipeline", help="Run loading, transformation and writing of batches concurrently", action="store_true", default=None)
+        parser.add_argument("--pipeline-queue-size", help="Maximum number of batches waiting between two pipeline stages", type=int, required=False)
+        parser.add_argument("--resume", help="Resume the build from the last checkpoint saved in the target db", action="store_true", default=None)
+        parser.add_argument("--incremental", help="Only build data exported since the last completed build", action="store_true", default=None)
         parser.add_argument('--debugger', help="Debugger list of properties to debug")
         parser.add_argument("--only-show", help="Only show the profile configuration use for import and exit (do not import anything)", action="store_true")
         parser.add_argument("--dry-run", help="Only prepare data dont run the update on target db", action="store_true")
@@ -224,7 +242,14 @@ class ResponseDbBuildFlat(Command):
             'to_time': args.to_time,
             'survey': args.survey,
             'starting_offset': args.offset,
+            'pagination': args.pagination,
             'batch_size': args.batch_size,
+            'engine': args.engine,
+            'workers': args.workers,
+            'pipeline': args.pipeline,
+            'pipeline_queue_size': args.pipeline_queue_size,
+            'resume': args.resume,
+            'incremental': args.incremental,
             'debugger': args.debugger,
             'dry_run': args.dry_run,
         }
@@ -237,7 +262,7 @@ class ResponseDbBuildFlat(Command):
             print(readable_yaml(d))
             return
 
-        builder = DatabaseBuilder(profile)
+        builder = create_builder(profile)
         builder.run()
 
 class ResponseDbBuildPlan(Command):
@@ -254,6 +279,9 @@ class ResponseDbBuildPlan(Command):
         parser.add_argument("--only-show", help="Only show the profile configuration use for import and exit (do not import anything)", action="store_true")
         parser.add_argument("--data-path", help="Base path where database files are placed")
         parser.add_argument("--surveys", help="Only build these surveys in the plan (default is all)")
+        parser.add_argument("--workers", help="Number of processes used to decompress and parse raw data (override profiles)", type=int, required=False)
+        parser.add_argument("--resume", help="Resume the build of each survey from the last checkpoint saved in the target db", action="store_true", default=None)
+        parser.add_argument("--incremental", help="Only build data exported since the last completed build of each survey", action="store_true", default=None)
         return parser
 
     def take_action(self, parsed_args):
@@ -269,7 +297,14 @@ class ResponseDbBuildPlan(Command):
             if not os.path.isdir(data_path):
                 raise ValueError(f"path pointed by --data-path is not a directory {data_path}")
         
-        plan = BuilderPlan(args.data_path)
+        # Applied to each survey profile before it is validated
+        profile_overrides = {
+            'workers': args.workers,
+            'resume': args.resume,
+            'incremental': args.incremental,
+        }
+
+        plan = BuilderPlan(args.data_path, profile_overrides)
 
         plan.load_file(args.plan)
 
@@ -288,7 +323,7 @@ class ResponseDbBuildPlan(Command):
             if args.only_show:
                 print(readable_yaml(survey_profile.to_readable()))
             else:
-                builder = DatabaseBuilder(survey_profile)
+                builder = create_builder(survey_profile)
                 builder.run()
        
 class ResponseDbDescribder(DatabaseDescriber):
@@ -380,7 +415,7 @@ class ResponseDbUnavailable(Command):
 
 class ResponseTestCompress(Command):
     """
-       Evaluate compression size for a survey data. Only works on an uncompressed data
+       Evaluate compression size and time of the available compressors (including zstd-dict) on a survey data
     """
 
     name = "response:db:compress"
@@ -1,7 +1,13 @@
+import itertools
+from contextlib import closing
 from cliff.command import Command
-from . import register
-from ..utils import read_yaml, write_json, read_json
+from typing import Iterable
+from . import register, add_prefetch_argument, add_executor_arguments
+from ..utils import read_yaml, write_json
 from ..api import STUDY_PARTICIPANT_STATUS
+from ..api.prefetch import PrefetchPager
+from ..api.executor import BoundedExecutor
+from ..utils.flags import expr_update_flag, expr_grouped_update, diff_flags, group_updates, count_changes, load_flags, read_flags_chunks, DEFAULT_GROUP_SIZE, PARTICIPANT_ID_EXPRESSION
 from influenzanet.api import ParticpantStatePaginaged
 
 from ..stats.collector import DataCollector, CollectorBuilder, FieldCountCollector
@@ -14,6 +20,7 @@ class ParticipantStatesStatistics(Command):
         parser = super(ParticipantStatesStatistics, self).get_parser(prog_name)
         parser.add_argument("--study", help="Study key", required=True)
         parser.add_argument("--page-size", help="page size", type=int, default=100)
+        add_prefetch_argument(parser)
         g = parser.add_mutually_exclusive_group(required=False)
         g.add_argument("--stats", help="Stats definition (using string format)")
         g.add_argument("--stats-file", help="Load stats definition from file")
@@ -44,11 +51,12 @@ class ParticipantStatesStatistics(Command):
         collector = DataCollector()
         collector.register(*collectors)
 
-        for r in pager:
-           print("Fetching page %d with %d items" % (r.page, len(r)))
-           for item in r.items:
-                if 'flags' in item:
-                    collector.collect(item['flags'])
+        with PrefetchPager(pager, args.prefetch) as pages:
+            for r in pages:
+               print("Fetching page %d with %d items" % (r.page, len(r)))
+               for item in r.items:
+                    if 'flags' in item:
+                        collector.collect(item['flags'])
 
         stats = collector.get_stats()
         
@@ -60,21 +68,6 @@ class ParticipantStatesStatistics(Command):
             write_json(args.output, d)
 
 
-def expr_update_flag(name: str, value:str):
-    return {
-            "name": "UPDATE_FLAG",
-            "data": [
-                {
-                    "str": name,
-                    "dtype": "str"
-                },
-                {
-                    "str": value,
-                    "dtype": "str"
-                }
-            ]
-            }
-    
 class ParticipantStatesSync(Command):
     """
         Synchronize flags values for participants
@@ -86,8 +79,14 @@ class ParticipantStatesSync(Command):
         parser = super(ParticipantStatesSync, self).get_parser(prog_name)
         parser.add_argument("--study", help="Study key", required=True)
         parser.add_argument("--page-size", help="page size", type=int, default=500)
-        parser.add_argument("--file", help="Flags definition to update for each participants")
+        add_prefetch_argument(parser)
+        parser.add_argument("--file", help="Flags definition to update for each participants (json dictionary or json lines)")
         parser.add_argument("--dry-run", help="Only look for sync do not update", action="store_true", default=False)
+        parser.add_argument("--grouped", help="Apply one rule for each set of identical updates instead of one call by participant", action="store_true", default=False)
+        parser.add_argument("--group-size", help="Max number of participants in the condition of a grouped rule", type=int, default=DEFAULT_GROUP_SIZE)
+        parser.add_argument("--pid-expression", help="Study engine expression giving the participant id, used in the condition of grouped rules", default=PARTICIPANT_ID_EXPRESSION)
+        parser.add_argument("--stream", help="Read the flags file by chunks of page size participants and apply the updates of each chunk as soon as it is compared", action="store_true", default=False)
+        add_executor_arguments(parser)
         return parser  
 
     def take_action(self, args):
@@ -96,21 +95,48 @@ class ParticipantStatesSync(Command):
         study_key = args.study
         page_size = args.page_size
 
-        pager = ParticpantStatePaginaged(client, page_size=page_size, study_key=study_key)
+        counts = {'flags': 0, 'found': 0, 'synced': 0, 'update': 0}
+        if args.stream:
+            # Only the participants of the current chunk of the flags file are fetched and kept in memory
+            chunks = read_flags_chunks(args.file, page_size)
+            with closing(self.diff_chunks(client, study_key, chunks, counts, args)) as updates:
+                count_applied, count_ok, count_errors = self.apply(client, study_key, updates, args)
+        else:
+            flags = load_flags(args.file)
+            counts['flags'] = len(flags)
+            pager = ParticpantStatePaginaged(client, page_size=page_size, study_key=study_key)
+            with PrefetchPager(pager, args.prefetch) as pages:
+                # All the pages are compared before applying
+                to_update = {}
+                for page_updates in self.diff_pages(pages, flags, counts):
+                    to_update.update(page_updates)
+                count_applied, count_ok, count_errors = self.apply(client, study_key, [to_update], args)
 
-        # Flags file is expected to be a dictionnary
-        
-        flags = read_json(args.file)
-        if not isinstance(flags, dict):
-            raise ValueError("Flags file does not contains a dictionary")        
-        
-        to_update = {}
+        print("Summary")
+        print("Sync file has {}".format(counts['flags']))
+        print("Participants found {}".format(counts['found']))
+        print("Participants alreay synced {}, need to change for ".format(counts['synced']), counts['update'], )
+        print("Applying changed Applied={}, OK={}, Errors={}".format(count_applied, count_ok, count_errors))
 
-        count_found = 0
-        count_synced = 0
-        for r in pager:
-           print("Fetching page %d with %d items" % (r.page, len(r)))
-           for item in r.items:
+    def diff_chunks(self, client, study_key: str, chunks: Iterable[dict], counts: dict, args):
+        """
+            Yields the flags to update for each page of the participants of each chunk of the flags file
+        """
+        for flags in chunks:
+            counts['flags'] += len(flags)
+            query = {'participantId': {'$in': list(flags.keys())}}
+            pager = ParticpantStatePaginaged(client, page_size=args.page_size, study_key=study_key, query=query)
+            with PrefetchPager(pager, args.prefetch) as pages:
+                yield from self.diff_pages(pages, flags, counts)
+
+    def diff_pages(self, pages, flags: dict, counts: dict):
+        """
+            Yields the flags to update for the participants of each page (participant_id => updates)
+        """
+        for r in pages:
+            print("Fetching page %d with %d items" % (r.page, len(r)))
+            to_update = {}
+            for item in r.items:
                 participant_id = item['participantId']
                 participant_status = item['studyStatus']
                 flags_to_sync = flags.get(participant_id)
@@ -122,50 +148,98 @@ class ParticipantStatesSync(Command):
                 if participant_status == 'temporary':
                     print("Warning '{}' is temporary, not rules will be applied, skip".format(participant_id))
                     continue
-                count_found += 1
-                flags_current = item.get('flags', {})
-                flags_update = {} 
-                for name, value in flags_to_sync.items():
-                    cur_value = flags_current.get(name)
-                    if cur_value is None or cur_value != value:
-                        flags_update[name] = value
+                counts['found'] += 1
+                flags_update = diff_flags(item.get('flags', {}), flags_to_sync)
                 if len(flags_update) > 0:
                     to_update[participant_id] = flags_update
                 else:
-                    count_synced += 1 
-
+                    counts['synced'] += 1
+            counts['update'] += len(to_update)
+            yield to_update
+
+    def apply(self, client, study_key, updates: Iterable[dict], args):
+        """
+            Apply the updates (one call by participant or one rule by group) with the executor
+            Results are handled in order in this thread, with at most 2 * workers calls pending
+        """
+        dry_run = args.dry_run
+        grouped = args.grouped
         count_ok = 0
         count_applied = 0
-        count_errors = 0         
-
-        for participant_id, updates in to_update.items():
-            rules = []
-            print("Participant {}".format(participant_id), end=None)
-            for flag_name, flag_value in updates.items():
-                rules.append(expr_update_flag(flag_name, flag_value))
-            try:
-                rule_output = '?'
-                if args.dry_run:
-                    print("Dry run")
-                else:
-                    r = client.run_custom_study_rules_for_single_participant(study_key, rules, participant_id)
-                    if isinstance(r, dict) and 'participantStateChangePerRule' in r:
-                        changes = r['participantStateChangePerRule'][0]
-                        if changes > 0:
-                            rule_output = 'OK'
-                            count_applied += 1
-                        else:
-                            rule_output = 'Not applied'
-                count_ok += 1
-                print(" ", rule_output)
-            except Exception as e:
-                print("Error ", e)
-                count_errors += 1
-        print("Summary")
-        print("Sync file has {}".format(len(flags)))
-        print("Participants found {}".format(count_found))
-        print("Participants alreay synced {}, need to change for ".format(count_synced), len(to_update), )
-        print("Applying changed Applied={}, OK={}, Errors={}".format(count_applied, count_ok, count_errors))
+        count_errors = 0
+
+        if grouped:
+            items = (group for page_updates in updates for group in group_updates(page_updates, args.group_size))
+            if not dry_run:
+                first = next(items, None)
+                if first is not None:
+                    # The first participant is updated alone to check --pid-expression before the groups are submitted
+                    group_flags, ids = first
+                    self.check_pid_expression(client, study_key, ids[0], group_flags, args.pid_expression)
+                    print("Participant {}  OK".format(ids[0]))
+                    count_applied += 1
+                    count_ok += 1
+                    rest = [(group_flags, ids[1:])] if len(ids) > 1 else []
+                    items = itertools.chain(rest, items)
+        else:
+            items = (item for page_updates in updates for item in page_updates.items())
+
+        def apply_one(item):
+            if dry_run:
+                return None
+            if grouped:
+                group_flags, ids = item
+                return client.run_custom_study_rules(study_key, [expr_grouped_update(ids, group_flags, args.pid_expression)])
+            participant_id, flags_update = item
+            rules = [expr_update_flag(name, value) for name, value in flags_update.items()]
+            return client.run_custom_study_rules_for_single_participant(study_key, rules, participant_id)
+
+        executor = BoundedExecutor(args.workers, args.rate, args.burst)
+        for item, r, error in executor.map(apply_one, items):
+            if grouped:
+                group_flags, ids = item
+                count = len(ids)
+                print("Group of {} participants, updates {}".format(count, group_flags), end=None)
+            else:
+                count = 1
+                print("Participant {}".format(item[0]), end=None)
+            if error is not None:
+                # A failed grouped run counts all the participants of the group as errors
+                print("Error ", error)
+                count_errors += count
+                continue
+            rule_output = '?'
+            if dry_run:
+                print("Dry run")
+            else:
+                changes = count_changes(r)
+                if changes is not None:
+                    if grouped:
+                        count_applied += changes
+                        if changes < count:
+                            # Participants of the group not changed are counted as errors
+                            print("  Warning only {} participants changed".format(changes))
+                            count_errors += count - changes
+                            count = changes
+                        elif changes > count:
+                            print("  Warning {} participants changed, more than the group, check --pid-expression".format(changes))
+                        rule_output = 'OK, {} changed'.format(changes)
+                    elif changes > 0:
+                        rule_output = 'OK'
+                        count_applied += 1
+                    else:
+                        rule_output = 'Not applied'
+            count_ok += count
+            print(" ", rule_output)
+        return count_applied, count_ok, count_errors
+
+    def check_pid_expression(self, client, study_key: str, participant_id: str, group_flags: dict, pid_expression: str):
+        """
+            Apply the grouped rule to a single participant, the expression is not supported if the participant is not changed
+        """
+        r = client.run_custom_study_rules_for_single_participant(study_key, [expr_grouped_update([participant_id], group_flags, pid_expression)], participant_id)
+        if count_changes(r) == 0:
+            raise ValueError("Participant {} not changed by the grouped rule, check the study engine supports --pid-expression '{}'".format(participant_id, pid_expression))
 
 
 class ParticipantSurveysStatistics(Command):
@@ -176,6 +250,7 @@ class ParticipantSurveysStatistics(Command):
         parser = super(ParticipantSurveysStatistics, self).get_parser(prog_name)
         parser.add_argument("--study", help="Study key", required=True)
         parser.add_argument("--page-size", help="page size", type=int, default=100)
+        add_prefetch_argument(parser)
         parser.add_argument("--status", help="Study status of participant", default='active')
         g = parser.add_mutually_exclusive_group(required=False)
         g.add_argument("--stats", help="Stats definition (using string format)")
@@ -203,18 +278,19 @@ class ParticipantSurveysStatistics(Command):
 
         stats = {}
 
-        for r in pager:
-           print("Fetching page %d with %d items" % (r.page, len(r)))
-           for item in r.items:
-                if 'assignedSurveys' in item:
-                    for assigned in item['assignedSurveys']:
-                        surveyKey = assigned['surveyKey']
-                        category = assigned['category']
-                        if surveyKey not in stats:
-                            stats[surveyKey] = {}
-                        if category not in stats[surveyKey]:
-                            stats[surveyKey][category] = 0
-                        stats[surveyKey][category] += 1
+        with PrefetchPager(pager, args.prefetch) as pages:
+            for r in pages:
+               print("Fetching page %d with %d items" % (r.page, len(r)))
+               for item in r.items:
+                    if 'assignedSurveys' in item:
+                        for assigned in item['assignedSurveys']:
+                            surveyKey = assigned['surveyKey']
+                            category = assigned['category']
+                            if surveyKey not in stats:
+                                stats[surveyKey] = {}
+                            if category not in stats[surveyKey]:
+                                stats[surveyKey][category] = 0
+                            stats[surveyKey][category] += 1
         
         if not args.no_print:
             print(stats)
@@ -1,17 +1,21 @@
 import os
+import itertools
+from contextlib import closing
 import json
 import sys
-import time
 from datetime import datetime
 import re
 from cliff.command import Command
 from cliff.lister import Lister
-from . import register
+from . import register, add_executor_arguments
 from pathlib import Path
 from cliff.formatters.table import TableFormatter  
 
 
-from ..utils import read_yaml, read_json, json_to_list, readable_yaml, to_json, read_content, write_json, Output
+from ..utils import read_yaml, read_json, json_to_list, readable_yaml, to_json, read_content, Output
+from ..api.executor import BoundedExecutor
+from ..utils.journal import DoneJournal
+from ..utils.participants import ParticipantSource
 
 from influenzanet.surveys import readable_study, readable_translatable, readable_survey, create_context, survey_to_dictionnary, survey_to_html, read_survey_json
 from influenzanet.surveys.influenzanet.loader import survey_transform_to_12
@@ -488,13 +492,14 @@ class CustomStudyRules(Command):
         parser.add_argument("--study", "--study_key", help="key of the study (survey from api)", required=True)
         parser.add_argument("--output", help="path of file to output results", required=False)
         parser.add_argument("--dry-run", help="Prepare but do not send", required=False, action="store_true")
-        parser.add_argument("--done-file", help="File to write participant ids done with success", required=False)
+        parser.add_argument("--done-file", help="Journal of participant ids done with success (json lines, text file of ids is converted)", required=False)
         parser.add_argument("--exclude-done", help="Read done file and dont redo for those in file", required=False, action="store_true")
+        add_executor_arguments(parser)
         
         g = parser.add_mutually_exclusive_group(required=True)
         g.add_argument("--all", help="All participants", required=False, action="store_true")
         g.add_argument("--pid", help="Participants id (coma separated for several)", required=False)
-        g.add_argument("--pid-file", help="Participants id from this file (exclusive with pid), if json dictionary needs --pid-json-* option", required=False)
+        g.add_argument("--pid-file", help="Participants id from this file (exclusive with pid): text (one id by line), .json (if dictionary needs --pid-json-* option) or .jsonl", required=False)
 
         g2 = parser.add_mutually_exclusive_group(required=False)
         
@@ -511,43 +516,22 @@ class CustomStudyRules(Command):
         dry_run = args.dry_run
         client = self.app.appConfigManager.get_management_api()
         
-        participants = None
-        done_file = None
-        
-        if args.pid is not None:
-            participants = args.pid.split(',')
-            participants = [x.strip() for x in participants]
-                
-        if args.pid_file is not None:
-            if args.pid_file.endswith('.json'):
-                participants = read_json(args.pid_file)
-                if not isinstance(participants, list):
-                    if isinstance(participants, dict):
-                        if not args.pid_json_keys and not args.pid_json_values:
-                            raise Exception("Participant json dictionary must have either --pid-json-keys or --pid-json-values options")
-                        if args.pid_json_keys:
-                            participants = list(participants.keys())
-                        if args.pid_json_values:
-                            participants = list(participants.values())
-                    else:
-                        raise Exception("participant json file must be a dictionary or a list")
-
-            else:            
-                with open(args.pid_file, 'r') as f:
-                    participants = f.readlines()
-                participants = [x.strip() for x in participants]
+        source = None
+        done_journal = None
 
         if not args.all:
-            print(" Participants loaded : %d" % len(participants))
-            done_file = args.done_file
-            exclude_done = args.exclude_done
-            if done_file is not None and exclude_done:
-                with open(done_file, 'r') as f:
-                        exclude = f.readlines()
-                exclude = [x.strip() for x in exclude]
+            if args.done_file is not None:
+                done_journal = DoneJournal(args.done_file)
+                if done_journal.converted is not None:
+                    print(" Done file converted from %s format to journal" % (done_journal.converted))
+            exclude = None
+            if done_journal is not None and args.exclude_done:
+                exclude = done_journal.entries.keys()
                 print(" Participants to be excluded : %d" % len(exclude))
-                participants = list(filter(lambda x: x not in exclude, participants))
-                print(" Participants kept : %d" % len(participants))
+            if args.pid is not None:
+                source = ParticipantSource(ids=args.pid.split(','), exclude=exclude)
+            else:
+                source = ParticipantSource(path=args.pid_file, json_keys=args.pid_json_keys, json_values=args.pid_json_values, exclude=exclude)
 
         rules = read_json(rules_path)
         
@@ -560,37 +544,52 @@ class CustomStudyRules(Command):
                 resp = client.run_custom_study_rules(study_key, rules)
             print(resp)
         else:
-            if len(participants) == 0:
+            # Participants are read while rules are applied
+            participants = iter(source)
+            first = next(participants, None)
+            if first is None:
+                source.show()
                 print("No participant in list, aborting")
                 return
+            participants = itertools.chain([first], participants)
             resp = {}
-            max_batch = 100
-            sleep_batch = 1
             count_errors = 0
             count_ok = 0
             count_run = 0
-            for pid in participants:
-                print("Appplying to %s" % pid, end="")
-                count_run += 1
+
+            def apply(pid):
                 if dry_run:
-                    print("[fake] dry-run call for %s" % pid)
-                    r = {}
-                else:
-                    try:
-                        r = client.run_custom_study_rules_for_single_participant(study_key, rules, pid)
-                        count_ok += 1
-                        print("  OK")
-                        if done_file is not None:
-                            with open(done_file, 'a') as f:
-                                f.write(pid + "\n")
-                    except Exception as e:
-                        count_errors += 1
-                        print(" Error")
-                        r = {'error': str(e)}
-                resp[pid] = r
-                if (count_run % max_batch) == 0:
-                    print("Sleep")
-                    time.sleep(sleep_batch)
+                    return {}
+                return client.run_custom_study_rules_for_single_participant(study_key, rules, pid)
+
+            def abandoned(pid, r, error):
+                # Call completed after an interruption, only recorded as done
+                if not dry_run and error is None and done_journal is not None:
+                    done_journal.append(pid)
+
+            # Results are handled in participants order, as calls were serial
+            executor = BoundedExecutor(args.workers, args.rate, args.burst)
+            try:
+                with closing(executor.map(apply, participants, on_abandoned=abandoned)) as results:
+                    for pid, r, error in results:
+                        print("Appplying to %s" % pid, end="")
+                        count_run += 1
+                        if dry_run:
+                            print("[fake] dry-run call for %s" % pid)
+                        elif error is None:
+                            count_ok += 1
+                            print("  OK")
+                            if done_journal is not None:
+                                done_journal.append(pid)
+                        else:
+                            count_errors += 1
+                            print(" Error")
+                            r = {'error': str(error)}
+                        resp[pid] = r
+            finally:
+                if done_journal is not None:
+                    done_journal.compact()
+            source.show()
                     
         output = Output(args.output)
         output.write(readable_yaml(resp))
@@ -646,7 +645,8 @@ class BulkApplyRules(Command):
         parser.add_argument("--study", "--study_key", help="key of the study (survey from api)", required=True)
         parser.add_argument("--dry-run", help="Prepare but do not send", required=False, action="store_true")
         parser.add_argument("--max-run", help="Maximum count to run", required=False, default=0, type=int)
-        parser.add_argument("--max-batch", help="Maximum count by round", required=False, default=100, type=int)
+        parser.add_argument("--max-batch", help="Deprecated, use --rate and --burst to limit the calls", required=False, default=None, type=int)
+        add_executor_arguments(parser)
         
         return parser
 
@@ -654,7 +654,6 @@ class BulkApplyRules(Command):
         study_key = args.study
         dry_run = args.dry_run
         max_run = args.max_run
-        max_batch = args.max_batch
         client = self.app.get_management_api()
         rules = read_json(args.rules)
         
@@ -664,42 +663,57 @@ class BulkApplyRules(Command):
             raise Exception("Must be an dictionary, key is particpant is and value is exoression")
         
         done_file = args.rules + '.done'
-        if os.path.isfile(done_file):
-            done = read_json(done_file)
+        done = DoneJournal(done_file)
+        if done.converted is not None:
+            print("Done file converted from %s format to journal" % (done.converted))
+        if len(done) > 0:
             print("Resuming from %s with %d already done" % (done_file, len(done)))
-        else:
-            done = {}
 
-        sleep_batch = 1
+        if args.max_batch is not None:
+            print("--max-batch is ignored, use --rate and --burst to limit the calls")
+
         count_errors = 0
         count_ok = 0
         count_run = 0
-            
-        for participant_id, rule in rules.items():
-            if participant_id in done:
-                continue
-            count_run += 1
+
+        todo = [participant_id for participant_id in rules.keys() if participant_id not in done]
+        if max_run > 0 and len(todo) > max_run:
+            todo = todo[:max_run]
+
+        def apply(participant_id):
             if dry_run:
-                print("[fake] dry-run mode, call run_custom_study_rules for all participants")
-            else:
-                try:
-                    print("%s" % (participant_id))
-                    if isinstance(rule, dict):
-                        rule = [rule]
-                    r = client.run_custom_study_rules_for_single_participant(study_key, rule, participant_id)
-                    count_ok += 1
-                except Exception as e:
-                    count_errors += 1
-                    print(" Error", e)
-                    r = {'error': str(e)}
-                done[participant_id] = r
-                write_json(done_file, done)
-            if (count_run % max_batch) == 0:
-                print("Sleeping...")
-                time.sleep(sleep_batch)
-            if max_run > 0 and count_run >= max_run:
-                print("Max run reached, stopping")
-                break
+                return None
+            rule = rules[participant_id]
+            if isinstance(rule, dict):
+                rule = [rule]
+            return client.run_custom_study_rules_for_single_participant(study_key, rule, participant_id)
+
+        def abandoned(participant_id, r, error):
+            # Call completed after an interruption, recorded as done to not apply it again on resume
+            if not dry_run:
+                done.append(participant_id, r if error is None else {'error': str(error)})
+
+        # Results are handled in rules order, as calls were serial
+        executor = BoundedExecutor(args.workers, args.rate, args.burst)
+        try:
+            with closing(executor.map(apply, todo, on_abandoned=abandoned)) as results:
+                for participant_id, r, error in results:
+                    count_run += 1
+                    if dry_run:
+                        print("[fake] dry-run mode, call run_custom_study_rules for all participants")
+                    else:
+                        print("%s" % (participant_id))
+                        if error is None:
+                            count_ok += 1
+                        else:
+                            count_errors += 1
+                            print(" Error", error)
+                            r = {'error': str(error)}
+                        done.append(participant_id, r)
+                    if max_run > 0 and count_run >= max_run:
+                        print("Max run reached, stopping")
+        finally:
+            done.compact()
         print("Count OK: %d  Errors: %d" % (count_ok, count_errors))
 
 
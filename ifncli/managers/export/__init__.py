@@ -1,22 +1,19 @@
 
 import os
-import re
 import json
 from datetime import datetime, timedelta
-from typing import Dict,List,Optional
+from typing import Dict,List,Optional,Union
 from ...utils import read_yaml, write_content, read_json, ISO_TIME_FORMAT, from_iso_time, to_iso_time
+from .stream import CsvStreamWriter, get_response_csv_stream, open_output, rename_header, count_csv_rows
 
 def replace_columns(response_modifier, resp):
-    resp = resp.split('\n')
-    cols = resp[0]
+    pos = resp.find('\n')
+    if pos < 0:
+        return rename_header(response_modifier, resp)
+    return rename_header(response_modifier, resp[:pos]) + resp[pos:]
 
-    for col in response_modifier:
-        cols = re.sub(col, response_modifier[col], cols)
-
-    return '\n'.join([cols] + resp[1:])
-
-def export_data(file_name, data):
-    with open(file_name, 'w', encoding='utf-8') as f:
+def export_data(file_name, data, use_gzip: bool=False):
+    with open_output(file_name, use_gzip) as f:
             f.write(data)
     print("File generated at: {}".format(file_name))
 
@@ -32,6 +29,17 @@ class ExportProfile:
         return v
 
 
+    def get_int(self, data, name, default, min_value:int=0):
+        if name in data:
+            v = data[name]
+            if not isinstance(v, int) or isinstance(v, bool):
+                raise ValueError("Field %s must be an integer" % (name, ))
+            if v < min_value:
+                raise ValueError("Field %s must be >= %d" % (name, min_value))
+        else:
+            v = default
+        return v
+
     def get_string(self, data, name, default, values:Optional[List]):
         if name in data:
             v = data[name]
@@ -96,6 +104,14 @@ class ExportProfile:
 
         self.response_extension = 'json' if self.response_format == 'json' else 'csv'
 
+        # Streaming mode: response body written to file by chunks (csv formats only), optionally gzip compressed
+        self.stream = self.get_bool(profile, 'stream', False)
+        self.gzip = self.get_bool(profile, 'gzip', False)
+        if self.stream and self.response_format == 'json':
+            raise ValueError("stream mode is only available for csv formats (wide, long)")
+        if self.gzip:
+            self.response_extension += '.gz'
+
         default_short_keys = self.get_bool(defaults,'short_keys', False)
         default_key_separator = self.get_string(defaults, 'key_separator', '|', None)
 
@@ -106,6 +122,10 @@ class ExportProfile:
         # Compressor for db export
         self.compressor = profile.get('compressor', '')
 
+        # Storage of raw responses for db export (sqlite table or parquet files)
+        self.raw_store = self.get_string(profile, 'raw_store', 'sqlite', ['sqlite', 'parquet'])
+        self.raw_store_path = self.get_string(profile, 'raw_store_path', None, None)
+
         self.meta_infos = self.get_meta_infos(profile.get('meta', {}))
 
         self.rename_columns = profile.get('rename_columns', None)
@@ -124,6 +144,17 @@ class ExportProfile:
         else:
             self.max_time = self.start_time + timedelta(days=365) 
 
+        # Export periods (number of days exported by each request)
+        self.period_size = self.get_int(profile, 'period_size', 7, min_value=1)
+        self.period_target_rows = self.get_int(profile, 'period_target_rows', 0)
+        self.period_min_days = self.get_int(profile, 'period_min_days', 1, min_value=1)
+        self.period_max_days = self.get_int(profile, 'period_max_days', 90, min_value=1)
+        if self.period_min_days > self.period_max_days:
+            raise ValueError("period_min_days must be lower than period_max_days")
+
+    def export_periods(self):
+        return ExportPeriods(self.period_size, self.period_target_rows, self.period_min_days, self.period_max_days)
+
     def configure_for_survey(self, survey:str):
         """
             Configure the profile to 
@@ -145,12 +176,104 @@ class ExportProfile:
     def __str__(self) -> str:
         return str(self.__dict__)
 
+class ExportPeriods:
+    """
+        Size (in days) of the periods to export, each period is exported with one request (or paginated requests)
+
+        With a target_rows (> 0), the size is adapted to get about target_rows responses by period, using the rate of responses by day
+        observed on the previous periods (or seeded from response statistics). The size stays between min_days and max_days.
+    """
+    def __init__(self, period_size:int=7, target_rows:int=0, min_days:int=1, max_days:int=90):
+        self.days = period_size
+        self.target_rows = target_rows
+        self.min_days = min_days
+        self.max_days = max_days
+        self.rows_per_day: Optional[float] = None
+
+    def is_adaptive(self):
+        return self.target_rows > 0
+
+    def period(self, start_time: datetime):
+        """
+            Returns the period (start, end) starting at start_time and the start of the next one
+        """
+        end_time = start_time + timedelta(days=self.days - 1)
+        end_time = end_time.replace(hour=23, minute=59)
+        return start_time, end_time, start_time + timedelta(days=self.days)
+
+    def seed(self, rows:int, days: float):
+        """
+            Initial rate from a known count of responses on a time range
+        """
+        if not self.is_adaptive() or days <= 0:
+            return
+        self.rows_per_day = rows / days
+        self.resize()
+
+    def seed_from_statistics(self, client, study_key:str, survey_key:str, start_time: datetime, end_time: datetime):
+        """
+            Seed the rate from the response statistics of the study (if available)
+        """
+        if not self.is_adaptive() or end_time <= start_time:
+            return
+        try:
+            r = client.get_response_statistics(study_key, start=start_time.timestamp(), end=end_time.timestamp())
+        except Exception as e:
+            print("Unable to get response statistics to seed period size: %s" % (e, ))
+            return
+        counts = r.get('surveyResponseCounts') if isinstance(r, dict) else None
+        if not isinstance(counts, dict) or survey_key not in counts:
+            return
+        self.seed(int(counts[survey_key]), (end_time - start_time).total_seconds() / 86400)
+        print("Seeded period size to %d days from statistics (%d responses)" % (self.days, counts[survey_key]))
+
+    def update(self, rows:int, days:int):
+        """
+            Update the size from the number of responses exported for a period of `days` days
+        """
+        if not self.is_adaptive():
+            return
+        rate = rows / days
+        if self.rows_per_day is None:
+            self.rows_per_day = rate
+        else:
+            # Smooth the rate to avoid oscillations on irregular periods
+            self.rows_per_day = (self.rows_per_day + rate) / 2
+        self.resize()
+
+    def resize(self):
+        if self.rows_per_day is None:
+            return
+        if self.rows_per_day > 0:
+            days = int(self.target_rows / self.rows_per_day)
+        else:
+            # No response seen yet, grow progressively
+            days = self.days * 2
+        self.days = max(self.min_days, min(self.max_days, days))
+
+def count_rows(resp: str, response_format: str):
+    """
+        Number of responses in an exported text (csv with header or json list)
+        Json is parsed to count, it's only used with adaptive periods
+    """
+    if response_format == 'json':
+        try:
+            data = json.loads(resp)
+        except ValueError:
+            return 0
+        return len(data) if isinstance(data, list) else 0
+    return count_csv_rows(resp)
+
 class ExportCatalog:
     """
         Export Catalog manage list of downloaded response file batches and their period (min,max time)
+
+        The catalog is bound to the fixed period size used to create it, or to 'adaptive' for adaptive periods (each file has its own range)
     """
 
-    def __init__(self, path:str, start_time:datetime, max_time:datetime, period: int):
+    ADAPTIVE = 'adaptive'
+
+    def __init__(self, path:str, start_time:datetime, max_time:datetime, period: Union[int, str]):
         self.file = path + '/catalog.json'
         self.current_end = start_time
         self.min_time = self.midnight(start_time)
@@ -172,7 +295,7 @@ class ExportCatalog:
         
         catalog_period = data['period']
         if catalog_period != self.period:
-            raise Exception("This catalog has been created for another period %d cannot reuse it" % (catalog_period))
+            raise Exception("This catalog has been created for another period %s cannot reuse it" % (catalog_period))
         
         files = data['files']
         for i, row in enumerate(files):
@@ -245,12 +368,17 @@ class Exporter:
         self.profile = profile
         self.client = client
         self.study_key = study_key
+        self.exported_rows = 0 # Number of responses in the last exported file (counted with adaptive periods only)
+        self.count_exported = profile.export_periods().is_adaptive()
 
     def export(self, start_time: Optional[datetime], end_time: Optional[datetime], output_folder:str):
         
         profile = self.profile
         
         survey_key = profile.survey_key
+
+        if profile.stream:
+            return self.export_stream(start_time, end_time, output_folder)
     
         resp = self.client.get_response_csv(
             self.study_key, survey_key,
@@ -263,22 +391,56 @@ class Exporter:
         )
 
         if resp is None:
+            self.exported_rows = 0
             return None
 
+        if self.count_exported:
+            # Only needed to adapt the period size
+            self.exported_rows = count_rows(resp, profile.response_format)
+
         if profile.rename_columns is not None:
             resp = replace_columns(profile.rename_columns, resp)        
 
         os.makedirs(output_folder, exist_ok=True)
 
+        response_file_name = self.response_file_name(start_time, end_time)
+        
+        export_data(os.path.join(output_folder, response_file_name), resp, profile.gzip)
+        return response_file_name
+
+    def response_file_name(self, start_time: Optional[datetime], end_time: Optional[datetime]):
         query_range_text = ""
         if start_time is not None:
             query_range_text += "_" + start_time.strftime("%Y-%m-%d-%H-%M-%S")
         if end_time is not None:
             query_range_text += "_" + end_time.strftime("%Y-%m-%d-%H-%M-%S")
+        return "{}_responses{}.{}".format(self.profile.survey_key, query_range_text, self.profile.response_extension)
 
-        response_file_name =  "{}_responses{}.{}".format(survey_key, query_range_text, profile.response_extension)
-        
-        export_data(os.path.join(output_folder, response_file_name), resp)
+    def fetch_stream(self, start_time: Optional[datetime], end_time: Optional[datetime]):
+        profile = self.profile
+        return get_response_csv_stream(
+            self.client, self.study_key, profile.survey_key,
+            profile.key_separator,
+            profile.response_format,
+            profile.short_keys,
+            profile.meta_infos,
+            start_time.timestamp() if start_time is not None else None,
+            end_time.timestamp() if end_time is not None else None
+        )
+
+    def export_stream(self, start_time: Optional[datetime], end_time: Optional[datetime], output_folder:str):
+        """
+            Export a period in streaming mode, the body is written by chunks and only the header is renamed
+        """
+        chunks = self.fetch_stream(start_time, end_time)
+        if chunks is None:
+            self.exported_rows = 0
+            return None
+
+        os.makedirs(output_folder, exist_ok=True)
+        response_file_name = self.response_file_name(start_time, end_time)
+        writer = CsvStreamWriter(os.path.join(output_folder, response_file_name), self.profile.rename_columns, self.profile.gzip)
+        self.exported_rows = writer.write(chunks)
         return response_file_name
 
     def export_all(self, output:str):
@@ -286,28 +448,33 @@ class Exporter:
             Incrementally export data 
         """
         output_folder = os.path.join(output, self.profile.survey_key)
-        period_size = 7 # Number of days to load (> 1)
+        periods = self.profile.export_periods()
+        period_size = self.profile.period_size # Number of days to load (> 1)
         max_time = self.profile.max_time  
-        catalog = ExportCatalog(output_folder, self.profile.start_time, max_time, period_size)
+        # Adaptive periods vary, the catalog is only bound to the mode
+        catalog_period = ExportCatalog.ADAPTIVE if periods.is_adaptive() else period_size
+        catalog = ExportCatalog(output_folder, self.profile.start_time, max_time, catalog_period)
         os.makedirs(output_folder, exist_ok=True)
         now = datetime.now()
         start_time = catalog.get_start_time(now)
+        periods.seed_from_statistics(self.client, self.study_key, self.profile.survey_key, start_time, min(max_time, now))
         # Max download time, if not provided only load one years (prevent infinite loop)
         loaded = 0
-        print("Loading %s data from %s to %s by %d days" % (self.profile.survey_key, start_time, max_time, period_size ))
+        print("Loading %s data from %s to %s by %d days" % (self.profile.survey_key, start_time, max_time, periods.days ))
         while start_time < max_time:
             if start_time > now:
                 # Cannot load data in the future
                 break
-            end_time = start_time + timedelta(days=period_size - 1)
-            end_time = end_time.replace(hour=23, minute=59)
+            days = periods.days
+            start_time, end_time, next_start = periods.period(start_time)
             print("> %s - %s" % (start_time, end_time))
             r = self.export(start_time, end_time, output_folder)
             if r is not None:
                 loaded += 1
                 catalog.append(start_time, end_time, r, updated=now)
                 catalog.save()
-            start_time = start_time + timedelta(days=period_size)
+            periods.update(self.exported_rows, days)
+            start_time = next_start
         print("%d file(s) loaded" % (loaded))
         self.export_info(output_folder)
             
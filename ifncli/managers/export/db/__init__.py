@@ -1,3 +1,3 @@
-from .exporter import DbExporter, ExportSqlite
+from .exporter import DbExporter, ExportSqlite, MultiSurveyExporter
 from .database import ExportDatabase
 from .setup import ExportSetupGenerator
\ No newline at end of file
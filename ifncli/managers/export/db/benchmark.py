@@ -0,0 +1,41 @@
+##
+# Micro benchmark of the page encoding of response:db:export on a page fixture
+# Run with: python -m ifncli.managers.export.db.benchmark [repeat] [compressor]
+import copy
+import json
+import sys
+import time
+
+from .compress import Compressor
+from .encoder import PageEncoder, json_encoder_name
+from .fixtures import load_page, encode_items_loop
+
+def measure(func, pages: list[list[dict]]):
+    pages = copy.deepcopy(pages)
+    start = time.perf_counter()
+    result = [func(page) for page in pages]
+    return time.perf_counter() - start, result
+
+def decoded(compressor: Compressor, pages: list):
+    return [[json.loads(compressor.decompress(row[3])) for row in rows] for rows in pages]
+
+def bench_encode(repeat: int=500, compressor_name: str='zlib-1'):
+    page = load_page()
+    pages = [page] * repeat
+    compressor = Compressor(compressor_name)
+    print("Encode {} pages of {} responses with {} (serializer {})".format(repeat, len(page), compressor_name, json_encoder_name))
+    loop_time, expected = measure(lambda p: encode_items_loop(p, compressor), pages)
+    print(" - loop (previous) {:.2f}s".format(loop_time))
+    encoder = PageEncoder()
+    page_time, result = measure(lambda p: encoder.encode(p, compressor), pages)
+    print(" - page encoder    {:.2f}s (x{:.1f})".format(page_time, loop_time / page_time))
+    size = sum([len(row[3]) for rows in expected for row in rows])
+    page_size = sum([len(row[3]) for rows in result for row in rows])
+    print(" - compressed size {} / {} bytes".format(page_size, size))
+    assert decoded(compressor, result) == decoded(compressor, expected)
+
+if __name__ == '__main__':
+    args = sys.argv[1:3]
+    repeat = int(args[0]) if len(args) > 0 else 500
+    name = args[1] if len(args) > 1 else 'zlib-1'
+    bench_encode(repeat, name)
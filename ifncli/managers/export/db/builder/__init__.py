@@ -1,7 +1,16 @@
 from .schema import SurveySchema
 from .version_selector import VersionSelector, VersionSelectorParser
 from .builder import DatabaseBuilder
+from .scan import DuckDbScanBuilder
 from .base import Writer, PrintWriter, SourceDataLoader
-from .profile import BuilderProfile
+from .profile import BuilderProfile, ENGINE_DUCKDB
 from .plan import BuilderPlan
-from . import fake
\ No newline at end of file
+from . import fake
+
+def create_builder(profile: BuilderProfile):
+    """
+        Create the builder for the engine selected in the profile
+    """
+    if profile.engine == ENGINE_DUCKDB:
+        return DuckDbScanBuilder(profile)
+    return DatabaseBuilder(profile)
@@ -1,4 +1,6 @@
 import pandas
+from typing import Optional
+from .checkpoint import BuildCheckpoint, BuildWatermark
 
 class SourceDataLoader:
     """
@@ -13,6 +15,36 @@ class SourceDataLoader:
     
     def load(self, batch_size: int, offset:int)->tuple[int, dict]:
         raise NotImplementedError()
+
+    def get_cursor(self)->Optional[dict]:
+        """
+            Key of the last loaded row, if the loader can resume from it
+        """
+        return None
+
+    def set_cursor(self, cursor: Optional[dict], offset: int):
+        """
+            Resume loading after the row with the given key, located before offset
+        """
+        pass
+
+    def watermark(self, table_name: str)->Optional[BuildWatermark]:
+        """
+            High-water mark of the data to load, None if not available
+        """
+        return None
+
+    def start_after(self, mark: BuildWatermark):
+        """
+            Only load data added to the source since the given high-water mark (incremental build)
+        """
+        raise NotImplementedError("Incremental build is not supported by this loader")
+
+    def close(self):
+        """
+            Release resources once all data are loaded
+        """
+        pass
     
 
 class Writer:
@@ -34,6 +66,36 @@ class Writer:
         """
         pass
 
+    def begin_batch(self):
+        """
+            Start writing the data frames of a batch
+        """
+        pass
+
+    def commit_batch(self, checkpoint: BuildCheckpoint):
+        """
+            End of the batch, data frames of the batch and the checkpoint must be saved together
+        """
+        pass
+
+    def read_checkpoint(self, table_name: str)->Optional[BuildCheckpoint]:
+        """
+            Last checkpoint saved for a table, None if not available
+        """
+        return None
+
+    def save_watermark(self, mark: BuildWatermark):
+        """
+            Save the high-water mark of a completed build (called in the last batch, before commit)
+        """
+        pass
+
+    def read_watermark(self, table_name: str)->Optional[BuildWatermark]:
+        """
+            High-water mark of the last completed build of a table, None if not available
+        """
+        return None
+
 class PrintWriter(Writer):
 
     def append(self, df: pandas.DataFrame):
@@ -0,0 +1,108 @@
+##
+# Micro benchmarks of builder processors on synthetic data
+# Run with: python -m ifncli.managers.export.db.builder.benchmark [boolean|unjson] [rows] [columns]
+import sys
+import time
+import numpy
+import pandas
+
+import json
+from .processor.processors import ToBooleanRule, UnJsonRule, extract_items_keys
+
+def map_boolean_rule(rows: pandas.DataFrame, columns: list[str]):
+    """
+        Previous implementation of ToBooleanRule (python function called for each cell), kept as reference
+    """
+    booleans = {'0': False, '1':True, 'true': True, 'false': False}
+    to_bool = lambda x: str(x).lower() if not (pandas.isna(x) or x == '') else None
+    for column in columns:
+        if rows[column].dtype != 'boolean':
+            with pandas.option_context("future.no_silent_downcasting", True):
+                rows[column] = rows[column].map(to_bool).replace(booleans).astype('boolean')
+    return rows
+
+def boolean_frame(rows: int, columns: int, seed:int=0):
+    """
+        Synthetic frame with values as found in raw data (booleans, 'TRUE'/'FALSE' strings, '0'/'1', missing values)
+    """
+    rng = numpy.random.default_rng(seed)
+    values = numpy.array([True, False, 'TRUE', 'FALSE', '1', '0', None, ''], dtype=object)
+    data = {}
+    for i in range(columns):
+        data["Q{}".format(i)] = values[rng.integers(0, len(values), rows)]
+    return pandas.DataFrame(data)
+
+def measure(func, df: pandas.DataFrame):
+    df = df.copy()
+    start = time.perf_counter()
+    r = func(df)
+    return time.perf_counter() - start, r
+
+def bench_boolean(rows: int=100000, columns: int=300):
+    df = boolean_frame(rows, columns)
+    names = df.columns.to_list()
+    rule = ToBooleanRule(names)
+    print("ToBooleanRule on {} rows x {} columns".format(rows, columns))
+    map_time, expected = measure(lambda d: map_boolean_rule(d, names), df)
+    print(" - map (previous)  {:.2f}s".format(map_time))
+    vec_time, result = measure(rule.apply, df)
+    print(" - vectorized      {:.2f}s (x{:.1f})".format(vec_time, map_time / vec_time))
+    pandas.testing.assert_frame_equal(result, expected)
+
+def apply_unjson_rule(rows: pandas.DataFrame, columns: list[str]):
+    """
+        Previous implementation of UnJsonRule (json parsed and keys joined for each cell), kept as reference
+        Objects without items give None, like the current rule
+    """
+    def update_row(value):
+        if pandas.isna(value):
+            return value
+        if value == "":
+            return value
+        if isinstance(value, dict):
+            v = value
+        else: 
+            v = json.loads(value)
+        v = extract_items_keys(v)
+        if len(v) > 0:
+            return ','.join(v)
+        return None
+    for column in columns:
+        rows[column] = rows[column].apply(update_row)
+    return rows
+
+def multiple_choice_frame(rows: int, columns: int, seed:int=0):
+    """
+        Synthetic frame with multiple choice responses as json strings or objects
+    """
+    rng = numpy.random.default_rng(seed)
+    values = [None, '']
+    for n in range(1, 4):
+        obj = {'key': 'mc', 'items': [{'key': str(k)} for k in range(n)]}
+        values.extend([obj, json.dumps(obj)])
+    values = numpy.array(values, dtype=object)
+    data = {}
+    for i in range(columns):
+        data["Q{}".format(i)] = values[rng.integers(0, len(values), rows)]
+    return pandas.DataFrame(data)
+
+def bench_unjson(rows: int=100000, columns: int=20):
+    df = multiple_choice_frame(rows, columns)
+    names = df.columns.to_list()
+    rule = UnJsonRule(names)
+    print("UnJsonRule on {} rows x {} columns".format(rows, columns))
+    apply_time, expected = measure(lambda d: apply_unjson_rule(d, names), df)
+    print(" - apply (previous) {:.2f}s".format(apply_time))
+    batch_time, result = measure(rule.apply, df)
+    print(" - batched          {:.2f}s (x{:.1f})".format(batch_time, apply_time / batch_time))
+    pandas.testing.assert_frame_equal(result, expected)
+
+BENCHMARKS = {
+    'boolean': bench_boolean,
+    'unjson': bench_unjson,
+}
+
+if __name__ == '__main__':
+    name = sys.argv[1] if len(sys.argv) > 1 else 'boolean'
+    args = [int(x) for x in sys.argv[2:4]]
+    BENCHMARKS[name](*args)
@@ -6,12 +6,19 @@ import duckdb
 import os
 from typing import Optional
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from .processor import BasePreprocessor
-from .profile import BuilderProfile, Debugger
-from .version_selector import VersionSelectorRule
+from .profile import BuilderProfile, Debugger, PAGINATION_KEYSET
+from .version_selector import VersionSelectorRule, parse_version
 from ..database import ExportDatabase, ExportMeta
 from .base import SourceDataLoader, Writer
 from ..compress import Compressor
+from ..parquet import ParquetStore, RAW_STORE_PARQUET, PAYLOAD_JSON, resolve_store_path, source_query, week_condition
+from .processor.processors import json_loads
+from .decoder import decode_rows, split_rows, register_compressor, WorkerStats
+from .....utils.pipeline import Pipeline, PipelineStopped, END
+from .timing import BuildTimer
+from .checkpoint import BuildCheckpoint, BuildWatermark, CHECKPOINT_TABLE, WATERMARK_TABLE
 
 TYPE_COMPAT = {
     'int':['int','int32','int8','int64', 'float64','int16'],
@@ -89,12 +96,15 @@ class DuckDbWriter(Writer):
             self.execute("CREATE SEQUENCE survey_user_id_seq START 1")
             self.execute("CREATE TABLE {user_table} (id INTEGER DEFAULT nextval('survey_user_id_seq'), global_id TEXT)".format(user_table=self.user_table))
             self.execute("CREATE UNIQUE INDEX survey_user_global_id ON {user_table} (global_id)".format(user_table=self.user_table))     
+        if not self.has_table(CHECKPOINT_TABLE):
+            self.execute('CREATE TABLE {} ("table" TEXT PRIMARY KEY, "profile_hash" TEXT, "offset" BIGINT, "cursor" TEXT, "batches" INTEGER, "completed" BOOLEAN, "updated" TIMESTAMP)'.format(CHECKPOINT_TABLE))
+        if not self.has_table(WATERMARK_TABLE):
+            self.execute('CREATE TABLE {} ("table" TEXT PRIMARY KEY, "submitted" BIGINT, "import_time" BIGINT, "updated" TIMESTAMP)'.format(WATERMARK_TABLE))
         return self.conn
     
     def has_table(self,  table_name):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM information_schema.tables WHERE table_name = '{}'".format(table_name))
-        r = cursor.fetchone()
+        # Use the writer connection (a cursor is another connection, it would not see tables created in the current batch transaction)
+        r = self.conn.execute("SELECT * FROM information_schema.tables WHERE table_name = '{}'".format(table_name)).fetchone()
         if r is None:
             return False
         return True
@@ -124,14 +134,8 @@ class DuckDbWriter(Writer):
         return schema
     
     def update_schema(self, df: pd.DataFrame):
-        schema = self.table_schema()
-        to_update = []
-        columns = []
+        column_types = {}
         for column in df.columns:
-            columns.append(column)
-            # Check if column in known
-            if column in schema:
-                continue
             dtype = df[column].dtype
             if dtype.name == "object":
                 col_type = "text"
@@ -140,6 +144,21 @@ class DuckDbWriter(Writer):
                     col_type = DuckTypePandaAlias[dtype.name]
                 else:
                     col_type = dtype.name
+            column_types[column] = col_type
+        return self.add_columns(column_types)
+
+    def add_columns(self, column_types: dict[str, str]):
+        """
+            Add columns not already in the table, column_types is a dictionary with column name and sql type
+        """
+        schema = self.table_schema()
+        to_update = []
+        columns = []
+        for column, col_type in column_types.items():
+            columns.append(column)
+            # Check if column in known
+            if column in schema:
+                continue
             to_update.append('ADD COLUMN "{}" {}'.format(column, col_type))
             
         if len(to_update) > 0:
@@ -148,6 +167,34 @@ class DuckDbWriter(Writer):
                 self.conn.execute('ALTER TABLE "{}" {}'.format(self.table_name, statement))
         return columns
 
+    def begin_batch(self):
+        self.connect().execute("BEGIN TRANSACTION")
+
+    def commit_batch(self, checkpoint: BuildCheckpoint):
+        """
+            Save the checkpoint and commit the batch, data and progress are saved in the same transaction
+        """
+        self.conn.execute('INSERT OR REPLACE INTO {} ("table", "profile_hash", "offset", "cursor", "batches", "completed", "updated") VALUES (?, ?, ?, ?, ?, ?, now())'.format(CHECKPOINT_TABLE), checkpoint.to_row())
+        self.conn.execute("COMMIT")
+
+    def read_checkpoint(self, table_name: str):
+        self.connect()
+        query = 'SELECT "table", "profile_hash", "offset", "cursor", "batches", "completed" FROM {} WHERE "table"=?'.format(CHECKPOINT_TABLE)
+        row = self.conn.execute(query, (table_name,)).fetchone()
+        if row is None:
+            return None
+        return BuildCheckpoint.from_row(row)
+
+    def save_watermark(self, mark: BuildWatermark):
+        self.conn.execute('INSERT OR REPLACE INTO {} ("table", "submitted", "import_time", "updated") VALUES (?, ?, ?, now())'.format(WATERMARK_TABLE), mark.to_row())
+
+    def read_watermark(self, table_name: str):
+        self.connect()
+        row = self.conn.execute('SELECT "table", "submitted", "import_time" FROM {} WHERE "table"=?'.format(WATERMARK_TABLE), (table_name,)).fetchone()
+        if row is None:
+            return None
+        return BuildWatermark.from_row(row)
+
     def register_survey(self, survey_key: str, table_name: str):
         survey_table_name = "survey_response_table"
         if not self.has_table(survey_table_name):
@@ -163,6 +210,23 @@ class DuckDbWriter(Writer):
         self.conn.execute("CREATE INDEX {table}_timestamp_idx ON {table} (timestamp)".format(table=self.table_name))
         self.conn.execute("CREATE INDEX {table}_globalid_idx ON {table} (global_id)".format(table=self.table_name))
     
+    def insert_query(self, columns: list[str], select: str):
+        col_query = '"' + '","'.join(columns) + '"' 
+        
+        insert_or = ''
+        if self.insert_mode == 'replace':
+            insert_or = 'OR REPLACE'
+        if self.insert_mode == 'ignore':
+            insert_or = 'OR IGNORE'
+        
+        query = "INSERT {insert_or} INTO {table} ({columns}) {select}".format(table=self.table_name, columns=col_query, insert_or=insert_or, select=select)
+        
+        if self.debug('query'):
+            print(">>> # QUERY")
+            print(query)
+            print("---------- # QUERY")
+        return query
+
     def append(self, df: pd.DataFrame):
         cnx = self.connect()
         if len(df) == 0:
@@ -177,20 +241,7 @@ class DuckDbWriter(Writer):
         else:
             columns = self.update_schema(df)
             # Append les données
-            col_query = '"' + '","'.join(columns) + '"' 
-            
-            insert_or = ''
-            if self.insert_mode == 'replace':
-                insert_or = 'OR REPLACE'
-            if self.insert_mode == 'ignore':
-                insert_or = 'OR IGNORE'
-            
-            query = "INSERT {insert_or} INTO {table} ({columns}) SELECT * FROM temp_df".format(table=self.table_name, columns=col_query, insert_or=insert_or)
-            
-            if self.debug('query'):
-                print(">>> # QUERY")
-                print(query)
-                print("---------- # QUERY")
+            query = self.insert_query(columns, "SELECT * FROM temp_df")
             try:
                 cnx.execute(query)
             except Exception as e:
@@ -201,6 +252,31 @@ class DuckDbWriter(Writer):
                 raise e
         self.update_index("temp_df")
         cnx.unregister("temp_df")
+
+    def append_select(self, select: str, column_types: dict[str, str], params=None):
+        """
+            Append rows produced by a select query run in the target database, without loading data in python
+            Select query must produce columns in the order of column_types (column name and sql type)
+            Rows are selected in a temporary table, so only their global_id are added to the user index
+        """
+        cnx = self.connect()
+        cnx.execute("CREATE OR REPLACE TEMP TABLE temp_select AS {}".format(select), params)
+        if self.first_batch:
+            print("Registering new table {}".format(self.table_name))
+            cnx.execute("CREATE TABLE {} AS SELECT * FROM temp_select".format(self.table_name))
+            self.create_table_index()
+            self.first_batch = False
+        else:
+            columns = self.add_columns(column_types)
+            query = self.insert_query(columns, "SELECT * FROM temp_select")
+            try:
+                cnx.execute(query)
+            except Exception as e:
+                print("Error during inserting query", e)
+                print(query)
+                raise e
+        self.update_index("temp_select")
+        cnx.execute("DROP TABLE temp_select")
         
     def close(self):
         if self.conn is not None:
@@ -245,7 +321,7 @@ class SourceDbQueryBuilder:
         
         query = "select distinct version from {}".format(self.table_name)
         if len(w) > 0:
-            query += " WHERE ".join(w)
+            query += " WHERE " + " AND ".join(w)
         else:
             data = None
         cur = db.cursor()
@@ -253,34 +329,56 @@ class SourceDbQueryBuilder:
         versions = []
         for row in res.fetchall():
             v = row[0]
-            if selector.is_version(v):
+            if selector.is_version(parse_version(v)):
                 versions.append(v)
         cur.close()
         return versions
             
-    def build_query(self, select):
+    def build_conditions(self):
         w = []
         if self.from_time is not None:
             w.append('submitted >= {}'.format(self.from_time))
         if self.to_time is not None:
             w.append('submitted <= {}'.format(self.to_time))
-        
-        query = "SELECT {select} FROM {table_name} ".format(select=select, table_name=self.table_name)
+        if self.versions is not None:
+            values = ["'{}'".format(v.replace("'", "''")) for v in self.versions]
+            w.append("version IN ({})".format(', '.join(values)) if len(values) > 0 else 'false')
+        return w
+
+    def build_query(self, select, conditions: Optional[list[str]]=None):
+        w = self.build_conditions()
+        if conditions is not None:
+            w.extend(conditions)
+        query = "SELECT {select} FROM {table_name}".format(select=select, table_name=self.table_name)
         if len(w) > 0:
-            query += " WHERE ".join(w)
+            query += " WHERE " + " AND ".join(w)
         return query
 
-    def query_data(self, batch_size:int, offset:int):
-        """
-            Return the query to fetch the data in raw tables
-            Must return columns : data, version, id in this order
-        """
-        query = self.build_query('data, version, id')
-        query += "order by version, submitted LIMIT {batch_size} OFFSET {offset}".format(batch_size=batch_size, offset=offset)
+    def show(self, query):
         if self.show_query:
             print("  # QUERY Source query")
             print(query)
             print("---- QUERY")
+
+    def query_data(self, batch_size:int, offset:int):
+        """
+            Return the query to fetch the data in raw tables
+            Must return columns : data, version, id, submitted in this order
+        """
+        query = self.build_query('data, version, id, submitted')
+        query += " ORDER BY version, submitted, id LIMIT {batch_size} OFFSET {offset}".format(batch_size=batch_size, offset=offset)
+        self.show(query)
+        return query
+
+    def query_data_after(self, batch_size:int):
+        """
+            Return the query to fetch the data following a (version, submitted, id) cursor (keyset pagination)
+            Cursor values are expected as named parameters :version, :submitted, :id
+            Must return columns : data, version, id, submitted in this order
+        """
+        query = self.build_query('data, version, id, submitted', ['(version, submitted, id) > (:version, :submitted, :id)'])
+        query += " ORDER BY version, submitted, id LIMIT {batch_size}".format(batch_size=batch_size)
+        self.show(query)
         return query
     
     def query_count(self):
@@ -289,59 +387,257 @@ class SourceDbQueryBuilder:
 class SourceDbDataLoader(SourceDataLoader):
     """
         Load raw data from the Raw data database
+
+        With keyset pagination, the loader keeps the key (version, submitted, id) of the last fetched row and the next batch
+        is fetched from this key instead of skipping `offset` rows. Offset is still used for the first batch (resume) and
+        if the requested offset doesnt follow the last loaded batch.
     """
 
     def __init__(self, profile: BuilderProfile, meta:ExportMeta):
         
         query = SourceDbQueryBuilder(profile.source_table, profile.debugger.has('query_source'))
         
-        if profile.versions is not None:
-           query.resolve_versions(profile.source_db, profile.versions)
-
         if profile.from_time is not None:
             query.from_time = profile.from_time
 
         if profile.to_time is not None:
             query.to_time = profile.to_time   
 
+        # Versions selected in the time range, only their rows are loaded
+        if profile.versions is not None:
+            query.versions = query.resolve_versions(profile.source_db, profile.versions)
+
         self.compressor = Compressor(meta.compressor)
+        # Compression dictionaries of the survey, also sent to the worker processes
+        self.dictionaries = profile.source_db.get_compress_dicts(profile.survey) if self.compressor.dictionaries is not None else []
+        register_compressor(meta.compressor, self.dictionaries)
 
         self.query = query
+        self.survey = profile.survey
         self.source_db = profile.source_db
         self.debug_json = profile.debugger.has('json')
+        self.pagination = profile.pagination
+        self.cursor: Optional[dict] = None # Key of the last fetched row
+        self.cursor_offset: Optional[int] = None # Offset of the row following the cursor
+        self.workers = profile.workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.worker_stats = WorkerStats()
         
     def total_rows(self):
         count = self.source_db.fetch_one(self.query.query_count())
         return count[0]
 
+    def execute_data_query(self, cur, batch_size: int, offset:int):
+        if self.pagination == PAGINATION_KEYSET and self.cursor is not None and self.cursor_offset == offset:
+            return cur.execute(self.query.query_data_after(batch_size=batch_size), self.cursor)
+        return cur.execute(self.query.query_data(batch_size=batch_size, offset=offset))
+
+    def decode(self, rows: list[tuple]):
+        """
+            Decode raw rows, using worker processes if several workers are configured
+            Results are returned in the order of the rows
+        """
+        if self.workers <= 1 or len(rows) < self.workers:
+            return [decode_rows(self.compressor.name, rows)]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=register_compressor, initargs=(self.compressor.name, self.dictionaries))
+        chunks = split_rows(rows, self.workers)
+        return list(self.pool.map(decode_rows, [self.compressor.name] * len(chunks), chunks))
+
     def load(self, batch_size: int, offset:int):
         records = OrderedDict()
 
         cur = self.source_db.cursor()
-        res = cur.execute(self.query.query_data(batch_size=batch_size, offset=offset))
+        res = self.execute_data_query(cur, batch_size, offset)
+        rows = res.fetchall()
+        cur.close()
 
-        count_fetched = 0
+        count_fetched = len(rows)
 
-        decompress = self.compressor.decompress
-        for row in res:
-            version = row[1]
-            try:
-                data = decompress(row[0])
-                data = json.loads(data)
+        for (pid, elapsed, decoded, errors) in self.decode(rows):
+            self.worker_stats.add(pid, len(decoded) + len(errors), elapsed)
+            for (row_id, error) in errors:
+                print("Error parsing data for row {} : {}".format(row_id, error))
+            for version, data in decoded:
                 if self.debug_json:
-                    print("JSON at row {} (offset {})".format(count_fetched, offset + count_fetched))
+                    print("JSON at offset {}".format(offset))
                     print(data)
                     print("--- JSON")
                 if version not in records:
                     records[version] = []
                 records[version].append(data)
+
+        if count_fetched > 0:
+            last_row = rows[-1]
+            self.cursor = {'version': last_row[1], 'submitted': last_row[3], 'id': last_row[2]}
+            self.cursor_offset = offset + count_fetched
+        return (count_fetched, records)
+
+    def get_cursor(self):
+        if self.cursor is None:
+            return None
+        return dict(self.cursor)
+
+    def set_cursor(self, cursor: Optional[dict], offset: int):
+        self.cursor = cursor
+        self.cursor_offset = offset if cursor is not None else None
+
+    def watermark(self, table_name: str):
+        submitted = self.source_db.fetch_one(self.query.build_query('max(submitted)'))[0]
+        return BuildWatermark(table_name, submitted, self.source_db.get_last_import_time(self.survey))
+
+    def start_after(self, mark: BuildWatermark):
+        """
+            Restrict the query to rows submitted from the high-water mark
+            Windows exported since the mark (in import_log) can start before it, rows are then loaded from the earliest window start
+        """
+        from_time = mark.submitted
+        for (import_time, start, end) in self.source_db.get_import_log(self.survey, mark.import_time or 0):
+            if from_time is None:
+                break
+            if start == 0:
+                # Window without start, everything may have been exported again
+                from_time = None
+            else:
+                from_time = min(from_time, start)
+        if from_time is not None and (self.query.from_time is None or from_time > self.query.from_time):
+            self.query.from_time = from_time
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.workers > 1:
+            print("Decoding workers:")
+            self.worker_stats.show()
+
+class ParquetQueryBuilder(SourceDbQueryBuilder):
+    """
+        Build Query from the parquet raw store of a survey
+        Time bounds and versions are applied on the parquet scan (partitions and row groups statistics), before duplicates are removed
+    """
+    def __init__(self, store: ParquetStore, survey: str, show_query: bool):
+        super().__init__(store.scan(survey), show_query)
+        self.store = store
+        self.survey = survey
+
+    def build_query(self, select, conditions: Optional[list[str]]=None):
+        scan_conditions = self.build_conditions()
+        if self.from_time is not None:
+            scan_conditions.append(week_condition('>=', self.from_time))
+        if self.to_time is not None:
+            scan_conditions.append(week_condition('<=', self.to_time))
+        query = "SELECT {select} FROM {source}".format(select=select, source=source_query(self.store, self.survey, scan_conditions))
+        if conditions is not None and len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        return query
+
+    def query_stream(self, after_cursor: bool, offset: int):
+        """
+            Return the query to fetch all the rows from a (version, submitted, id) cursor ($version, $submitted, $id parameters) or from an offset
+            Must return columns : id, submitted, version, data (json text) in this order
+        """
+        conditions = ['(version, submitted, id) > ($version, $submitted, $id)'] if after_cursor else None
+        query = self.build_query('id, submitted, version, {} AS data'.format(PAYLOAD_JSON), conditions)
+        query += " ORDER BY version, submitted, id"
+        if not after_cursor and offset > 0:
+            query += " OFFSET {}".format(offset)
+        self.show(query)
+        return query
+
+class ParquetDataLoader(SourceDbDataLoader):
+    """
+        Load raw data from the parquet raw store of the survey
+
+        Rows are streamed by a single DuckDB query ordered by (version, submitted, id), each batch is fetched from the running query.
+        The query is restarted (from the cursor or offset) only if the requested offset doesnt follow the last batch.
+        The json text of each response is built by DuckDB from the payload maps (converting maps to python objects is much slower).
+    """
+    def __init__(self, profile: BuilderProfile, store: ParquetStore):
+        query = ParquetQueryBuilder(store, profile.survey, profile.debugger.has('query_source'))
+        query.from_time = profile.from_time
+        query.to_time = profile.to_time
+        # Checked once (walk of the survey files), the store is not written during the build
+        self.has_data = store.has_data(profile.survey)
+        if profile.versions is not None and self.has_data:
+            versions = store.conn.execute("SELECT DISTINCT version FROM {}".format(store.scan(profile.survey))).fetchall()
+            query.versions = [row[0] for row in versions if profile.versions.is_version(parse_version(row[0]))]
+        self.query = query
+        self.store = store
+        self.survey = profile.survey
+        self.source_db = profile.source_db
+        self.debug_json = profile.debugger.has('json')
+        self.cursor: Optional[dict] = None
+        self.cursor_offset: Optional[int] = None
+        self.stream = None # Running query
+        self.stream_offset: Optional[int] = None # Offset of the next row of the running query
+        self.workers = 1
+        self.pool = None
+
+    def total_rows(self):
+        if not self.has_data:
+            return 0
+        return self.store.conn.execute(self.query.query_count()).fetchone()[0]
+
+    def open_stream(self, offset: int):
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self.store.conn.cursor()
+        if self.cursor is not None and self.cursor_offset == offset:
+            self.stream.execute(self.query.query_stream(True, offset), self.cursor)
+        else:
+            self.stream.execute(self.query.query_stream(False, offset))
+        self.stream_offset = offset
+
+    def load(self, batch_size: int, offset:int):
+        records = OrderedDict()
+        if not self.has_data:
+            return (0, records)
+        if self.stream is None or self.stream_offset != offset:
+            self.open_stream(offset)
+        rows = self.stream.fetchmany(batch_size)
+        count_fetched = len(rows)
+        self.stream_offset = offset + count_fetched
+        for row in rows:
+            try:
+                data = json_loads(row[3])
             except Exception as e:
-                print("Error parsing data for row {} : {} {}".format(row[2], e.__class__, e ))
-            
-            count_fetched += 1
-        cur.close()
+                print("Error parsing data for row {} : {} {}".format(row[0], e.__class__, e))
+                continue
+            if self.debug_json:
+                print("JSON at offset {}".format(offset))
+                print(data)
+                print("--- JSON")
+            version = row[2]
+            if version not in records:
+                records[version] = []
+            records[version].append(data)
+        if count_fetched > 0:
+            last_row = rows[-1]
+            self.cursor = {'version': last_row[2], 'submitted': last_row[1], 'id': last_row[0]}
+            self.cursor_offset = offset + count_fetched
         return (count_fetched, records)
 
+    def watermark(self, table_name: str):
+        submitted = None
+        if self.has_data:
+            submitted = self.store.conn.execute(self.query.build_query('max(submitted)')).fetchone()[0]
+        return BuildWatermark(table_name, submitted, self.source_db.get_last_import_time(self.survey))
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+def create_loader(profile: BuilderProfile, meta: ExportMeta)->SourceDataLoader:
+    """
+        Create the loader for the raw store of the survey (export db table or parquet files)
+    """
+    store = profile.source_db.get_raw_store(profile.survey)
+    if store is not None and store[0] == RAW_STORE_PARQUET:
+        return ParquetDataLoader(profile, ParquetStore(resolve_store_path(profile.source_db.db_path, store[1])))
+    return SourceDbDataLoader(profile, meta)
+
 class DatabaseBuilder:
     """
         DatabaseBuilder transform the raw data in a source database (usually SQLite) to another format, like Duckdb database
@@ -350,6 +646,7 @@ class DatabaseBuilder:
     """
     def __init__(self, profile: BuilderProfile):
         self.profile = profile
+        self.timer = BuildTimer(False)
 
     def debug(self, name:str):
         return self.profile.debugger.has(name)
@@ -360,70 +657,209 @@ class DatabaseBuilder:
             if self.profile.dry_run:
                 writer = Writer()
             else:
-                writer = DuckDbWriter(self.profile.target_db, self.profile.target_table, debugger=self.profile.debugger)
+                writer = DuckDbWriter(self.profile.target_db, self.profile.target_table, debugger=self.profile.debugger, insert_mode=self.profile.insert_mode)
 
         meta = self.profile.source_db.get_meta()
 
         if loader is None:
-            loader = SourceDbDataLoader(self.profile, meta)
+            loader = create_loader(self.profile, meta)
 
-        self.import_table(loader, writer)
+        return self.import_table(loader, writer)
 
     def import_table(self, loader: SourceDataLoader, writer: Writer):
         batch_size = self.profile.batch_size
-        offset = self.profile.starting_offset
         
-        total_rows = loader.total_rows()
-
-        print("Fetching data of {} rows by {}".format(total_rows, batch_size))
-
         counts = Counter()
+        self.timer = BuildTimer(self.debug('timing'))
 
-        debug_version = self.debug('version')
-        debug_processors = self.debug('processors')
-        
         writer.open()
         writer.register_survey(self.profile.survey, self.profile.target_table)
 
+        checkpoint = self.start_checkpoint(loader, writer)
+        if checkpoint.completed:
+            print("Build of {} is already completed, nothing to resume".format(self.profile.target_table))
+            writer.close()
+            loader.close()
+            return counts
+
+        mark = None
+        if self.profile.incremental:
+            # Taken before loading, rows exported during the build will be loaded by the next one
+            mark = loader.watermark(self.profile.target_table)
+            self.start_incremental(loader, writer)
+
+        # Rows to fetch (from the starting point)
+        total_rows = loader.total_rows() - checkpoint.offset
+
+        print("Fetching data of {} rows by {}".format(total_rows, batch_size))
+
+        if self.profile.pipeline:
+            checkpoint = self.import_pipelined(loader, writer, counts, total_rows, checkpoint)
+        else:
+            checkpoint = self.import_serial(loader, writer, counts, total_rows, checkpoint)
+
+        writer.begin_batch()
+        if mark is not None:
+            writer.save_watermark(mark)
+        writer.commit_batch(checkpoint.complete())
+
+        writer.close() 
+        loader.close()
+        print(json.dumps(counts.counters, indent=2))
+        if self.timer.enabled:
+            print("Timing by version")
+            print(json.dumps(self.timer.to_dict(), indent=2))
+        return counts
+
+    def start_checkpoint(self, loader: SourceDataLoader, writer: Writer):
+        """
+            Checkpoint to start the build from, the last saved one if the build is resumed
+        """
+        profile_hash = self.profile.profile_hash()
+        table = self.profile.target_table
+        checkpoint = BuildCheckpoint(table, profile_hash, offset=self.profile.starting_offset)
+        if not self.profile.resume:
+            return checkpoint
+        saved = writer.read_checkpoint(table)
+        if saved is None:
+            print("No checkpoint found for {}, starting from offset {}".format(table, checkpoint.offset))
+            return checkpoint
+        if saved.profile_hash != profile_hash:
+            raise ValueError("Profile has changed since the last checkpoint of {}, build cannot be resumed".format(table))
+        print("Resuming build of {} from checkpoint: {}".format(table, saved))
+        loader.set_cursor(saved.cursor, saved.offset)
+        return saved
+
+    def start_incremental(self, loader: SourceDataLoader, writer: Writer):
+        """
+            Only load source rows added since the last completed build (incremental mode)
+        """
+        table = self.profile.target_table
+        previous = writer.read_watermark(table)
+        if previous is None:
+            print("No previous build found for {}, building from all data".format(table))
+            return
+        print("Incremental build of {} since {}".format(table, previous))
+        loader.start_after(previous)
+
+    def import_serial(self, loader: SourceDataLoader, writer: Writer, counts: Counter, total_rows: int, checkpoint: BuildCheckpoint):
+        """
+            Load, transform and write each batch one after another
+            Returns the checkpoint of the last written batch
+        """
+        batch_size = self.profile.batch_size
+        offset = checkpoint.offset
         while True:
             
-            count_fetched, records = loader.load(batch_size, offset)
+            count_fetched, records = self.timer.load(loader, batch_size, offset)
             
-            counts.add('fetched', count_fetched)
-
-            if len(records) == 0:
-                print("No record fetched, stopping")
+            if not self.start_batch(counts, offset, count_fetched, records, total_rows):
                 break
-            
-            print("> #BATCH - Offset {} {:.2f}%, found  {} versions, {} rows processing...".format(offset, counts.percent('fetched', total_rows), len(records), count_fetched))
 
+            writer.begin_batch()
             for version, rows in records.items():
-
-                print(" >> #VERSION {}, {} rows from offset {}".format(version, len(rows), offset))
-
-                counts.add(version, len(rows))
-
-                df_struct = pd.DataFrame(rows)
-
-                if debug_version:
-                    print(show_df(df_struct))
-                    print("----------------- #VERSION")
-                    
-                processors = self.profile.select_processors(version)
-
-                for processor in processors:
-                    if debug_processors:
-                        print(">>> #PROCESSOR ", end=" ")
-                        print(processor)
-                    df_struct = processor.apply(df_struct)
-                    if debug_processors:
-                        print("   Dataframe after processor")
-                        print(show_df(df_struct))
-                        print("----------------------#PROCESSOR")
-                if debug_version:
-                    print("Appending {} rows for version '{}'".format(len(df_struct.index), version))
-                writer.append(df_struct)
+                df_struct = self.transform(version, rows, offset, counts)
+                self.timer.write(version, writer, df_struct)
+            checkpoint = checkpoint.next(offset + count_fetched, loader.get_cursor())
+            writer.commit_batch(checkpoint)
                 
             offset += batch_size
-        writer.close() 
-        print(json.dumps(counts.counters, indent=2))
\ No newline at end of file
+        return checkpoint
+
+    def import_pipelined(self, loader: SourceDataLoader, writer: Writer, counts: Counter, total_rows: int, checkpoint: BuildCheckpoint):
+        """
+            Run loading, transformation and writing in 3 stages running concurrently
+            Stages are connected by bounded queues (`pipeline_queue_size`), a stage waits when the next one is late
+            Returns the checkpoint of the last written batch
+        """
+        batch_size = self.profile.batch_size
+        pipeline = Pipeline(self.profile.pipeline_queue_size)
+        batches = pipeline.channel()
+        frames = pipeline.channel()
+
+        def read():
+            offset = checkpoint.offset
+            while True:
+                count_fetched, records = self.timer.load(loader, batch_size, offset)
+                # Last batch (without records) is also sent, it stops the transform stage
+                batches.put((offset, count_fetched, records, loader.get_cursor()))
+                if len(records) == 0:
+                    break
+                offset += batch_size
+
+        def transform():
+            while True:
+                offset, count_fetched, records, cursor = batches.get()
+                if not self.start_batch(counts, offset, count_fetched, records, total_rows):
+                    break
+                dfs = [(version, self.transform(version, rows, offset, counts)) for version, rows in records.items()]
+                frames.put((offset + count_fetched, cursor, dfs))
+            frames.close()
+
+        pipeline.start("reader", read)
+        pipeline.start("transform", transform)
+
+        # Writer stage runs in the current thread (target db connection is used by this thread only)
+        try:
+            while True:
+                item = frames.get()
+                if item is END:
+                    break
+                next_offset, cursor, dfs = item
+                writer.begin_batch()
+                for version, df_struct in dfs:
+                    self.timer.write(version, writer, df_struct)
+                checkpoint = checkpoint.next(next_offset, cursor)
+                writer.commit_batch(checkpoint)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            pipeline.fail(e)
+        pipeline.join()
+        return checkpoint
+
+    def start_batch(self, counts: Counter, offset: int, count_fetched: int, records: dict, total_rows: int):
+        """
+            Account a loaded batch, returns False if nothing has been loaded (end of data)
+        """
+        counts.add('fetched', count_fetched)
+
+        if len(records) == 0:
+            print("No record fetched, stopping")
+            return False
+        
+        print("> #BATCH - Offset {} {:.2f}%, found  {} versions, {} rows processing...".format(offset, counts.percent('fetched', total_rows), len(records), count_fetched))
+        return True
+
+    def transform(self, version: str, rows: list, offset: int, counts: Counter):
+        """
+            Transform rows of a version to a DataFrame and apply processors for this version
+        """
+        debug_version = self.debug('version')
+        debug_processors = self.debug('processors')
+
+        print(" >> #VERSION {}, {} rows from offset {}".format(version, len(rows), offset))
+
+        counts.add(version, len(rows))
+
+        df_struct = pd.DataFrame(rows)
+
+        if debug_version:
+            print(show_df(df_struct))
+            print("----------------- #VERSION")
+            
+        processors = self.profile.select_processors(version)
+
+        for index, processor in enumerate(processors):
+            if debug_processors:
+                print(">>> #PROCESSOR ", end=" ")
+                print(processor)
+            step = "{}:{}".format(index, type(processor).__name__)
+            df_struct = self.timer.apply(version, step, processor.apply, df_struct)
+            if debug_processors:
+                print("   Dataframe after processor")
+                print(show_df(df_struct))
+                print("----------------------#PROCESSOR")
+        if debug_version:
+            print("Appending {} rows for version '{}'".format(len(df_struct.index), version))
+        return df_struct
@@ -0,0 +1,73 @@
+import json
+from typing import Optional
+
+# Table of the target database holding the progress of the build of each table
+CHECKPOINT_TABLE = 'survey_build_checkpoint'
+
+# Table of the target database holding the high-water mark of the last completed build of each table
+WATERMARK_TABLE = 'survey_build_watermark'
+
+class BuildCheckpoint:
+    """
+        Progress of the build of a table, saved in the target database with each batch
+
+        offset: number of source rows already imported (offset of the next batch)
+        cursor: key (version, submitted, id) of the last imported source row (keyset pagination), None if unknown
+        batches: number of batches imported
+        profile_hash: hash of the profile parameters changing the built data, a build can only be resumed with the same profile
+        completed: True if all the source rows have been imported
+    """
+    def __init__(self, table: str, profile_hash: str, offset: int=0, cursor: Optional[dict]=None, batches: int=0, completed: bool=False):
+        self.table = table
+        self.profile_hash = profile_hash
+        self.offset = offset
+        self.cursor = cursor
+        self.batches = batches
+        self.completed = completed
+
+    def next(self, offset: int, cursor: Optional[dict]):
+        """
+            Checkpoint after a new batch ending at offset/cursor
+        """
+        return BuildCheckpoint(self.table, self.profile_hash, offset, cursor, self.batches + 1)
+
+    def complete(self):
+        return BuildCheckpoint(self.table, self.profile_hash, self.offset, self.cursor, self.batches, completed=True)
+
+    def to_row(self):
+        cursor = None
+        if self.cursor is not None:
+            cursor = json.dumps(self.cursor)
+        return (self.table, self.profile_hash, self.offset, cursor, self.batches, self.completed)
+
+    @staticmethod
+    def from_row(row):
+        table, profile_hash, offset, cursor, batches, completed = row
+        if cursor is not None:
+            cursor = json.loads(cursor)
+        return BuildCheckpoint(table, profile_hash, offset, cursor, batches, completed)
+
+    def __str__(self):
+        return "offset {}, {} batches, cursor {}{}".format(self.offset, self.batches, self.cursor, ', completed' if self.completed else '')
+
+class BuildWatermark:
+    """
+        High-water mark of the source data imported by the last completed build of a table
+
+        submitted: max submitted time of the imported source rows
+        import_time: time of the last export window registered in the source import_log when the build started
+    """
+    def __init__(self, table: str, submitted: Optional[int], import_time: Optional[int]):
+        self.table = table
+        self.submitted = submitted
+        self.import_time = import_time
+
+    def to_row(self):
+        return (self.table, self.submitted, self.import_time)
+
+    @staticmethod
+    def from_row(row):
+        return BuildWatermark(row[0], row[1], row[2])
+
+    def __str__(self):
+        return "submitted {}, import time {}".format(self.submitted, self.import_time)
@@ -0,0 +1,72 @@
+##
+# Decoding of raw response rows (decompress and json parsing)
+# Functions in this module are run in worker processes, so they only depend on light modules
+import json
+import os
+import time
+from ..compress import Compressor
+
+# Compressor instances by name, created once by process
+compressors: dict[str, Compressor] = {}
+
+def get_compressor(name: str)->Compressor:
+    compressor = compressors.get(name)
+    if compressor is None:
+        compressor = Compressor(name)
+        compressors[name] = compressor
+    return compressor
+
+def register_compressor(name: str, dictionaries: list[tuple]):
+    """
+        Create the compressor `name` with its dictionaries (version, dict_id, data) in the current process
+        Used as initializer of worker processes, dictionaries are loaded from the export db by the main process
+    """
+    compressor = Compressor(name)
+    if compressor.dictionaries is not None:
+        for (version, dict_id, data) in dictionaries:
+            compressor.dictionaries.add(version, data)
+    compressors[name] = compressor
+
+def decode_rows(compressor_name: str, rows: list[tuple]):
+    """
+        Decode a list of raw rows (data, version, id)
+        Returns a tuple (pid, elapsed time in seconds, decoded rows as list of (version, data), errors as list of (id, message))
+    """
+    start = time.perf_counter()
+    decompress = get_compressor(compressor_name).decompress
+    decoded = []
+    errors = []
+    for row in rows:
+        try:
+            data = decompress(row[0])
+            data = json.loads(data)
+            decoded.append((row[1], data))
+        except Exception as e:
+            errors.append((row[2], "{} {}".format(e.__class__, e)))
+    return (os.getpid(), time.perf_counter() - start, decoded, errors)
+
+def split_rows(rows: list, count:int):
+    """
+        Split list of rows in `count` chunks of consecutive rows (order is preserved)
+    """
+    size = -(-len(rows) // count)
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+class WorkerStats:
+    """
+        Accumulate decoded rows count and time by worker process
+    """
+    def __init__(self):
+        self.workers: dict[int, list] = {}
+
+    def add(self, pid: int, rows: int, elapsed: float):
+        if pid not in self.workers:
+            self.workers[pid] = [0, 0.0]
+        stat = self.workers[pid]
+        stat[0] += rows
+        stat[1] += elapsed
+
+    def show(self):
+        for pid, (rows, elapsed) in self.workers.items():
+            rate = rows / elapsed if elapsed > 0 else 0
+            print(" - worker {}: {} rows decoded in {:.2f}s ({:.0f} rows/s)".format(pid, rows, elapsed, rate))
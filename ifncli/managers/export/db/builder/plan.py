@@ -27,9 +27,10 @@ class BuilderPlan:
             - using a predefined profile (provided in the 'profiles' section)
             - from an external file, using a prefix '@' before the file path
     """
-    def __init__(self, data_path: Optional[str]=None):
+    def __init__(self, data_path: Optional[str]=None, overrides: Optional[dict]=None):
         """
             data_path: optional path to resolve path for source & target db if they contains {data_path}
+            overrides: optional profile values applied to all surveys (from command line arguments), None values are ignored
         """
         self.source_db: str = ''
         self.target_db: str = ''
@@ -37,6 +38,7 @@ class BuilderPlan:
         self.profiles: dict[str, ProfileType] = {}
         self.surveys: dict[str, BuilderProfile] = {}
         self.file: Optional[str] = None
+        self.overrides = overrides
     
     def error(self, message):
         if self.file is not None:
@@ -143,6 +145,8 @@ class BuilderPlan:
                         profile_data.merge_from(pp, origin=f("profiles.{survey_def}"), allow_none=False)
                 else:
                     raise self.error(f"surveys.{survey_name} must be a dictionnary or a string")
+            if self.overrides is not None:
+                profile_data.merge_from(self.overrides, origin="command line", allow_none=False)
             try:
                 profile = BuilderProfile(profile_data)
             except Exception as e:
@@ -1,6 +1,13 @@
 import pandas
+import numpy
 import re
 import json
+from collections import OrderedDict
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 from typing import Optional
 
 from ..schema import SurveySchema
@@ -140,17 +147,41 @@ DefaultRenameColumns = {
 class DuplicateColumnError(Exception):
     pass
 
+# Maximum number of column lists with a memoized renaming for each processor
+RENAME_CACHE_SIZE = 64
+
 class BaseRenamingProcessor(BasePreprocessor):
     """
         Base processor to rename columns based on list of renaming rules (regex, fixed, ...)
+        Renaming computed for a list of columns is memoized (LRU), as the column list of a survey version rarely changes between batches
+        Rules must not be changed once the processor has been applied
     """
     def __init__(self, excluded:list[str]=[]):
         self.rules : list[BaseRenameRule] = []
         self.excluded = excluded
+        self.rename_cache: OrderedDict[tuple[str, ...], dict[str, str]] = OrderedDict()
 
     def apply_to_list(self, columns: list[str], debug=None):
         """
             Apply renaming to a list of columns
+            Returned dictionary is shared with the cache and must not be modified
+        """
+        if debug is not None:
+            return self.compute_renaming(columns, debug)
+        key = tuple(columns)
+        renamed = self.rename_cache.get(key)
+        if renamed is not None:
+            self.rename_cache.move_to_end(key)
+            return renamed
+        renamed = self.compute_renaming(columns)
+        self.rename_cache[key] = renamed
+        if len(self.rename_cache) > RENAME_CACHE_SIZE:
+            self.rename_cache.popitem(last=False)
+        return renamed
+
+    def compute_renaming(self, columns: list[str], debug=None):
+        """
+            Apply renaming rules to a list of columns, raise DuplicateColumnError if several columns get the same name
         """
         renamed = {}
         targets = {}
@@ -231,6 +262,28 @@ class DefaultRenamingProcessor(BaseRenamingProcessor):
         return r
 
 
+BOOLEAN_VALUES = {'0': False, '1':True, 'true': True, 'false': False}
+
+def to_boolean_value(value):
+    """
+        Boolean value of a cell, None for missing values (NA or empty string)
+    """
+    if pandas.isna(value) or value == '':
+        return None
+    v = BOOLEAN_VALUES.get(str(value).lower())
+    if v is None:
+        raise ValueError("Cannot cast '{}' to boolean".format(value))
+    return v
+
+def to_boolean(values: pandas.Series)->pandas.Series:
+    """
+        Cast a series to nullable boolean
+        Distinct values are factorized so each one is only casted once, the result is built by a vectorized lookup
+    """
+    codes, uniques = pandas.factorize(values)
+    lookup = pandas.array([to_boolean_value(v) for v in uniques], dtype='boolean')
+    return pandas.Series(lookup.take(codes, allow_fill=True), index=values.index, name=values.name)
+
 class ToBooleanRule:
     """
         Transform colum to boolean
@@ -240,15 +293,11 @@ class ToBooleanRule:
         self.columns = columns
 
     def apply(self, rows: pandas.DataFrame):
-        booleans = {'0': False, '1':True, 'true': True, 'false': False}
-        to_bool = lambda x: str(x).lower() if not (pandas.isna(x) or x == '') else None
         for column in self.columns:
             if  column not in rows:
                 continue
             if rows[column].dtype != 'boolean':
-                with pandas.option_context("future.no_silent_downcasting", True):
-                    rows[column] = rows[column].map(to_bool).replace(booleans).astype('boolean')
-                #rows[column] = rows[column].astype('boolean')
+                rows[column] = to_boolean(rows[column])
         return rows
 
     def __str__(self):
@@ -273,40 +322,73 @@ class ToDatetimeRule:
         return "<date:{}>".format(", ".join(self.columns))
  
 
+# Type of each cell of an object array
+cell_type = numpy.frompyfunc(type, 1, 1)
+
 def extract_items_keys(data):
         d = []
-        if 'items' in data:
+        if isinstance(data, dict) and 'items' in data:
             for item in data['items']:
                 d.append(item['key'])
         return d
 
+def join_items_keys(data):
+    """
+        Coma separated keys of 'items' entry, None if no items
+    """
+    keys = extract_items_keys(data)
+    if len(keys) > 0:
+        return ','.join(keys)
+    return None
+
+def parse_json_list(values: list[str]):
+    """
+        Parse a list of json strings, invalid values are replaced by None
+    """
+    try:
+        return [json_loads(value) for value in values]
+    except Exception:
+        pass
+    # At least one value is invalid, parse again with error handling for each value
+    parsed = []
+    for value in values:
+        try:
+            parsed.append(json_loads(value))
+        except Exception as e:
+            print("Unable to parse json data :{}".format(e))
+            parsed.append(None)
+    return parsed
+
+def unjson_items_keys(values: pandas.Series)->pandas.Series:
+    """
+        Replace json objects (or json strings) in a series by the coma separated list of keys of their 'items' entry
+        Cells are split by type: distinct json strings are parsed once (multiple choice responses are very repetitive),
+        objects are handled directly. Missing values and empty strings are kept, objects without items give None
+    """
+    cells = values.to_numpy(dtype=object)
+    kinds = cell_type(cells)
+    is_str = kinds == str
+    is_dict = kinds == dict
+    result = cells.copy()
+    if is_str.any():
+        codes, uniques = pandas.factorize(cells[is_str])
+        to_parse = [u for u in uniques if u != '']
+        keys = dict(zip(to_parse, [join_items_keys(v) for v in parse_json_list(to_parse)]))
+        keys[''] = ''
+        result[is_str] = numpy.array([keys[u] for u in uniques], dtype=object)[codes]
+    if is_dict.any():
+        result[is_dict] = [join_items_keys(v) for v in cells[is_dict]]
+    return pandas.Series(result, index=values.index, name=values.name)
+
 class UnJsonRule:
     def __init__(self, columns: list[str]):
         self.columns = columns
 
     def apply(self, rows: pandas.DataFrame):
-
-        def update_row(value):
-            if pandas.isna(value):
-                return value
-            if value == "":
-                return value
-            if isinstance(value, dict):
-                v = value
-            else: 
-                try:
-                    v = json.loads(value)
-                except Exception as e:
-                    print("Unable to parse json data :{}".format(e))
-            v = extract_items_keys(v)
-            if len(v) > 0:
-                v = ','.join(v)
-            return v
-        
         for column in self.columns:
             if column not in rows.columns:
                 continue
-            rows[column] = rows[column].apply(update_row)
+            rows[column] = unjson_items_keys(rows[column])
         return rows
 
     def __str__(self):
@@ -1,6 +1,8 @@
 import unittest
 
-from .processors import RemovePrefixRule, RenameRegexpRule, RenameFixedColumnRule
+from .processors import RemovePrefixRule, RenameRegexpRule, RenameFixedColumnRule, DefaultRenamingProcessor, RenamingProcessor, DuplicateColumnError
+from . import processors
+import pandas
 from .columns import ColumnSelector, FixedColumnSelector, PatternColumnSelector
 class TestRenameProcessor(unittest.TestCase):
 
@@ -22,6 +24,65 @@ class TestRenameProcessor(unittest.TestCase):
         self.assertEqual(rule.apply('Q34'), "Q26")
         
 
+class TestRenamingCache(unittest.TestCase):
+
+    def testCachedRenaming(self):
+        proc = DefaultRenamingProcessor('|')
+        columns = ['weekly.main.Q1|1', 'weekly.main.Q2|likert_1', 'ID']
+        renamed = proc.apply_to_list(columns)
+        self.assertEqual(renamed, {'weekly.main.Q1|1': 'Q1_1', 'weekly.main.Q2|likert_1': 'Q2_lk_1'})
+        self.assertIs(proc.apply_to_list(list(columns)), renamed)
+        self.assertEqual(len(proc.rename_cache), 1)
+
+    def testCacheSize(self):
+        proc = DefaultRenamingProcessor('|')
+        for i in range(processors.RENAME_CACHE_SIZE + 5):
+            proc.apply_to_list(['Q{}'.format(i)])
+        self.assertEqual(len(proc.rename_cache), processors.RENAME_CACHE_SIZE)
+        self.assertNotIn(('Q0',), proc.rename_cache)
+
+    def testDuplicateNotCached(self):
+        proc = RenamingProcessor([RenameFixedColumnRule({'Q1': 'Q2'})], [])
+        for i in range(2):
+            with self.assertRaises(DuplicateColumnError):
+                proc.apply_to_list(['Q1', 'Q2'])
+        self.assertEqual(len(proc.rename_cache), 0)
+
+class TestBooleanRule(unittest.TestCase):
+
+    def testToBoolean(self):
+        df = pandas.DataFrame({
+            'Q1': [True, 'FALSE', '1', '0', None, '', 'true'],
+            'Q2': [None, None, None, None, None, None, None],
+            'Q3': [1, 0, 1, 0, 1, 0, 1],
+        })
+        df = processors.ToBooleanRule(['Q1', 'Q2', 'Q3', 'Q4']).apply(df)
+        self.assertEqual(df['Q1'].dtype, 'boolean')
+        self.assertEqual(df['Q1'].to_list(), [True, False, True, False, pandas.NA, pandas.NA, True])
+        self.assertTrue(df['Q2'].isna().all())
+        self.assertEqual(df['Q3'].to_list(), [True, False, True, False, True, False, True])
+
+    def testToBooleanError(self):
+        df = pandas.DataFrame({'Q1': ['TRUE', 'maybe']})
+        with self.assertRaises(ValueError):
+            processors.ToBooleanRule(['Q1']).apply(df)
+
+class TestUnJsonRule(unittest.TestCase):
+
+    def testUnJson(self):
+        df = pandas.DataFrame({'Q1': [
+            '{"items":[{"key":"1"},{"key":"2"}]}',
+            {'items':[{'key':'x'}]},
+            None,
+            '',
+            '{"items":[]}',
+            'invalid{',
+        ]})
+        df = processors.UnJsonRule(['Q1', 'Q2']).apply(df)
+        self.assertEqual(df['Q1'].to_list(), ['1,2', 'x', None, '', None, None])
+        with self.assertRaises(TypeError):
+            processors.unjson_items_keys(pandas.Series(['{"items":[{"key":1}]}']))
+
 class TestColumnSelector(unittest.TestCase):
     def testFixedColumnSelector(self):
         sel = FixedColumnSelector(['Q12', 'Q15', 'intake.main.Q2'])
@@ -2,6 +2,8 @@
 from ..database import ExportDatabase
 from ifncli.utils.io import read_yaml
 from datetime import datetime
+import hashlib
+import json
 from typing import Optional
 from .schema import SurveySchema
 from .processor import BasePreprocessor, SchemaCastingProcessor, DefaultRenamingProcessor, ProcessorParserSpec, PROC_TYPE_CASTING, PROC_TYPE_RENAME
@@ -63,6 +65,21 @@ POSITION_END = 'end'
 PROC_DEFAULT_CASTING = 'default_casting'
 PROC_DEFAULT_RENAMING = 'default_renaming'
 
+PAGINATION_OFFSET = 'offset' # Fetch source rows using LIMIT/OFFSET
+PAGINATION_KEYSET = 'keyset' # Fetch source rows following the key of the last fetched row
+
+PAGINATION_MODES = [PAGINATION_KEYSET, PAGINATION_OFFSET]
+
+ENGINE_PANDAS = 'pandas' # Rows are loaded in python and transformed with pandas DataFrame
+ENGINE_DUCKDB = 'duckdb' # Source db is attached in duckdb and rows transformed using sql
+
+ENGINES = [ENGINE_PANDAS, ENGINE_DUCKDB]
+
+INSERT_IGNORE = 'ignore' # Rows with an id already in the target table are skipped
+INSERT_REPLACE = 'replace' # Rows with an id already in the target table are replaced
+
+INSERT_MODES = [INSERT_IGNORE, INSERT_REPLACE]
+
 class Debugger:
     """
         Debugger contains flags to known which part to debug (print)
@@ -73,7 +90,8 @@ class Debugger:
         'query', # Import query
         'query_source', # Source query
         'version', # Version loop block
-        'processors' # Processors run in version block
+        'processors', # Processors run in version block
+        'timing', # Time, rows and memory of each processor, loader and writer (shown at the end of the import)
     ]
 
     def __init__(self) -> None:
@@ -144,6 +162,14 @@ class Conf(DictWithOrigin):
         except:
             raise self.value_error(name, 'integer', v)
         
+    def get_val_choice(self, name, choices: list[str], default:str):
+        v = self.get_val_str(name)
+        if v is None:
+            return default
+        if v not in choices:
+            raise self.value_error(name, ' or '.join(choices), v)
+        return v
+
     def get_val_time(self, name):
         v = self.get(name)
         if v is not None:
@@ -196,7 +222,20 @@ class BuilderProfile:
 
         self.batch_size = conf.get_val_int("batch_size", default=5000)
         self.starting_offset = conf.get_val_int("starting_offset", default=0)
+        self.pagination = conf.get_val_choice("pagination", PAGINATION_MODES, default=PAGINATION_KEYSET)
+        self.engine = conf.get_val_choice("engine", ENGINES, default=ENGINE_PANDAS)
+        self.workers = conf.get_val_int("workers", default=1)
+        self.pipeline = conf.get_val_bool("pipeline", default=False)
+        self.pipeline_queue_size = conf.get_val_int("pipeline_queue_size", default=2)
+        if self.pipeline_queue_size < 1:
+            raise conf.value_error("pipeline_queue_size", "integer > 0", self.pipeline_queue_size)
         self.dry_run = conf.get_val_bool("dry_run", default=False)
+        self.resume = conf.get_val_bool("resume", default=False)
+        self.incremental = conf.get_val_bool("incremental", default=False)
+        if self.incremental and self.resume:
+            raise conf.value_error("incremental", "false when resume is used", self.incremental)
+        # Rows already built are loaded again from the high-water mark in incremental mode, they are replaced unless set
+        self.insert_mode = conf.get_val_choice("insert_mode", INSERT_MODES, default=INSERT_REPLACE if self.incremental else INSERT_IGNORE)
         debugger_spec = conf.get("debugger")
 
         self.debugger.parse(debugger_spec)
@@ -352,6 +391,24 @@ class BuilderProfile:
             'debugger': self.debugger.flags,
             'batch_size': self.batch_size,
             'starting_offset': self.starting_offset,
+            'pagination': self.pagination,
+            'engine': self.engine,
+            'workers': self.workers,
+            'pipeline': self.pipeline,
+            'pipeline_queue_size': self.pipeline_queue_size,
+            'resume': self.resume,
+            'incremental': self.incremental,
+            'insert_mode': self.insert_mode,
         }
         return d
 
+    def profile_hash(self):
+        """
+            Hash of the profile parameters changing the data built in the target table
+            Runtime options (batches, engine, debugger,...) are not included
+        """
+        d = self.to_readable()
+        keys = ['source_table', 'target_table', 'from_time', 'to_time', 'versions', 'processors', 'survey', 'schema']
+        data = json.dumps(dict([(k, d[k]) for k in keys]), sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
@@ -0,0 +1,251 @@
+##
+# Build engine running the whole transformation inside DuckDB
+# The export database is attached in DuckDB and responses are decoded, renamed and casted by generated SQL projections
+# Rows are never loaded as python objects (except for decompression through a registered function)
+import json
+import duckdb
+from typing import Optional
+
+from .profile import BuilderProfile
+from .builder import DuckDbWriter, Counter, SourceDbQueryBuilder
+from .processor import BasePreprocessor
+from .version_selector import parse_version
+from .processor.processors import BaseRenamingProcessor, DefaultRenamingProcessor, SchemaCastingProcessor, RuleBasedProcessor, ToBooleanRule, ToDatetimeRule
+from ..compress import load_compressor
+from ..parquet import ParquetStore, RAW_STORE_PARQUET, PAYLOAD_JSON, resolve_store_path, source_query, week_condition
+
+CAST_BOOL = 'bool'
+CAST_DATE = 'date'
+CAST_JSON = 'json'
+
+# Sql type of the column for each cast
+CAST_SQL_TYPES = {
+    CAST_BOOL: 'BOOLEAN',
+    CAST_DATE: 'TIMESTAMP',
+    CAST_JSON: 'VARCHAR',
+    None: 'VARCHAR',
+}
+
+RULE_CASTS = {
+    ToBooleanRule: CAST_BOOL,
+    ToDatetimeRule: CAST_DATE,
+}
+
+SOURCE_ALIAS = 'ifn_source'
+DECOMPRESS_FUNCTION = 'ifn_decompress'
+RAW_TABLE = 'ifn_raw_json'
+
+def quote_name(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+def quote_str(value: str):
+    return "'" + value.replace("'", "''") + "'"
+
+class ColumnProjection:
+    """
+        Column of the target table, extracted from a key of the json response
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self.name = key
+        self.cast: Optional[str] = None
+
+    def sql_type(self):
+        return CAST_SQL_TYPES[self.cast]
+
+    def to_sql(self, json_column: str):
+        path = quote_str('$.' + json.dumps(self.key))
+        value = "json_extract_string({}, {})".format(json_column, path)
+        if self.cast == CAST_BOOL:
+            expr = "CASE lower({v}) WHEN 'true' THEN true WHEN '1' THEN true WHEN 'false' THEN false WHEN '0' THEN false END".format(v=value)
+        elif self.cast == CAST_DATE:
+            expr = "make_timestamp(TRY_CAST({v} AS BIGINT) * 1000000)".format(v=value)
+        elif self.cast == CAST_JSON:
+            # Value can be a json object or a string containing json, only keys of 'items' are kept (coma separated)
+            obj = "CASE WHEN json_type({j}, {p}) = 'VARCHAR' THEN TRY_CAST({v} AS JSON) ELSE json_extract({j}, {p}) END".format(j=json_column, p=path, v=value)
+            expr = "nullif(array_to_string(json_extract_string({o}, '$.items[*].key'), ','), '')".format(o=obj)
+        else:
+            expr = value
+        return "{} AS {}".format(expr, quote_name(self.name))
+
+    def __str__(self):
+        return "{} => {} ({})".format(self.key, self.name, self.cast)
+
+class ProjectionPlanner:
+    """
+        Translate processors of a survey version to a list of column projections
+        Processors are applied in order on the column names (renaming) and set cast of columns (casting)
+    """
+
+    def plan(self, keys: list[str], processors: list[BasePreprocessor]):
+        columns = [ColumnProjection(key) for key in keys]
+        for processor in processors:
+            self.apply(processor, columns)
+        return columns
+
+    def apply(self, processor: BasePreprocessor, columns: list[ColumnProjection]):
+        names = [c.name for c in columns]
+        if isinstance(processor, BaseRenamingProcessor):
+            renamed = processor.apply_to_list(names)
+            for column in columns:
+                column.name = renamed.get(column.name, column.name)
+                if isinstance(processor, DefaultRenamingProcessor):
+                    column.name = processor.defaultColumns.get(column.name, column.name)
+            return
+        if isinstance(processor, SchemaCastingProcessor):
+            rules = [
+                (processor.boolean_rule, CAST_BOOL),
+                (processor.unjson_rule, CAST_JSON),
+                (processor.date_rule, CAST_DATE),
+            ]
+            for rule, cast in rules:
+                if rule is not None:
+                    self.set_cast(columns, rule.columns, cast)
+            return
+        if isinstance(processor, RuleBasedProcessor) and processor.rule_class in RULE_CASTS:
+            self.set_cast(columns, processor.columns.select(names), RULE_CASTS[processor.rule_class])
+            return
+        raise ValueError("Processor {} cannot be translated to sql, use 'pandas' engine".format(processor))
+
+    def set_cast(self, columns: list[ColumnProjection], names: list[str], cast: str):
+        names = set(names)
+        for column in columns:
+            if column.name in names:
+                column.cast = cast
+
+class DuckDbScanBuilder:
+    """
+        Build the survey table directly in DuckDB from the attached export database (engine 'duckdb')
+        Each survey version is decoded in a temporary table, then inserted in the target table using a projection
+        derived from the processors for this version.
+    """
+    def __init__(self, profile: BuilderProfile):
+        self.profile = profile
+        self.planner = ProjectionPlanner()
+        self.parquet = False # Source is the parquet raw store of the survey
+
+    def debug(self, name:str):
+        return self.profile.debugger.has(name)
+
+    def run(self, writer: Optional[DuckDbWriter]=None):
+        if self.profile.resume:
+            raise ValueError("Build cannot be resumed with 'duckdb' engine, use 'pandas' engine")
+        if self.profile.incremental:
+            raise ValueError("Incremental build is not available with 'duckdb' engine, use 'pandas' engine")
+        if writer is None:
+            target_db = ':memory:' if self.profile.dry_run else self.profile.target_db
+            writer = DuckDbWriter(target_db, self.profile.target_table, debugger=self.profile.debugger)
+        writer.open()
+        conn = writer.conn
+        meta = self.profile.source_db.get_meta()
+        self.attach(conn)
+        self.register_decoder(conn, meta.compressor)
+        writer.register_survey(self.profile.survey, self.profile.target_table)
+        counts = Counter()
+        try:
+            self.import_table(conn, writer, counts)
+        finally:
+            conn.execute("DROP TABLE IF EXISTS {}".format(RAW_TABLE))
+            self.detach(conn)
+        writer.close()
+        print(json.dumps(counts.counters, indent=2))
+        return counts
+
+    def attach(self, conn: duckdb.DuckDBPyConnection):
+        source_db = self.profile.source_db
+        store = source_db.get_raw_store(self.profile.survey)
+        if store is not None and store[0] == RAW_STORE_PARQUET:
+            self.attach_parquet(conn, ParquetStore(resolve_store_path(source_db.db_path, store[1])))
+            return
+        conn.execute("INSTALL sqlite")
+        conn.execute("LOAD sqlite")
+        conn.execute("ATTACH {} AS {} (TYPE sqlite, READ_ONLY)".format(quote_str(self.profile.source_db.db_path), SOURCE_ALIAS))
+
+    def detach(self, conn: duckdb.DuckDBPyConnection):
+        if self.parquet:
+            conn.execute("DROP SCHEMA {} CASCADE".format(SOURCE_ALIAS))
+            return
+        conn.execute("DETACH {}".format(SOURCE_ALIAS))
+
+    def attach_parquet(self, conn: duckdb.DuckDBPyConnection, store: ParquetStore):
+        """
+            Define the source table as a view on the parquet files, `data` column is the json of the response rebuilt from the payload maps
+            Time bounds are pushed down to the parquet scan (filters on version are pushed down by duckdb)
+        """
+        conditions = SourceDbQueryBuilder('', False)
+        conditions.from_time = self.profile.from_time
+        conditions.to_time = self.profile.to_time
+        w = conditions.build_conditions()
+        if self.profile.from_time is not None:
+            w.append(week_condition('>=', self.profile.from_time))
+        if self.profile.to_time is not None:
+            w.append(week_condition('<=', self.profile.to_time))
+        conn.execute("CREATE SCHEMA {}".format(SOURCE_ALIAS))
+        if store.has_data(self.profile.survey):
+            select = "SELECT id, submitted, version, {} AS data FROM {}".format(PAYLOAD_JSON, source_query(store, self.profile.survey, w))
+        else:
+            select = "SELECT NULL::VARCHAR AS id, NULL::BIGINT AS submitted, NULL::VARCHAR AS version, NULL::JSON AS data WHERE false"
+        conn.execute("CREATE VIEW {}.{} AS {}".format(SOURCE_ALIAS, self.profile.source_table, select))
+        self.parquet = True
+
+    def register_decoder(self, conn: duckdb.DuckDBPyConnection, compressor_name: str):
+        """
+            Define `decoder` the sql expression to get the json text from the data column
+        """
+        if self.parquet:
+            self.decoder = "data"
+            return
+        if compressor_name == 'none':
+            # Fast path, data is the json text
+            self.decoder = "decode(data)"
+            return
+        decompress = load_compressor(self.profile.source_db, compressor_name, self.profile.survey).decompress
+        conn.create_function(DECOMPRESS_FUNCTION, lambda data: decompress(data).decode('utf-8'), ['BLOB'], 'VARCHAR')
+        self.decoder = "{}(data)".format(DECOMPRESS_FUNCTION)
+
+    def source_query(self):
+        query = SourceDbQueryBuilder("{}.{}".format(SOURCE_ALIAS, self.profile.source_table), self.debug('query_source'))
+        query.from_time = self.profile.from_time
+        query.to_time = self.profile.to_time
+        return query
+
+    def resolve_versions(self, conn: duckdb.DuckDBPyConnection, query: SourceDbQueryBuilder):
+        rows = conn.execute(query.build_query("DISTINCT version") + " ORDER BY version").fetchall()
+        versions = []
+        for row in rows:
+            if self.profile.versions is None or self.profile.versions.is_version(parse_version(row[0])):
+                versions.append(row[0])
+        return versions
+
+    def import_table(self, conn: duckdb.DuckDBPyConnection, writer: DuckDbWriter, counts: Counter):
+        query = self.source_query()
+        versions = self.resolve_versions(conn, query)
+        print("Found {} versions to import".format(len(versions)))
+        for version in versions:
+            raw_query = query.build_query("CAST({} AS JSON) AS j".format(self.decoder), ['version = ?'])
+            query.show(raw_query)
+            conn.execute("CREATE OR REPLACE TEMP TABLE {} AS {}".format(RAW_TABLE, raw_query), [version])
+            count = conn.execute("SELECT count(*) FROM {}".format(RAW_TABLE)).fetchone()[0]
+            counts.add('fetched', count)
+            counts.add(version, count)
+            print(" >> #VERSION {}, {} rows".format(version, count))
+            if count == 0:
+                continue
+            keys = self.json_keys(conn)
+            columns = self.planner.plan(keys, self.profile.select_processors(version))
+            if self.debug('processors'):
+                for column in columns:
+                    print("   ", column)
+            select = "SELECT {} FROM {}".format(', '.join([c.to_sql('j') for c in columns]), RAW_TABLE)
+            column_types = dict([(c.name, c.sql_type()) for c in columns])
+            if self.profile.dry_run:
+                print(select)
+                continue
+            writer.append_select(select, column_types)
+
+    def json_keys(self, conn: duckdb.DuckDBPyConnection):
+        """
+            Keys found in responses of the raw table, in order of appearance
+        """
+        query = "SELECT key FROM (SELECT unnest(json_keys(j)) AS key, row_number() OVER () AS n FROM {}) GROUP BY key ORDER BY min(n)".format(RAW_TABLE)
+        return [row[0] for row in conn.execute(query).fetchall()]
@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..exporter import ExportSqlite
+from ..compress import Compressor
+from .profile import BuilderProfile, Debugger
+from .builder import SourceDbDataLoader, DatabaseBuilder, DuckDbWriter
+from .base import Writer
+from .trace import DictWithOrigin
+
+def create_source_db(rows):
+    db = ExportSqlite(':memory:', allow_create=True)
+    db.setup_meta('|', 'zlib')
+    db.setup_response_table('weekly', db.response_table('weekly'))
+    insert_rows(db, rows)
+    return db
+
+def insert_rows(db: ExportSqlite, rows):
+    compressor = Compressor('zlib')
+    data = []
+    for (id, submitted, version) in rows:
+        item = {'ID': id, 'submitted': submitted, 'version': version, 'participantID': 'p' + id}
+        data.append((id, submitted, version, compressor.compress(bytes(json.dumps(item), 'utf-8'))))
+    db.execute_many("INSERT INTO {} (id, submitted, version, data) VALUES (?, ?, ?, ?)".format(db.response_table('weekly')), data)
+
+def load_all(loader: SourceDbDataLoader, batch_size:int, offset:int=0):
+    ids = []
+    while True:
+        count, records = loader.load(batch_size, offset)
+        if count == 0:
+            break
+        for rows in records.values():
+            ids.extend([r['ID'] for r in rows])
+        offset += batch_size
+    return ids
+
+class CollectWriter(Writer):
+
+    def __init__(self, fail_at: int=0, id_column: str='ID'):
+        self.ids = []
+        self.fail_at = fail_at
+        self.id_column = id_column
+
+    def append(self, df):
+        self.ids.extend(df[self.id_column].to_list())
+        if self.fail_at > 0 and len(self.ids) >= self.fail_at:
+            raise ValueError("Writer failure")
+
+def create_fake_source_db():
+    rows = []
+    for i in range(23):
+        # Several rows share the same submitted time to check ordering ties
+        rows.append(("r{:02d}".format(i), 1000 + (i // 3), '24-1-{}'.format(1 + (i % 2))))
+    return create_source_db(rows)
+
+def create_profile(db, **kwargs):
+    conf = DictWithOrigin({'survey': 'weekly', 'target_db': ':memory:', **kwargs})
+    return BuilderProfile(conf, source_db=db)
+
+class TestSourceDbDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.db = create_fake_source_db()
+
+    def create_loader(self, pagination:str, workers:int=1):
+        profile = create_profile(self.db, pagination=pagination, workers=workers)
+        return SourceDbDataLoader(profile, self.db.get_meta())
+
+    def test_keyset_same_as_offset(self):
+        by_offset = load_all(self.create_loader('offset'), 5)
+        by_keyset = load_all(self.create_loader('keyset'), 5)
+        self.assertEqual(len(by_offset), 23)
+        self.assertEqual(by_keyset, by_offset)
+
+    def test_keyset_resume_from_offset(self):
+        by_offset = load_all(self.create_loader('offset'), 4)
+        resumed = load_all(self.create_loader('keyset'), 4, offset=8)
+        self.assertEqual(resumed, by_offset[8:])
+
+    def test_time_range(self):
+        loader = self.create_loader('keyset')
+        loader.query.from_time = 1002
+        loader.query.to_time = 1003
+        self.assertEqual(loader.total_rows(), 6)
+        self.assertEqual(len(load_all(loader, 4)), 6)
+
+    def test_versions(self):
+        profile = create_profile(self.db, versions='24-1-2', from_time='1970-01-01T00:16:42+00:00', to_time='1970-01-01T00:16:43+00:00')
+        loader = SourceDbDataLoader(profile, self.db.get_meta())
+        self.assertEqual(loader.query.versions, ['24-1-2'])
+        self.assertEqual(loader.total_rows(), 3)
+        self.assertEqual(len(load_all(loader, 2)), 3)
+
+    def test_workers_same_as_serial(self):
+        serial = self.create_loader('keyset')
+        parallel = self.create_loader('keyset', workers=2)
+        for offset in [0, 10, 20]:
+            self.assertEqual(parallel.load(10, offset), serial.load(10, offset))
+        parallel.close()
+        self.assertEqual(sum(stat[0] for stat in parallel.worker_stats.workers.values()), 23)
+
+class TestDatabaseBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.db = create_fake_source_db()
+
+    def build(self, writer: Writer, **kwargs):
+        profile = create_profile(self.db, batch_size=4, **kwargs)
+        loader = SourceDbDataLoader(profile, self.db.get_meta())
+        builder = DatabaseBuilder(profile)
+        counts = builder.import_table(loader, writer)
+        return counts
+
+    def test_pipelined_same_as_serial(self):
+        serial = CollectWriter()
+        serial_counts = self.build(serial)
+        pipelined = CollectWriter()
+        pipelined_counts = self.build(pipelined, pipeline=True, pipeline_queue_size=1)
+        self.assertEqual(len(serial.ids), 23)
+        self.assertEqual(pipelined.ids, serial.ids)
+        self.assertEqual(pipelined_counts.counters, serial_counts.counters)
+
+    def test_pipelined_writer_error(self):
+        with self.assertRaises(ValueError):
+            self.build(CollectWriter(fail_at=5), pipeline=True, pipeline_queue_size=1)
+
+    def test_timing(self):
+        for pipeline in [False, True]:
+            profile = create_profile(self.db, batch_size=4, debugger='timing', pipeline=pipeline, infer_schema=False)
+            profile.build()
+            builder = DatabaseBuilder(profile)
+            builder.import_table(SourceDbDataLoader(profile, self.db.get_meta()), CollectWriter(id_column='id'))
+            timing = builder.timer.to_dict()
+            self.assertEqual(timing['batch']['loader']['rows_out'], 23)
+            self.assertEqual(timing['24-1-1']['writer']['rows_in'], 12)
+            self.assertEqual(timing['24-1-2']['writer']['rows_in'], 11)
+            self.assertEqual(timing['total']['writer']['calls'], 6)
+            processors = [step for step in timing['24-1-1'] if step != 'writer']
+            self.assertTrue(len(processors) > 0)
+            for step in processors:
+                self.assertEqual(timing['24-1-1'][step]['rows_in'], 12)
+
+class TestBuildCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.db = create_fake_source_db()
+        self.target = tempfile.mkdtemp()
+        self.target_db = os.path.join(self.target, 'target.duckdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.target)
+
+    def create_writer(self, profile, fail_at: int=0):
+        writer = DuckDbWriter(self.target_db, profile.target_table, debugger=profile.debugger)
+        if fail_at > 0:
+            append = writer.append
+            def failing_append(df):
+                if writer.appended >= fail_at:
+                    raise ValueError("Writer failure")
+                writer.appended += 1
+                append(df)
+            writer.appended = 0
+            writer.append = failing_append
+        return writer
+
+    def build(self, fail_at: int=0, **kwargs):
+        profile = create_profile(self.db, batch_size=4, infer_schema=False, target_db=self.target_db, **kwargs)
+        profile.build()
+        writer = self.create_writer(profile, fail_at)
+        loader = SourceDbDataLoader(profile, self.db.get_meta())
+        try:
+            return DatabaseBuilder(profile).import_table(loader, writer)
+        finally:
+            writer.close()
+
+    def table_ids(self):
+        writer = DuckDbWriter(self.target_db, 'pollster_results_weekly', debugger=Debugger())
+        checkpoint = writer.read_checkpoint('pollster_results_weekly')
+        ids = [row[0] for row in writer.conn.execute("SELECT id FROM pollster_results_weekly ORDER BY id").fetchall()]
+        writer.close()
+        return ids, checkpoint
+
+    def test_resume_after_failure(self):
+        for pipeline in [False, True]:
+            with self.subTest(pipeline=pipeline):
+                if os.path.exists(self.target_db):
+                    os.remove(self.target_db)
+                with self.assertRaises(ValueError):
+                    self.build(fail_at=3, pipeline=pipeline)
+                ids, checkpoint = self.table_ids()
+                # Third append is the first one of the second batch (2 versions in the first batch)
+                self.assertEqual(checkpoint.offset, len(ids))
+                self.assertFalse(checkpoint.completed)
+                counts = self.build(resume=True, pipeline=pipeline)
+                self.assertEqual(counts.counters['fetched'], 23 - checkpoint.offset)
+                ids, checkpoint = self.table_ids()
+                self.assertEqual(len(ids), 23)
+                self.assertTrue(checkpoint.completed)
+                self.assertEqual(self.build(resume=True).counters, {})
+
+    def test_resume_changed_profile(self):
+        self.build()
+        with self.assertRaises(ValueError):
+            self.build(resume=True, from_time='2020-01-01')
+
+    def build_incremental(self):
+        profile = create_profile(self.db, batch_size=4, infer_schema=False, target_db=self.target_db, incremental=True)
+        profile.build()
+        return DatabaseBuilder(profile).run()
+
+    def log_import(self, time: int, start: int, end: int):
+        self.db.execute('INSERT INTO import_log("time", "survey_key", "start", "end") VALUES (?, ?, ?, ?)', (time, 'weekly', start, end))
+
+    def test_incremental(self):
+        self.log_import(100, 1000, 1007)
+        self.assertEqual(self.build_incremental().counters['fetched'], 23)
+        ids, _ = self.table_ids()
+        self.assertEqual(len(ids), 23)
+        # Last submitted is 1007 (2 rows), only rows from it are loaded again
+        insert_rows(self.db, [('n1', 1010, '24-1-1'), ('n2', 1011, '24-1-2')])
+        self.log_import(200, 1008, 1012)
+        self.assertEqual(self.build_incremental().counters['fetched'], 4)
+        # Late export of an older window, rows are loaded from the window start
+        insert_rows(self.db, [('n3', 1005, '24-1-1')])
+        self.log_import(300, 1005, 1006)
+        self.assertEqual(self.build_incremental().counters['fetched'], 11)
+        ids, _ = self.table_ids()
+        self.assertEqual(len(ids), 26)
+
+    def test_without_import_log(self):
+        self.db.execute('DROP TABLE import_log')
+        self.assertEqual(self.build().counters['fetched'], 23)
+        self.assertIsNone(self.db.get_last_import_time('weekly'))
+        self.assertEqual(self.build_incremental().counters['fetched'], 23)
+
+    def test_insert_mode(self):
+        self.assertEqual(create_profile(self.db).insert_mode, 'ignore')
+        self.assertEqual(create_profile(self.db, incremental=True).insert_mode, 'replace')
+        self.assertEqual(create_profile(self.db, incremental=True, insert_mode='ignore').insert_mode, 'ignore')
+        with self.assertRaises(ValueError):
+            create_profile(self.db, insert_mode='update')
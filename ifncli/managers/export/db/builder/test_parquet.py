@@ -0,0 +1,104 @@
+import json
+import shutil
+import tempfile
+import unittest
+
+from ..exporter import ExportSqlite
+from ..parquet import ParquetStore, RAW_STORE_PARQUET, PAYLOAD_JSON
+from .builder import DatabaseBuilder, DuckDbWriter, ParquetDataLoader, SourceDbDataLoader, create_loader
+from .scan import DuckDbScanBuilder
+from .test_loader import load_all
+from .test_scan import RESPONSES, FakeAttachScanBuilder, create_sqlite_profile, fetch_table
+from .profile import BuilderProfile
+from .trace import DictWithOrigin
+
+def create_parquet_db(path: str, flushes: int=1):
+    db = ExportSqlite(':memory:', allow_create=True)
+    db.setup_meta('|', 'zlib')
+    db.setup_raw_store('weekly', RAW_STORE_PARQUET, path)
+    store = ParquetStore(path)
+    for _ in range(flushes):
+        store.append('weekly', [store.encode_item(dict(r)) for r in RESPONSES])
+        store.flush()
+    return db
+
+def create_profile(db, **kwargs):
+    conf = DictWithOrigin({'survey': 'weekly', 'target_db': ':memory:', 'infer_schema': False, 'schema': {'weekly.Q1|1': 'bool', 'weekly.Q2': 'json'}, **kwargs})
+    profile = BuilderProfile(conf, source_db=db)
+    profile.build()
+    return profile
+
+def by_id(loader):
+    records = []
+    count, batches = loader.load(100, 0)
+    for rows in batches.values():
+        records.extend(rows)
+    return sorted(records, key=lambda r: r['ID'])
+
+class TestParquetStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.sqlite_profile = create_sqlite_profile()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_encode_decode(self):
+        store = ParquetStore(self.path)
+        for r in RESPONSES:
+            row = store.encode_item(dict(r))
+            self.assertEqual(len(row), 11)
+        store.append('weekly', [store.encode_item(dict(r)) for r in RESPONSES])
+        self.assertEqual(store.flush(), 3)
+        self.assertEqual(store.flush(), 0)
+        rows = store.conn.execute("SELECT {} FROM {} ORDER BY id".format(PAYLOAD_JSON, store.scan('weekly'))).fetchall()
+        self.assertEqual([json.loads(row[0]) for row in rows], RESPONSES)
+        self.assertEqual(store.time_range('weekly'), (1700000000, 1700000200))
+        self.assertEqual(store.time_range('intake'), (None, None))
+
+    def test_loader_same_as_sqlite(self):
+        db = create_parquet_db(self.path, flushes=2)
+        loader = create_loader(create_profile(db), db.get_meta())
+        self.assertIsInstance(loader, ParquetDataLoader)
+        # Rows written twice are loaded once
+        self.assertEqual(loader.total_rows(), 3)
+        expected = by_id(SourceDbDataLoader(self.sqlite_profile, self.sqlite_profile.source_db.get_meta()))
+        self.assertEqual(by_id(loader), expected)
+
+    def test_pushdown(self):
+        db = create_parquet_db(self.path)
+        loader = create_loader(create_profile(db, from_time='2023-11-14T22:15:00'), db.get_meta())
+        self.assertEqual(loader.total_rows(), 2)
+        loader.query.versions = ['24-2-1']
+        self.assertEqual([r['ID'] for r in by_id(loader)], ['r3'])
+        self.assertEqual(loader.watermark('t').submitted, 1700000200)
+
+    def test_batches_and_resume(self):
+        db = create_parquet_db(self.path)
+        profile = create_profile(db)
+        expected = load_all(create_loader(profile, db.get_meta()), 3)
+        self.assertEqual(load_all(create_loader(profile, db.get_meta()), 1), expected)
+        loader = create_loader(profile, db.get_meta())
+        loader.set_cursor({'version': '24-1-1', 'submitted': 1700000000, 'id': 'r1'}, 1)
+        self.assertEqual(load_all(loader, 1, offset=1), expected[1:])
+
+    def test_build_same_as_sqlite(self):
+        profile = create_profile(create_parquet_db(self.path))
+
+        parquet_writer = DuckDbWriter(':memory:', profile.target_table, debugger=profile.debugger)
+        parquet_writer.close = lambda: None
+        DatabaseBuilder(profile).run(writer=parquet_writer)
+
+        scan_writer = DuckDbWriter(':memory:', profile.target_table, debugger=profile.debugger)
+        scan_writer.close = lambda: None
+        counts = DuckDbScanBuilder(profile).run(scan_writer)
+        self.assertEqual(counts.counters, {'fetched': 3, '24-1-1': 2, '24-2-1': 1})
+
+        sqlite_writer = DuckDbWriter(':memory:', profile.target_table, debugger=profile.debugger)
+        sqlite_writer.close = lambda: None
+        FakeAttachScanBuilder(self.sqlite_profile).run(sqlite_writer)
+
+        expected = fetch_table(sqlite_writer)
+        self.assertEqual(fetch_table(parquet_writer), expected)
+        self.assertEqual(fetch_table(scan_writer), expected)
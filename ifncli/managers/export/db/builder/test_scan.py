@@ -0,0 +1,86 @@
+import json
+import unittest
+
+from ..exporter import ExportSqlite
+from ..compress import Compressor
+from .builder import DatabaseBuilder, DuckDbWriter, SourceDbDataLoader
+from .profile import BuilderProfile
+from .scan import DuckDbScanBuilder, ProjectionPlanner, SOURCE_ALIAS, CAST_BOOL, CAST_DATE, CAST_JSON
+from .trace import DictWithOrigin
+
+RESPONSES = [
+    {'ID': 'r1', 'submitted': 1700000000, 'version': '24-1-1', 'participantID': 'p1', 'weekly.Q1|1': True, 'weekly.Q2': '{"items":[{"key":"1"},{"key":"3"}]}'},
+    {'ID': 'r2', 'submitted': 1700000100, 'version': '24-1-1', 'participantID': 'p2', 'weekly.Q1|1': False, 'weekly.Q2': {'items':[{'key':'2'}]}},
+    {'ID': 'r3', 'submitted': 1700000200, 'version': '24-2-1', 'participantID': 'p1', 'weekly.Q1|1': True, 'weekly.Q3': 'text'},
+]
+
+class FakeAttachScanBuilder(DuckDbScanBuilder):
+    """
+        Copy source table into duckdb instead of attaching sqlite file (sqlite extension may not be available)
+    """
+    def attach(self, conn):
+        table = self.profile.source_table
+        conn.execute("CREATE SCHEMA {}".format(SOURCE_ALIAS))
+        conn.execute("CREATE TABLE {}.{} (id VARCHAR, submitted BIGINT, version VARCHAR, data BLOB)".format(SOURCE_ALIAS, table))
+        rows = self.profile.source_db.fetch_all("SELECT id, submitted, version, data FROM {}".format(table))
+        conn.executemany("INSERT INTO {}.{} VALUES (?, ?, ?, ?)".format(SOURCE_ALIAS, table), rows)
+
+    def detach(self, conn):
+        conn.execute("DROP SCHEMA {} CASCADE".format(SOURCE_ALIAS))
+
+def create_sqlite_profile():
+    """
+        Build profile of the 'weekly' survey with RESPONSES in an in-memory sqlite export db
+    """
+    db = ExportSqlite(':memory:', allow_create=True)
+    db.setup_meta('|', 'zlib')
+    table_name = db.response_table('weekly')
+    db.setup_response_table('weekly', table_name)
+    compressor = Compressor('zlib')
+    data = [(r['ID'], r['submitted'], r['version'], compressor.compress(bytes(json.dumps(r), 'utf-8'))) for r in RESPONSES]
+    db.execute_many("INSERT INTO {} (id, submitted, version, data) VALUES (?, ?, ?, ?)".format(table_name), data)
+    conf = DictWithOrigin({'survey': 'weekly', 'target_db': ':memory:', 'infer_schema': False, 'schema': {'weekly.Q1|1': 'bool', 'weekly.Q2': 'json'}})
+    profile = BuilderProfile(conf, source_db=db)
+    profile.build()
+    return profile
+
+def fetch_table(writer: DuckDbWriter):
+    cursor = writer.conn.execute("SELECT id, global_id, timestamp, Q1_1, Q2, Q3 FROM pollster_results_weekly ORDER BY id")
+    return cursor.fetchall()
+
+class TestDuckDbScanBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = create_sqlite_profile()
+
+    def fetch_table(self, writer: DuckDbWriter):
+        return fetch_table(writer)
+
+    def fetch_users(self, writer: DuckDbWriter):
+        cursor = writer.conn.execute("SELECT global_id FROM survey_surveyuser ORDER BY global_id")
+        return [row[0] for row in cursor.fetchall()]
+
+    def test_plan(self):
+        planner = ProjectionPlanner()
+        columns = planner.plan(list(RESPONSES[0].keys()), self.profile.select_processors('24-1-1'))
+        plan = dict([(c.key, (c.name, c.cast)) for c in columns])
+        self.assertEqual(plan['ID'], ('id', None))
+        self.assertEqual(plan['submitted'], ('timestamp', CAST_DATE))
+        self.assertEqual(plan['participantID'], ('global_id', None))
+        self.assertEqual(plan['weekly.Q1|1'], ('Q1_1', CAST_BOOL))
+        self.assertEqual(plan['weekly.Q2'], ('Q2', CAST_JSON))
+
+    def test_same_as_pandas_engine(self):
+        scan_writer = DuckDbWriter(':memory:', self.profile.target_table, debugger=self.profile.debugger)
+        scan_writer.close = lambda: None
+        counts = FakeAttachScanBuilder(self.profile).run(scan_writer)
+        self.assertEqual(counts.counters, {'fetched': 3, '24-1-1': 2, '24-2-1': 1})
+
+        pandas_writer = DuckDbWriter(':memory:', self.profile.target_table, debugger=self.profile.debugger)
+        pandas_writer.close = lambda: None
+        loader = SourceDbDataLoader(self.profile, self.profile.source_db.get_meta())
+        DatabaseBuilder(self.profile).import_table(loader, pandas_writer)
+
+        self.assertEqual(self.fetch_table(scan_writer), self.fetch_table(pandas_writer))
+        self.assertEqual(self.fetch_users(scan_writer), ['p1', 'p2'])
+        self.assertEqual(self.fetch_users(scan_writer), self.fetch_users(pandas_writer))
@@ -0,0 +1,120 @@
+import time
+import threading
+import pandas
+
+# Group name used for steps not related to a survey version (like loading a batch)
+GROUP_BATCH = 'batch'
+
+class StepTiming:
+    """
+        Accumulated measures of a step (processor, loader, writer)
+    """
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.memory_delta = 0
+
+    def add(self, elapsed: float, rows_in: int, rows_out: int, memory_delta: int):
+        self.calls += 1
+        self.time += elapsed
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        self.memory_delta += memory_delta
+
+    def merge(self, other: 'StepTiming'):
+        self.calls += other.calls
+        self.time += other.time
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        self.memory_delta += other.memory_delta
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'time': round(self.time, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'memory_delta': self.memory_delta,
+        }
+
+def frame_memory(df)->int:
+    if isinstance(df, pandas.DataFrame):
+        return int(df.memory_usage(deep=True).sum())
+    return 0
+
+def frame_rows(df)->int:
+    if isinstance(df, pandas.DataFrame):
+        return len(df.index)
+    return 0
+
+class BuildTimer:
+    """
+        Collect time, rows and DataFrame memory of each step of the build, grouped by survey version
+        If not enabled, steps are only run
+    """
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.groups: dict[str, dict[str, StepTiming]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, group: str, step: str, elapsed: float, rows_in: int, rows_out: int, memory_delta: int=0):
+        with self.lock:
+            steps = self.groups.setdefault(group, {})
+            if step not in steps:
+                steps[step] = StepTiming()
+            steps[step].add(elapsed, rows_in, rows_out, memory_delta)
+
+    def apply(self, group: str, step: str, func, df: pandas.DataFrame):
+        """
+            Run func(df) and record its measures (func returns a DataFrame)
+        """
+        if not self.enabled:
+            return func(df)
+        rows_in = frame_rows(df)
+        memory_before = frame_memory(df)
+        start = time.perf_counter()
+        result = func(df)
+        elapsed = time.perf_counter() - start
+        self.record(group, step, elapsed, rows_in, frame_rows(result), frame_memory(result) - memory_before)
+        return result
+
+    def load(self, loader, batch_size: int, offset: int):
+        """
+            Run loader.load() and record its measures
+        """
+        if not self.enabled:
+            return loader.load(batch_size, offset)
+        start = time.perf_counter()
+        count_fetched, records = loader.load(batch_size, offset)
+        self.record(GROUP_BATCH, 'loader', time.perf_counter() - start, 0, count_fetched)
+        return count_fetched, records
+
+    def write(self, group: str, writer, df: pandas.DataFrame):
+        """
+            Run writer.append() and record its measures
+        """
+        if not self.enabled:
+            writer.append(df)
+            return
+        start = time.perf_counter()
+        writer.append(df)
+        rows = frame_rows(df)
+        self.record(group, 'writer', time.perf_counter() - start, rows, rows)
+
+    def totals(self):
+        totals: dict[str, StepTiming] = {}
+        for steps in self.groups.values():
+            for step, timing in steps.items():
+                if step not in totals:
+                    totals[step] = StepTiming()
+                totals[step].merge(timing)
+        return totals
+
+    def to_dict(self):
+        d = {}
+        for group, steps in self.groups.items():
+            d[group] = dict([(step, timing.to_dict()) for step, timing in steps.items()])
+        d['total'] = dict([(step, timing.to_dict()) for step, timing in self.totals().items()])
+        return d
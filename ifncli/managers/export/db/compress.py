@@ -3,21 +3,168 @@ from .database import ExportDatabase
 from typing import Optional
 import zlib
 import time
+import threading
 try:
     import zstd
     zstd_available = True
 except ImportError:
     zstd_available = False
+try:
+    import zstandard
+    zstandard_available = True
+except ImportError:
+    zstandard_available = False
+
+# Compressor using a zstd dictionary trained for each survey version
+ZSTD_DICT = 'zstd-dict'
+
+class ZstdDictionaries:
+    """
+        Zstd dictionaries by survey version, used by the 'zstd-dict' compressor
+
+        Responses of a version without dictionary are compressed with plain zstd and kept as samples, once `sample_size` samples
+        are collected a dictionary is trained for the version. New dictionaries are kept in `pending` until saved (see take_pending()).
+        The dictionary id is stored in each zstd frame, decompression selects the dictionary from it (0 for plain zstd).
+    """
+    def __init__(self, level:int=3, dict_size:int=16384, sample_size:int=1000):
+        if not zstandard_available:
+            raise NotImplementedError("Cannot use {}, install `zstandard` package".format(ZSTD_DICT))
+        self.level = level
+        self.dict_size = dict_size
+        self.sample_size = sample_size
+        self.lock = threading.Lock()
+        self.dictionaries: dict[str, 'zstandard.ZstdCompressionDict'] = {} # by version
+        self.by_id: dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self.samples: dict[str, list[bytes]] = {}
+        self.pending: list[tuple[str, int, bytes]] = []
+        # zstandard (de)compressors must not be used concurrently, they are created by thread
+        self.local = threading.local()
+
+    def add(self, version: str, data: bytes):
+        """
+            Register the dictionary of a version
+        """
+        d = zstandard.ZstdCompressionDict(data)
+        self.dictionaries[version] = d
+        self.by_id[d.dict_id()] = d
+        return d
+
+    def take_pending(self):
+        """
+            Returns the dictionaries trained since the last call as (version, dict_id, data)
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        return pending
+
+    def compressor(self, version: Optional[str]):
+        compressors = getattr(self.local, 'compressors', None)
+        if compressors is None:
+            compressors = self.local.compressors = {}
+        c = compressors.get(version)
+        if c is None:
+            if version is None:
+                c = zstandard.ZstdCompressor(level=self.level)
+            else:
+                c = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionaries[version])
+            compressors[version] = c
+        return c
+
+    def decompressor(self, dict_id: int):
+        decompressors = getattr(self.local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self.local.decompressors = {}
+        d = decompressors.get(dict_id)
+        if d is None:
+            if dict_id == 0:
+                d = zstandard.ZstdDecompressor()
+            else:
+                if dict_id not in self.by_id:
+                    raise ValueError("Unknown zstd dictionary {}".format(dict_id))
+                d = zstandard.ZstdDecompressor(dict_data=self.by_id[dict_id])
+            decompressors[dict_id] = d
+        return d
+
+    def compress(self, version: str, value: bytes):
+        if version not in self.dictionaries:
+            self.sample(version, value)
+        if version in self.dictionaries:
+            return self.compressor(version).compress(value)
+        return self.compressor(None).compress(value)
+
+    def sample(self, version: str, value: bytes):
+        with self.lock:
+            if version in self.dictionaries:
+                return
+            samples = self.samples.setdefault(version, [])
+            samples.append(value)
+            if len(samples) < self.sample_size:
+                return
+            del self.samples[version]
+            self.train(version, samples)
+
+    def train(self, version: str, samples: list[bytes]):
+        """
+            Train the dictionary of a version from samples, returns False if training failed
+        """
+        try:
+            trained = zstandard.train_dictionary(self.dict_size, samples, level=self.level)
+        except zstandard.ZstdError as e:
+            print("Unable to train zstd dictionary for version {}: {}".format(version, e))
+            return False
+        data = trained.as_bytes()
+        d = self.add(version, data)
+        self.pending.append((version, d.dict_id(), data))
+        return True
+
+    def compress_plain(self, value: bytes):
+        """
+            Compress without dictionary (version unknown)
+        """
+        return self.compressor(None).compress(value)
+
+    def decompress(self, value: bytes):
+        dict_id = zstandard.get_frame_parameters(value).dict_id
+        return self.decompressor(dict_id).decompress(value)
 
 class Compressor:
 
     def __init__(self, compressor: str) -> None:
+        self.dictionaries: Optional[ZstdDictionaries] = None
         (compress, decompress) = self.compressor_from_name(compressor)
         if compress is None or decompress is None:
             raise ValueError("Unknown compressor '{}'".format(compressor))
         self.compress = compress
         self.decompress = decompress
         self.name = compressor
+
+    def compress_version(self, version: str, value: bytes):
+        """
+            Compress a response of a survey version (dictionary compressor uses the dictionary of the version)
+        """
+        if self.dictionaries is not None:
+            return self.dictionaries.compress(version, value)
+        return self.compress(value)
+
+    def compress_batch(self, versions: list[str], values: list[bytes]):
+        """
+            Compress the responses of a page (versions[i] is the survey version of values[i])
+        """
+        if self.dictionaries is not None:
+            compress = self.dictionaries.compress
+            return [compress(version, value) for version, value in zip(versions, values)]
+        compress = self.compress
+        return [compress(value) for value in values]
+
+    def load_dictionaries(self, db: ExportDatabase, survey_key: str):
+        """
+            Load dictionaries of a survey from the export database (only for dictionary compressor)
+        """
+        if self.dictionaries is None:
+            return
+        for (version, dict_id, data) in db.get_compress_dicts(survey_key):
+            self.dictionaries.add(version, data)
     
     def compressor_from_name(self, compressor:str):
         compress = None
@@ -37,12 +184,24 @@ class Compressor:
                 decompress = zstd.decompress # type: ignore
             else:
                 raise NotImplementedError("Cannot use zstd not available, install `zstd` package")
+        if compressor == ZSTD_DICT:
+            self.dictionaries = ZstdDictionaries()
+            compress = lambda x: self.dictionaries.compress_plain(x)
+            decompress = self.dictionaries.decompress
         if compressor == 'none':
             func = lambda x: x
             compress = func
             decompress = func
         return (compress, decompress)
 
+def load_compressor(db: ExportDatabase, name: str, survey_key: str):
+    """
+        Create the compressor `name` used by the export database, with its dictionaries for the survey
+    """
+    compressor = Compressor(name)
+    compressor.load_dictionaries(db, survey_key)
+    return compressor
+
 class Evaluator:
     def __init__(self, compressor: Compressor) -> None:
         self.size = 0
@@ -50,9 +209,9 @@ class Evaluator:
         self.name = compressor.name
         self.compressor = compressor
 
-    def compress(self, value):
+    def compress(self, value, version: str):
         start = time.perf_counter_ns()
-        z = self.compressor.compress(value)
+        z = self.compressor.compress_version(version, value)
         end = time.perf_counter_ns()
         self.size += len(z)
         self.time += end - start
@@ -69,25 +228,49 @@ class CompressEvaluator:
         
         table = self.db.response_table(survey)
 
+        meta = self.db.get_meta()
+        source = load_compressor(self.db, meta.compressor, survey)
+
         cc = ['zlib', 'zlib-1', 'zlib-3']
         if zstd_available:
             cc.append('zstd')
         else:
             print("`ztsd` not available")
+        if zstandard_available:
+            cc.append(ZSTD_DICT)
+        else:
+            print("`zstandard` not available, {} not evaluated".format(ZSTD_DICT))
         evaluators = []
         for name in cc:
-            evaluators.append(Evaluator(Compressor(name)))
-        for row in self.db.fetch_all("select data from {}".format(table)):
-            json = bytes(row[0], 'utf-8')
+            evaluator = Evaluator(Compressor(name))
+            if evaluator.compressor.dictionaries is not None:
+                self.train(evaluator.compressor.dictionaries, table, source)
+            evaluators.append(evaluator)
+        for row in self.db.fetch_all("select data, version from {}".format(table)):
+            json = source.decompress(row[0])
             size = len(json)
             total_size += size
             for compressor in evaluators:
-                compressor.compress(json)
+                compressor.compress(json, row[1])
         print("Total size {}".format(total_size))
+        if total_size == 0:
+            return
         for compressor in evaluators:
             percent = 100 * compressor.size / total_size
             print("{} {} {:.2f}% {:.2f}ms".format(compressor.name, compressor.size, percent, compressor.time/1000000))
 
+    def train(self, dictionaries: ZstdDictionaries, table: str, source: Compressor):
+        """
+            Train dictionaries of each version on its first responses (like the exporter does)
+        """
+        start = time.perf_counter_ns()
+        versions = [row[0] for row in self.db.fetch_all("select distinct version from {}".format(table))]
+        for version in versions:
+            rows = self.db.fetch_all("select data from {} where version=? order by submitted limit ?".format(table), (version, dictionaries.sample_size))
+            dictionaries.train(version, [source.decompress(row[0]) for row in rows])
+        dictionaries.take_pending()
+        print("{}: {} dictionaries trained for {} versions in {:.2f}ms".format(ZSTD_DICT, len(dictionaries.dictionaries), len(versions), (time.perf_counter_ns() - start)/1000000))
+
 def get_best_compressor_available():
     if zstd_available:
         return 'zstd'
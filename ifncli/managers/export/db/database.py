@@ -3,9 +3,29 @@
 # The export database is an intermediate database containing row data export and survey info
 # It aims at synchronizing data download from the platform
 
+import os
 from ....utils.sqlite import SqliteDb
 from typing import Optional
 
+# Raw data stores of a survey (parquet store is in parquet.py, it needs duckdb)
+RAW_STORE_SQLITE = 'sqlite'
+RAW_STORE_PARQUET = 'parquet'
+
+RAW_STORES = [RAW_STORE_SQLITE, RAW_STORE_PARQUET]
+
+def resolve_store_path(db_path: str, path: str):
+    """
+        Path of a store is relative to the export database directory
+    """
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), path)
+
+def default_store_path(db_path: str):
+    name, _ = os.path.splitext(os.path.basename(db_path))
+    return name + '_parquet'
+
+
 class ExportMeta:
 
     def __init__(self, key_separator:str, compressor: str=''):
@@ -23,6 +43,12 @@ class ExportDatabase(SqliteDb):
 
     def import_log_table(self):
         return "import_log"
+
+    def compress_dict_table(self):
+        return "compress_dict"
+
+    def raw_store_table(self):
+        return "raw_store"
     
     def response_table(self, survey_key):
         table_name = "responses_{survey_key}".format(survey_key=survey_key)
@@ -43,6 +69,42 @@ class ExportDatabase(SqliteDb):
         """
         return self.fetch_all("select version, data from survey_info where survey=:survey", {"survey": survey_key})
         
+    def get_import_log(self, survey_key:str, after_time:int=0):
+        """
+            Get export windows (time, start, end) imported for a survey after a given time
+            start (or end) is 0 if the window had no lower (or upper) bound
+        """
+        if not self.table_exists(self.import_log_table()):
+            return []
+        query = 'select "time", "start", "end" from {} where survey_key=:survey and "time" > :after'.format(self.import_log_table())
+        return self.fetch_all(query, {"survey": survey_key, "after": after_time})
+
+    def get_last_import_time(self, survey_key:str)->Optional[int]:
+        if not self.table_exists(self.import_log_table()):
+            return None
+        r = self.fetch_one('select max("time") from {} where survey_key=:survey'.format(self.import_log_table()), {"survey": survey_key})
+        if r is None:
+            return None
+        return r[0]
+
+    def get_compress_dicts(self, survey_key:str):
+        """
+            Get compression dictionaries (version, dict_id, data) of a survey (for 'zstd-dict' compressor)
+        """
+        table_name = self.compress_dict_table()
+        if not self.table_exists(table_name):
+            return []
+        return self.fetch_all("select version, dict_id, data from {} where survey=:survey".format(table_name), {"survey": survey_key})
+
+    def get_raw_store(self, survey_key:str)->Optional[tuple[str, str]]:
+        """
+            Get the raw store (type, path) of a survey if responses are not in the response table of this database
+        """
+        table_name = self.raw_store_table()
+        if not self.table_exists(table_name):
+            return None
+        return self.fetch_one("select type, path from {} where survey=:survey".format(table_name), {"survey": survey_key})
+
     def get_survey_versions(self, survey_key:str):
         """
             Get Survey versions
@@ -0,0 +1,76 @@
+##
+# Encoding of the responses of a page before insertion in the export db (recode, serialize to json and compress)
+import json
+from .compress import Compressor
+try:
+    import orjson
+    json_encode = orjson.dumps
+    json_encoder_name = 'orjson'
+except ImportError:
+    try:
+        import msgspec
+        json_encode = msgspec.json.Encoder().encode
+        json_encoder_name = 'msgspec'
+    except ImportError:
+        _encoder = json.JSONEncoder()
+        json_encode = lambda x: _encoder.encode(x).encode('utf-8')
+        json_encoder_name = 'json'
+
+# Boolean values encoded as string by the API
+BOOLEAN_STRINGS = {'TRUE': True, 'FALSE': False}
+
+# Tokens found in the json of a response if a value is still a boolean string
+BOOLEAN_TOKENS = (b'"TRUE"', b'"FALSE"')
+
+class PageEncoder:
+    """
+        Encode the responses of a page to rows (id, submitted, version, data) of the export db
+
+        'TRUE'/'FALSE' values are recoded to booleans (to reduce space & avoid later transformation). Only keys known to hold
+        boolean strings in a version are recoded, the list of keys of each version is learned from the responses: if the json of
+        a response still contains a boolean string token, all the keys of the response are checked and the list is updated.
+        Only values of top level keys are recoded. An encoder can be shared by the fetching threads (key lists are only extended).
+    """
+    def __init__(self):
+        self.boolean_keys: dict[str, list[str]] = {}
+        self.scans = 0 # Number of responses whose all keys have been checked
+
+    def recode(self, item: dict, keys: list[str]):
+        for key in keys:
+            value = item.get(key)
+            if value is not None and value.__class__ is str and value in BOOLEAN_STRINGS:
+                item[key] = BOOLEAN_STRINGS[value]
+
+    def learn(self, version: str, item: dict):
+        """
+            Recode all the keys of the item, returns True if new boolean keys have been found
+        """
+        self.scans += 1
+        found = [k for k, v in item.items() if v.__class__ is str and v in BOOLEAN_STRINGS]
+        if len(found) == 0:
+            return False
+        keys = self.boolean_keys.setdefault(version, [])
+        known = set(keys)
+        keys.extend([k for k in found if k not in known])
+        self.recode(item, found)
+        return True
+
+    def serialize(self, item: dict):
+        version = item['version']
+        keys = self.boolean_keys.get(version)
+        if keys is not None:
+            self.recode(item, keys)
+        value = json_encode(item)
+        if BOOLEAN_TOKENS[0] in value or BOOLEAN_TOKENS[1] in value:
+            # New boolean keys, or boolean strings in nested values or keys (they are kept)
+            if self.learn(version, item):
+                value = json_encode(item)
+        return value
+
+    def encode(self, items: list[dict], compressor: Compressor):
+        items = list(items)
+        serialize = self.serialize
+        values = [serialize(item) for item in items]
+        versions = [item['version'] for item in items]
+        data = compressor.compress_batch(versions, values)
+        return [(item['ID'], item['submitted'], version, value) for item, version, value in zip(items, versions, data)]
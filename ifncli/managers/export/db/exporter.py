@@ -1,11 +1,78 @@
+import copy
 import json
-from datetime import datetime, timedelta
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from typing import Optional
-from .. import ExportProfile
-from .compress import get_best_compressor_available, Compressor
-from .database import ExportDatabase
+from .. import ExportProfile, ExportPeriods
+from .compress import get_best_compressor_available, Compressor, load_compressor
+from .encoder import PageEncoder
+from .database import ExportDatabase, RAW_STORE_PARQUET, default_store_path, resolve_store_path
+from ....utils.pipeline import Pipeline, PipelineStopped
 
 from influenzanet.api import SurveyResponseJSONPaginated
+from ....api.prefetch import PrefetchPager
+
+class TokenGuard:
+    """
+        Coordinate the API token renewal with the requests of fetch threads (exporters of several surveys share the client)
+        Requests are made under use() (shared), renew() waits for the running requests and holds the new ones while the token is replaced.
+        renew() must not be called under use() by the same thread.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.users = 0
+        self.renewing = False
+
+    @contextmanager
+    def use(self):
+        with self.cond:
+            while self.renewing:
+                self.cond.wait()
+            self.users += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.users -= 1
+                self.cond.notify_all()
+
+    def renew(self, client, within_seconds: int=2):
+        with self.cond:
+            # Another thread may be renewing or have just renewed it
+            while self.renewing:
+                self.cond.wait()
+            if not client.is_token_expired(within_seconds):
+                return
+            self.renewing = True
+            while self.users > 0:
+                self.cond.wait()
+        try:
+            print("Renew API token")
+            client.renew_token()
+        finally:
+            with self.cond:
+                self.renewing = False
+                self.cond.notify_all()
+
+class GuardedPager:
+    """
+        Paginated request fetching each page under the token guard (can be iterated by a prefetch thread)
+    """
+    def __init__(self, pager, guard: TokenGuard):
+        self.pager = pager
+        self.guard = guard
+        self.iterator = None
+
+    def __iter__(self):
+        self.iterator = iter(self.pager)
+        return self
+
+    def __next__(self):
+        with self.guard.use():
+            return next(self.iterator)
 
 def midnight(d:datetime):
     return d.replace(hour=0, minute=0, second=0)
@@ -30,6 +97,33 @@ class ExportSqlite(ExportDatabase):
             self.execute("INSERT INTO {}(id, key_separator, compressor) VALUES (0, ?, ?)".format(meta_table), (key_separator, compressor))
         return self.get_meta()
     
+    def setup_compress_dict(self):
+        table_name = self.compress_dict_table()
+        if not self.table_exists(table_name):
+            query = "CREATE TABLE {table_name} (survey TEXT, version TEXT, dict_id INTEGER, data BLOB, PRIMARY KEY(survey,version))".format(table_name=table_name)
+            self.execute(query)
+
+    def save_compress_dict(self, survey_key:str, version:str, dict_id:int, data:bytes, commit=True):
+        query = "INSERT OR REPLACE INTO {} (survey, version, dict_id, data) VALUES (?, ?, ?, ?)".format(self.compress_dict_table())
+        self.execute(query, (survey_key, version, dict_id, data), commit=commit)
+
+    def setup_raw_store(self, survey_key:str, store_type:str, path:str):
+        """
+            Register the raw store of a survey, a survey cannot change its store once registered
+        """
+        table_name = self.raw_store_table()
+        if not self.table_exists(table_name):
+            self.execute("CREATE TABLE {table_name} (survey TEXT, type TEXT, path TEXT, PRIMARY KEY(survey))".format(table_name=table_name))
+        store = self.get_raw_store(survey_key)
+        if store is not None:
+            if store[0] != store_type:
+                raise ValueError("Raw data of survey '{}' are already stored in '{}', cannot use '{}'".format(survey_key, store[0], store_type))
+            return store
+        if self.table_exists(self.response_table(survey_key)):
+            raise ValueError("Raw data of survey '{}' are already stored in the sqlite database, cannot use '{}'".format(survey_key, store_type))
+        self.execute("INSERT INTO {} (survey, type, path) VALUES (?, ?, ?)".format(table_name), (survey_key, store_type, path))
+        return (store_type, path)
+
     def survey_info_table(self):
         return "survey_info"
 
@@ -39,6 +133,51 @@ class ExportSqlite(ExportDatabase):
             query = "CREATE TABLE {table_name} (survey TEXT, version TEXT, data TEXT, PRIMARY KEY(survey,version))".format(table_name=table_name)
             self.execute(query)
 
+    def setup_response_table(self, survey_key:str, table_name:str, with_indexes: bool=True):
+        """
+            Create the raw response table of a survey if it doesnt exist and ensure the indexes are available
+            with_indexes: if False, secondary indexes are not created (they are expected to be created after a bulk load)
+        """
+        if not self.table_exists(table_name):
+            query = "CREATE TABLE {table_name} (id TEXT, submitted INT, version TEXT, data BLOB, PRIMARY KEY(id))".format(table_name=table_name)
+            self.execute(query)
+            self.register_survey_table(survey_key, table_name, 'raw')
+        if with_indexes:
+            self.create_response_indexes(table_name)
+
+    def response_indexes(self, table_name:str):
+        """
+            Secondary indexes of a response table (name, columns)
+        """
+        return [
+            ("{}_submitted".format(table_name), "submitted"),
+            # Index used by the builder to paginate using keyset (version, submitted, id) cursor
+            ("{}_version_submitted_id".format(table_name), "version, submitted, id"),
+        ]
+
+    def create_response_indexes(self, table_name:str):
+        for (name, columns) in self.response_indexes(table_name):
+            self.execute("CREATE INDEX IF NOT EXISTS {name} ON {table_name}({columns})".format(name=name, table_name=table_name, columns=columns))
+
+    def drop_response_indexes(self, table_name:str):
+        for (name, _) in self.response_indexes(table_name):
+            self.execute("DROP INDEX IF EXISTS {name}".format(name=name))
+
+    def setup_bulk(self, cache_size_mb:int=64, mmap_size_mb:int=256):
+        """
+            Tune the connection for bulk loading: WAL journal, normal synchronous mode, larger page cache and memory mapped io
+        """
+        mode = self.pragma('journal_mode', 'WAL')
+        self.pragma('synchronous', 'NORMAL')
+        self.pragma('cache_size', -1024 * cache_size_mb) # Negative value is in KiB
+        self.pragma('mmap_size', 1024 * 1024 * mmap_size_mb)
+        print("Bulk mode: journal {}, cache {}MB, mmap {}MB".format(mode, cache_size_mb, mmap_size_mb))
+
+    def is_empty(self, table_name:str):
+        if not self.table_exists(table_name):
+            return True
+        return self.fetch_one("SELECT 1 FROM {} LIMIT 1".format(table_name)) is None
+
     def register_survey_table(self, survey, table, table_type):
         table_name = "survey_response_table"
         if not self.table_exists(table_name):
@@ -47,15 +186,53 @@ class ExportSqlite(ExportDatabase):
         query = 'INSERT OR IGNORE INTO {} ("survey", "table", "type") VALUES (?, ?, ?)'.format(table_name)
         self.execute(query, (survey, table, table_type))
 
+class InsertStats:
+    """
+        Throughput of the inserts in the export database
+    """
+    def __init__(self):
+        self.rows = 0
+        self.time = 0.0
+
+    def add(self, rows: int, elapsed: float):
+        self.rows += rows
+        self.time += elapsed
+
+    def show(self, label: str):
+        rate = self.rows / self.time if self.time > 0 else 0
+        print("Inserted %d responses in %.2fs (%d rows/s, %s)" % (self.rows, self.time, rate, label))
+
 class DbExporter:
 
-    def __init__(self, profile:ExportProfile, client, study_key, db_path: str, page_size:int):
+    def __init__(self, profile:ExportProfile, client, study_key, db_path: str, page_size:int, bulk: bool=False, prefetch: int=0, db: Optional[ExportSqlite]=None):
+        """
+            bulk: use bulk mode (tuned sqlite connection, one transaction by period, indexes created after the initial load)
+            prefetch: number of pages fetched in background while a page is encoded and inserted (0 to fetch pages one by one)
+            db: export db shared with the exporters of other surveys (already set up for bulk mode), opened from db_path if None
+        """
         self.profile = profile
         self.client = client
         self.study_key = study_key
-        self.db = ExportSqlite(db_path, allow_create=True)
+        shared_db = db is not None
+        self.db = db if shared_db else ExportSqlite(db_path, allow_create=True)
         self.page_size = page_size
         self.setup_done = False # Flag set once an export round is done, to avoid multiple warning
+        self.token_guard = TokenGuard()
+        self.bulk = bulk
+        self.prefetch = prefetch
+        self.deferred_indexes = False # Secondary indexes of the response table are created after the load
+        self.insert_stats = InsertStats()
+        self.compressor: Optional[Compressor] = None
+        self.encoder = PageEncoder()
+        self.store = None # Parquet raw store (ParquetStore), responses are not in sqlite db if used
+        if profile.raw_store == RAW_STORE_PARQUET:
+            # Parquet store needs duckdb and pandas, only loaded if used
+            from .parquet import ParquetStore
+            path = profile.raw_store_path if profile.raw_store_path is not None else default_store_path(db_path)
+            self.store_path = path
+            self.store = ParquetStore(resolve_store_path(db_path, path))
+        if bulk and not shared_db:
+            self.db.setup_bulk()
         
     def register_import(self, survey_key:str, start_time: Optional[datetime], end_time: Optional[datetime]):
 
@@ -76,6 +253,11 @@ class DbExporter:
         return self.db.response_table(survey_key)
 
     def time_range(self, survey_key:str):
+        if self.store is not None:
+            r = self.store.time_range(survey_key)
+            if r[0] is None:
+                return (None, None)
+            return (datetime.fromtimestamp(r[0]), datetime.fromtimestamp(r[1]))
         table_name = self.survey_response_table(survey_key)
         if not self.db.table_exists(table_name):
             return (None, None)
@@ -87,29 +269,25 @@ class DbExporter:
         end = datetime.fromtimestamp(r[1])
         return (start, end)
 
-    def export(self, start_time: Optional[datetime], end_time: Optional[datetime]):
-        
+    def prepare(self):
+        """
+            Setup the export db for the survey of the profile
+            Returns the insert query and the compressor to use for the responses
+        """
         profile = self.profile
         
         survey_key = profile.survey_key
         
         table_name = self.survey_response_table(survey_key)
         
-        if not self.db.table_exists(table_name):
-            query = "CREATE TABLE {table_name} (id TEXT, submitted INT, version TEXT, data BLOB, PRIMARY KEY(id))".format(table_name=table_name)
-            self.db.execute(query)
-            query = "CREATE INDEX {table_name}_submitted ON {table_name}(submitted)".format(table_name=table_name)
-            self.db.execute(query)
-            self.db.register_survey_table(survey_key, table_name, 'raw')
+        if self.store is not None:
+            self.db.setup_raw_store(survey_key, RAW_STORE_PARQUET, self.store_path)
+        else:
+            self.db.setup_response_table(survey_key, table_name, with_indexes=not self.deferred_indexes)
 
         if not profile.short_keys and not self.setup_done:
             print("/!\\ Disabling Short keys is ignored")
 
-        args = {
-            'short_keys': True,
-            'key_separator': profile.key_separator
-        }
-
         compressor = profile.compressor
 
         if compressor == '':
@@ -122,56 +300,123 @@ class DbExporter:
         if meta.compressor != default_compressor and not self.setup_done:
             print("/!\\ Compressor in export db is already set to '{}' cannot change to '{}'".format(meta.compressor, default_compressor))
 
+        self.setup_done = True
+
+        insert_query = "INSERT OR IGNORE INTO {table_name} (id, submitted, version, data) VALUES (?, ?, ?, ?) ".format(table_name=table_name)
+
+        if self.compressor is None:
+            # Kept for all the periods, dictionary compressor collects samples across periods
+            self.compressor = load_compressor(self.db, meta.compressor, survey_key)
+        if self.compressor.dictionaries is not None:
+            self.db.setup_compress_dict()
+
+        return insert_query, self.compressor
+
+    def check_token(self):
+        """
+            Renew the API token if it's about to expire
+            Can be called from several threads, only one renews the token once the running requests are done
+        """
+        self.token_guard.renew(self.client)
+
+    def encode_page(self, r, compressor: Compressor):
+        """
+            Encode the responses of a page to the rows to insert (TRUE/FALSE are recoded to boolean values to reduce space & avoid later trans)
+        """
+        if self.store is not None:
+            return [self.store.encode_item(item) for item in r]
+        return self.encoder.encode(r, compressor)
+
+    def insert(self, insert_query: str, data: list):
+        """
+            Insert rows of a page, in bulk mode the transaction is committed at the end of the period
+        """
+        start = time.perf_counter()
+        if self.store is not None:
+            # Written to parquet files at the end of the period
+            self.store.append(self.profile.survey_key, data)
+        else:
+            self.save_dictionaries()
+            self.db.execute_many(insert_query, data, commit=not self.bulk)
+        self.insert_stats.add(len(data), time.perf_counter() - start)
+
+    def save_dictionaries(self):
+        """
+            Save the dictionaries trained while encoding pages, before inserting the rows using them
+        """
+        if self.compressor is None or self.compressor.dictionaries is None:
+            return
+        for (version, dict_id, data) in self.compressor.dictionaries.take_pending():
+            print("Trained compression dictionary for version %s (%d bytes)" % (version, len(data)))
+            self.db.save_compress_dict(self.profile.survey_key, version, dict_id, data, commit=not self.bulk)
+
+    def end_period(self, survey_key: str, start_time: Optional[datetime], end_time: Optional[datetime], count: int):
+        """
+            Register the import of a period and commit (the import log is in the same transaction as the rows in bulk mode)
+            With the parquet store, rows of the period are written before
+        """
+        start = time.perf_counter()
+        if self.store is not None:
+            self.store.flush()
+        if count > 0:
+            self.register_import(survey_key, start_time, end_time)
+        self.db.commit()
+        self.insert_stats.add(0, time.perf_counter() - start)
+
+    def fetch_pages(self, start_time: Optional[datetime], end_time: Optional[datetime], compressor: Compressor):
+        """
+            Fetch the responses of a period, yield the rows to insert for each page
+            It doesnt use the export db, so it can run in another thread
+        """
+        args = {
+            'short_keys': True,
+            'key_separator': self.profile.key_separator
+        }
+
         if start_time is not None:
             args['start'] = int(start_time.timestamp())
         if end_time is not None:
             args['end'] = int(end_time.timestamp())
 
-        pager = SurveyResponseJSONPaginated(self.client, page_size=self.page_size, study_key=self.study_key, survey_key=survey_key, **args)
+        pager = SurveyResponseJSONPaginated(self.client, page_size=self.page_size, study_key=self.study_key, survey_key=self.profile.survey_key, **args)
 
-        self.setup_done = True
-
-        compressor = Compressor(meta.compressor)
+        with PrefetchPager(GuardedPager(pager, self.token_guard), self.prefetch) as pages:
+            for r in pages:
+                print("Fetched page %d width %d items" % (r.page, len(r)))
+                if(len(r) == 0):
+                    break
+                yield self.encode_page(r, compressor)
+                self.check_token()
 
-        insert_query = "INSERT OR IGNORE INTO {table_name} (id, submitted, version, data) VALUES (?, ?, ?, ?) ".format(table_name=table_name)
+    def export(self, start_time: Optional[datetime], end_time: Optional[datetime]):
+        """
+            Export responses of a period, returns the number of responses fetched
+        """
+        insert_query, compressor = self.prepare()
 
         inserted_count = 0
-        for r in pager:
-            print("Fetched page %d width %d items" % (r.page, len(r)))
-            if(len(r) == 0):
-                break
-            data = []
-            for item in r:
-                submitted = item['submitted']
-
-                if isinstance(item, dict):
-                    # Recode TRUE/FALSE to boolean values to reduce space & avoid later trans
-                    for k, v in item.items():
-                        if v == 'TRUE':
-                            item[k] = True
-                        if v == 'FALSE':
-                            item[k] = False
-
-                value = bytes(json.dumps(item),'utf-8')
-                value = compressor.compress(value)
-
-                d = (item['ID'], submitted, item['version'], value)
-                data.append(d)
-                inserted_count += 1
+        for data in self.fetch_pages(start_time, end_time, compressor):
             if len(data) > 0:
                 print("Insert %d" % (len(data)))
-                self.db.execute_many(insert_query, data)
+                self.insert(insert_query, data)
+                inserted_count += len(data)
 
-            if self.client.is_token_expired(2):
-                print("Renew API token")
-                self.client.renew_token()
-
-        if inserted_count > 0:
-            self.register_import(survey_key, start_time, end_time)
+        self.end_period(self.profile.survey_key, start_time, end_time, inserted_count)
 
         #if not profile.rename_columns is None:
         #    resp = replace_columns(profile.rename_columns, resp)        
 
+        return inserted_count
+
+    def export_parallel(self, periods: list[tuple[datetime, datetime]], parallel: int):
+        """
+            Export periods concurrently, periods are fetched by `parallel` threads
+            Rows are inserted in the export db by the current thread only (single writer), in the order the pages are received
+            Returns the number of periods exported
+        """
+        export_concurrent([self], [periods], parallel)
+        return len(periods)
+
     def get_start_time(self, now:datetime):
        """
         Get export start time
@@ -182,31 +427,84 @@ class DbExporter:
            return midnight(self.profile.start_time)
        return midnight(max_time)
 
-    def export_all(self, force_start:Optional[datetime]):
-        """"
-            Incrementally export data 
+    def periods(self, start_time: datetime, periods: ExportPeriods):
+        """
+            List of periods (start, end) to export from start_time, using the current size of periods
+        """
+        max_time = self.profile.max_time  
+        now = datetime.now()
+        result = []
+        while start_time < max_time:
+            if start_time > now:
+                # Cannot load data in the future
+                break
+            start_time, end_time, next_start = periods.period(start_time)
+            result.append((start_time, end_time))
+            start_time = next_start
+        return result
+
+    def begin_export(self, force_start:Optional[datetime]):
+        """
+            Start time and periods of an incremental export, indexes are dropped for an initial load in bulk mode
         """
-        period_size = 7 # Number of days to load (> 1)
+        periods = self.profile.export_periods()
         max_time = self.profile.max_time  
         now = datetime.now()
         if force_start is not None:
             start_time = force_start
         else:
             start_time = self.get_start_time(now)
+        periods.seed_from_statistics(self.client, self.study_key, self.profile.survey_key, start_time, min(max_time, now))
+        print("Loading %s data from %s to %s by %d days" % (self.profile.survey_key, start_time, max_time, periods.days ))
+        table_name = self.survey_response_table(self.profile.survey_key)
+        self.insert_stats = InsertStats()
+        if self.bulk and self.store is None and self.db.is_empty(table_name):
+            print("Initial load, indexes will be created after the load")
+            self.db.drop_response_indexes(table_name)
+            self.deferred_indexes = True
+        return start_time, periods
+
+    def end_load(self):
+        """
+            Create the indexes deferred by begin_export(), called even if the export failed
+        """
+        if self.deferred_indexes:
+            self.deferred_indexes = False
+            start = time.perf_counter()
+            self.db.create_response_indexes(self.survey_response_table(self.profile.survey_key))
+            print("Indexes created in %.2fs" % (time.perf_counter() - start))
+
+    def export_all(self, force_start:Optional[datetime], parallel:int=1):
+        """"
+            Incrementally export data 
+            parallel: number of periods fetched concurrently
+            In parallel mode, periods are computed at start, the adaptive size of periods only uses the response statistics
+        """
+        start_time, periods = self.begin_export(force_start)
+        max_time = self.profile.max_time  
+        now = datetime.now()
         # Max download time, if not provided only load one years (prevent infinite loop)
         exported = 0
-        print("Loading %s data from %s to %s by %d days" % (self.profile.survey_key, start_time, max_time, period_size ))
-        while start_time < max_time:
-            if start_time > now:
-                # Cannot load data in the future
-                break
-            end_time = start_time + timedelta(days=period_size - 1)
-            end_time = end_time.replace(hour=23, minute=59)
-            print("> %s - %s" % (start_time, end_time))
-            r = self.export(start_time, end_time)
-            if r is not None:
-                exported += 1
-            start_time = start_time + timedelta(days=period_size)
+        try:
+            if parallel > 1:
+                print("Fetching %d periods concurrently" % (parallel))
+                exported = self.export_parallel(self.periods(start_time, periods), parallel)
+            else:
+                while start_time < max_time:
+                    if start_time > now:
+                        # Cannot load data in the future
+                        break
+                    days = periods.days
+                    start_time, end_time, next_start = periods.period(start_time)
+                    print("> %s - %s" % (start_time, end_time))
+                    r = self.export(start_time, end_time)
+                    if r is not None:
+                        exported += 1
+                    periods.update(r, days)
+                    start_time = next_start
+        finally:
+            self.end_load()
+        self.insert_stats.show('bulk mode' if self.bulk else 'default mode')
         print("%d periods exported" % (exported))
         self.export_info()
             
@@ -236,3 +534,126 @@ class DbExporter:
             versionID = info['versionId']
             query = "INSERT OR {action} INTO {table_name} (survey,version,data) VALUES (?,?,?)".format(table_name=table_name, action=action)
             self.db.execute(query, (survey_key, versionID, json.dumps(info)))
+
+def export_concurrent(exporters: list[DbExporter], periods: list[list[tuple[datetime, datetime]]], parallel: int):
+    """
+        Export the periods of several exporters (one by survey) concurrently, the periods of each exporter are fetched by `parallel` threads
+        Rows are inserted in the export db by the current thread only (single writer), in the order the pages are received
+        Returns the number of responses exported by each exporter
+    """
+    prepared = [exporter.prepare() for exporter in exporters]
+    multiple = len(exporters) > 1
+
+    pipeline = Pipeline(parallel * 2 * len(exporters))
+    pages = pipeline.channel()
+
+    def fetch(task: int, todo: queue.Queue):
+        exporter = exporters[task]
+        _, compressor = prepared[task]
+        while True:
+            try:
+                index, (start_time, end_time) = todo.get_nowait()
+            except queue.Empty:
+                return
+            for data in exporter.fetch_pages(start_time, end_time, compressor):
+                pages.put((task, index, data))
+            # Period is complete
+            pages.put((task, index, None))
+
+    counts = []
+    pending = set()
+    for task, exporter in enumerate(exporters):
+        todo = queue.Queue()
+        for index, period in enumerate(periods[task]):
+            todo.put((index, period))
+            pending.add((task, index))
+        counts.append([0] * len(periods[task]))
+        for n in range(min(parallel, len(periods[task]))):
+            name = "fetch-{}-{}".format(exporter.profile.survey_key, n) if multiple else "fetch-{}".format(n)
+            pipeline.start(name, fetch, task, todo)
+
+    try:
+        while len(pending) > 0:
+            task, index, data = pages.get()
+            exporter = exporters[task]
+            survey_key = exporter.profile.survey_key
+            start_time, end_time = periods[task][index]
+            label = "[%s] " % (survey_key) if multiple else ""
+            if data is None:
+                pending.remove((task, index))
+                print("%s< %s - %s : %d responses" % (label, start_time, end_time, counts[task][index]))
+                exporter.end_period(survey_key, start_time, end_time, counts[task][index])
+                continue
+            if len(data) > 0:
+                print("%sInsert %d (%s - %s)" % (label, len(data), start_time, end_time))
+                exporter.insert(prepared[task][0], data)
+                counts[task][index] += len(data)
+    except PipelineStopped:
+        pass
+    except Exception as e:
+        pipeline.fail(e)
+    try:
+        pipeline.join()
+    except Exception:
+        # Periods are not exported in order, export must be restarted from the first incomplete one
+        for task, exporter in enumerate(exporters):
+            incomplete = [periods[task][index][0] for (t, index) in pending if t == task]
+            if len(incomplete) > 0:
+                first = min(incomplete)
+                label = " of %s" % (exporter.profile.survey_key) if multiple else ""
+                print("/!\\ Export interrupted, periods%s from %s are incomplete, restart with --start-from %s" % (label, first, first.isoformat()))
+        raise
+    return [sum(c) for c in counts]
+
+class MultiSurveyExporter:
+    """
+        Export several surveys concurrently in the same export db
+        Each survey has its own exporter and fetch threads, rows of all the surveys are inserted by a single writer (the current thread) using one connection.
+        As in parallel mode, periods of each survey are computed at start.
+    """
+    def __init__(self, profile:ExportProfile, client, study_key, db_path: str, page_size:int, surveys: list[str], bulk: bool=False, prefetch: int=0):
+        self.db = ExportSqlite(db_path, allow_create=True)
+        if bulk:
+            self.db.setup_bulk()
+        self.bulk = bulk
+        token_guard = TokenGuard() # Surveys share the API client
+        self.exporters: list[DbExporter] = []
+        for survey in surveys:
+            survey_profile = copy.copy(profile)
+            survey_profile.configure_for_survey(survey)
+            exporter = DbExporter(survey_profile, client, study_key, db_path, page_size, bulk=bulk, prefetch=prefetch, db=self.db)
+            exporter.token_guard = token_guard
+            self.exporters.append(exporter)
+
+    def export_all(self, force_start:Optional[datetime], parallel:int=1):
+        """
+            Export all the surveys, parallel is the number of periods fetched concurrently for each survey
+            Returns the number of responses exported by survey
+        """
+        start = time.perf_counter()
+        periods = []
+        for exporter in self.exporters:
+            start_time, export_periods = exporter.begin_export(force_start)
+            periods.append(exporter.periods(start_time, export_periods))
+        print("Fetching %d surveys concurrently (%d fetch threads by survey)" % (len(self.exporters), parallel))
+        try:
+            counts = export_concurrent(self.exporters, periods, parallel)
+        finally:
+            for exporter in self.exporters:
+                exporter.end_load()
+        elapsed = time.perf_counter() - start
+        self.show_summary(periods, counts, elapsed)
+        for exporter in self.exporters:
+            exporter.export_info()
+        return dict(zip([e.profile.survey_key for e in self.exporters], counts))
+
+    def show_summary(self, periods: list[list], counts: list[int], elapsed: float):
+        insert_stats = InsertStats()
+        print("Summary")
+        for exporter, survey_periods, count in zip(self.exporters, periods, counts):
+            insert_stats.add(exporter.insert_stats.rows, exporter.insert_stats.time)
+            print(" - %s: %d periods, %d responses" % (exporter.profile.survey_key, len(survey_periods), count))
+        total = sum(counts)
+        rate = total / elapsed if elapsed > 0 else 0
+        print("Exported %d responses of %d surveys in %.2fs (%d responses/s)" % (total, len(self.exporters), elapsed, rate))
+        insert_stats.show('bulk mode' if self.bulk else 'default mode')
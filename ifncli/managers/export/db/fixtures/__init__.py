@@ -0,0 +1,34 @@
+##
+# Fixtures of the export db tests and benchmarks
+import json
+import os
+
+from ..compress import Compressor
+
+PAGE_WEEKLY = os.path.join(os.path.dirname(__file__), 'page_weekly.json')
+
+def load_page():
+    """
+        Page of weekly responses as returned by the API
+    """
+    with open(PAGE_WEEKLY, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def encode_items_loop(items: list[dict], compressor: Compressor):
+    """
+        Previous implementation of the page encoding (all keys checked and json encoded for each response)
+        Reference for PageEncoder results and timings
+    """
+    data = []
+    for item in items:
+        submitted = item['submitted']
+        if isinstance(item, dict):
+            for k, v in item.items():
+                if v == 'TRUE':
+                    item[k] = True
+                if v == 'FALSE':
+                    item[k] = False
+        value = bytes(json.dumps(item),'utf-8')
+        value = compressor.compress_version(item['version'], value)
+        data.append((item['ID'], submitted, item['version'], value))
+    return data
@@ -0,0 +1,151 @@
+##
+# Parquet raw data store
+# Responses are appended to parquet files partitioned by survey, version and week (hive layout: survey=x/version=y/week=yyyy-mm-dd/)
+# The payload (all keys of a response except ID, submitted and version) is stored in typed maps (key => value),
+# so the schema doesnt depend on the survey and values dont need to be decompressed and parsed from json when loaded.
+import json
+import os
+import duckdb
+import pandas
+from .encoder import BOOLEAN_STRINGS
+from .database import RAW_STORE_SQLITE, RAW_STORE_PARQUET, RAW_STORES, resolve_store_path, default_store_path
+from datetime import datetime, timedelta, timezone
+
+# Payload maps (name, sql type of values), values which are not text, boolean or integer are stored as json text
+PAYLOAD_MAPS = [
+    ('text', 'VARCHAR'),
+    ('flag', 'BOOLEAN'),
+    ('num', 'BIGINT'),
+    ('json', 'VARCHAR'),
+]
+
+# Columns of a row returned by ParquetStore.encode_item()
+ROW_COLUMNS = ['id', 'submitted', 'version'] + [name + suffix for name, _ in PAYLOAD_MAPS for suffix in ['_k', '_v']]
+
+def map_members(expr: str):
+    """
+        Members of the json object of a map expression (without braces, NULL if empty)
+    """
+    return "nullif(CAST(to_json({}) AS VARCHAR)[2:-2], '')".format(expr)
+
+# Sql expression rebuilding the json text of a response from the columns and the payload maps
+# Members of each map are concatenated (faster than merging json objects, keys are distinct), values of json map are already json
+PAYLOAD_JSON = "'{' || concat_ws(',', " + ", ".join([
+    "'\"ID\":' || to_json(id) || ',\"submitted\":' || to_json(submitted) || ',\"version\":' || to_json(version)",
+    map_members("text"),
+    map_members("flag"),
+    map_members("num"),
+    map_members("map_from_entries(list_transform(map_entries(json), e -> {'key': e.key, 'value': CAST(e.value AS JSON)}))"),
+]) + ") || '}'"
+
+def encode_payload(item: dict):
+    """
+        Split the keys of a response in typed maps, returned as lists of keys and values for each map
+        'TRUE'/'FALSE' strings are stored as booleans (like in the sqlite store)
+    """
+    maps = [([], []) for _ in PAYLOAD_MAPS]
+    text, flag, num, other = maps
+    for key, value in item.items():
+        if key == 'ID' or key == 'submitted' or key == 'version':
+            continue
+        if value is None:
+            target = text
+        elif isinstance(value, str):
+            if value in BOOLEAN_STRINGS:
+                target = flag
+                value = BOOLEAN_STRINGS[value]
+            else:
+                target = text
+        elif isinstance(value, bool):
+            target = flag
+        elif isinstance(value, int):
+            target = num
+        else:
+            target = other
+            value = json.dumps(value)
+        target[0].append(key)
+        target[1].append(value)
+    r = []
+    for keys, values in maps:
+        r.append(keys)
+        r.append(values)
+    return r
+
+class ParquetStore:
+    """
+        Append-only parquet store of raw responses
+
+        Rows are buffered and written by flush(), each flush creates new files in the partitions of the rows.
+        The same response can be written several times (exported again), readers keep only one row by id.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = duckdb.connect()
+        self.buffer: list[tuple[str, list]] = []
+
+    def encode_item(self, item: dict):
+        return [item['ID'], item['submitted'], item['version']] + encode_payload(item)
+
+    def append(self, survey_key: str, rows: list):
+        self.buffer.append((survey_key, rows))
+
+    def flush(self):
+        """
+            Write the buffered rows, returns the number of rows written
+        """
+        if len(self.buffer) == 0:
+            return 0
+        frames = []
+        for survey_key, rows in self.buffer:
+            df = pandas.DataFrame(rows, columns=ROW_COLUMNS)
+            df['survey'] = survey_key
+            frames.append(df)
+        page = pandas.concat(frames, ignore_index=True)
+        self.buffer = []
+        maps = ', '.join(["map({n}_k::VARCHAR[], {n}_v::{t}[]) AS {n}".format(n=name, t=sql_type) for name, sql_type in PAYLOAD_MAPS])
+        select = "SELECT id, submitted, version, survey, CAST(date_trunc('week', make_timestamp(submitted * 1000000)) AS DATE) AS week, {} FROM page".format(maps)
+        os.makedirs(self.path, exist_ok=True)
+        self.conn.register('page', page)
+        try:
+            self.conn.execute("COPY ({}) TO '{}' (FORMAT parquet, COMPRESSION zstd, PARTITION_BY (survey, version, week), APPEND)".format(select, self.path.replace("'", "''")))
+        finally:
+            self.conn.unregister('page')
+        return len(page.index)
+
+    def has_data(self, survey_key: str):
+        survey_path = os.path.join(self.path, "survey={}".format(survey_key))
+        for _, _, files in os.walk(survey_path):
+            if any([f.endswith('.parquet') for f in files]):
+                return True
+        return False
+
+    def scan(self, survey_key: str):
+        """
+            Sql table expression reading the files of a survey (version and week are partition columns)
+        """
+        glob = os.path.join(self.path, "survey={}".format(survey_key), "*", "*", "*.parquet")
+        return "read_parquet('{}', hive_partitioning=true, hive_types={{'survey': VARCHAR, 'version': VARCHAR, 'week': DATE}})".format(glob.replace("'", "''"))
+
+    def time_range(self, survey_key: str):
+        if not self.has_data(survey_key):
+            return (None, None)
+        return self.conn.execute("SELECT min(submitted), max(submitted) FROM {}".format(self.scan(survey_key))).fetchone()
+
+def source_query(store: ParquetStore, survey_key: str, conditions: list[str]):
+    """
+        Rows of a survey (id, submitted, version, payload maps) filtered by conditions, with only one row by id
+        Conditions are applied on the parquet scan (pushed down to the files), before removing duplicates
+        Duplicates are removed by (version, id) (a response has only one version), so filters on version of outer queries are still pushed down
+    """
+    where = ''
+    if len(conditions) > 0:
+        where = " WHERE " + " AND ".join(conditions)
+    return "(SELECT DISTINCT ON (version, id) id, submitted, version, text, flag, num, json FROM {}{})".format(store.scan(survey_key), where)
+
+def week_condition(operator: str, time: int):
+    """
+        Condition on the week partition for a time bound (partitions outside the bound are not read)
+    """
+    day = datetime.fromtimestamp(time, timezone.utc).date()
+    monday = day - timedelta(days=day.weekday())
+    return "week {} DATE '{}'".format(operator, monday.isoformat())
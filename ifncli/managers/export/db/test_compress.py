@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .compress import Compressor, CompressEvaluator, load_compressor, zstandard_available, ZSTD_DICT
+from .exporter import ExportSqlite
+
+def responses(version: str, count: int):
+    for i in range(count):
+        r = {'ID': 'r{}-{}'.format(version, i), 'version': version, 'submitted': 1700000000 + i, 'participantID': 'p{}'.format(i % 37)}
+        for q in range(20):
+            r['weekly.Q{}|{}'.format(q, i % 5)] = (i * q) % 7 == 0
+            r['weekly.Q{}.text'.format(q)] = 'answer {}'.format((i + q) % 11)
+        yield bytes(json.dumps(r), 'utf-8')
+
+@unittest.skipUnless(zstandard_available, "zstandard not available")
+class TestZstdDictCompressor(unittest.TestCase):
+
+    def create(self, sample_size: int=50):
+        compressor = Compressor(ZSTD_DICT)
+        compressor.dictionaries.sample_size = sample_size
+        return compressor
+
+    def test_train_by_version(self):
+        compressor = self.create()
+        values = [('1', v) for v in responses('1', 80)] + [('2', v) for v in responses('2', 20)]
+        encoded = [compressor.compress_version(version, value) for version, value in values]
+        pending = compressor.dictionaries.take_pending()
+        self.assertEqual([p[0] for p in pending], ['1'])
+        self.assertEqual(compressor.dictionaries.take_pending(), [])
+        # Once trained, responses are smaller than with the plain compressor
+        self.assertTrue(len(encoded[60]) < len(encoded[10]))
+        for (version, value), data in zip(values, encoded):
+            self.assertEqual(compressor.decompress(data), value)
+
+    def test_load_dictionaries(self):
+        db = ExportSqlite(':memory:', allow_create=True)
+        db.setup_compress_dict()
+        compressor = self.create()
+        encoded = [compressor.compress_version('1', value) for value in responses('1', 80)]
+        for (version, dict_id, data) in compressor.dictionaries.take_pending():
+            db.save_compress_dict('weekly', version, dict_id, data)
+        loaded = load_compressor(db, ZSTD_DICT, 'weekly')
+        self.assertEqual([loaded.decompress(data) for data in encoded], list(responses('1', 80)))
+        # Dictionaries of another survey are not loaded
+        with self.assertRaises(ValueError):
+            load_compressor(db, ZSTD_DICT, 'intake').decompress(encoded[-1])
+
+class TestCompressEvaluator(unittest.TestCase):
+
+    def test_evaluate(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(lambda: shutil.rmtree(path))
+        db_path = os.path.join(path, 'export.db')
+        db = ExportSqlite(db_path, allow_create=True)
+        db.setup_meta('|', 'zlib')
+        table_name = db.response_table('weekly')
+        db.setup_response_table('weekly', table_name)
+        compressor = Compressor('zlib')
+        data = [('r{}'.format(i), i, '1', compressor.compress(value)) for i, value in enumerate(responses('1', 100))]
+        db.execute_many("INSERT INTO {} (id, submitted, version, data) VALUES (?, ?, ?, ?)".format(table_name), data)
+        CompressEvaluator(db_path).evaluate('weekly')
@@ -0,0 +1,40 @@
+import copy
+import json
+import unittest
+
+from .compress import Compressor
+from .encoder import PageEncoder
+from .fixtures import load_page, encode_items_loop
+
+class TestPageEncoder(unittest.TestCase):
+
+    def decode(self, compressor: Compressor, rows: list):
+        return [(row[0], row[1], row[2], json.loads(compressor.decompress(row[3]))) for row in rows]
+
+    def test_same_as_loop(self):
+        page = load_page()
+        compressor = Compressor('zlib')
+        expected = self.decode(compressor, encode_items_loop(copy.deepcopy(page), compressor))
+        encoder = PageEncoder()
+        self.assertEqual(self.decode(compressor, encoder.encode(copy.deepcopy(page), compressor)), expected)
+        self.assertEqual(sorted(encoder.boolean_keys.keys()), ['24-10-1', '24-11-2'])
+        # Keys are learned, next pages dont need to check all the keys
+        encoder.scans = 0
+        self.assertEqual(self.decode(compressor, encoder.encode(copy.deepcopy(page), compressor)), expected)
+        self.assertEqual(encoder.scans, 0)
+
+    def test_recode(self):
+        compressor = Compressor('none')
+        items = [
+            {'ID': '1', 'submitted': 1, 'version': '1', 'Q1': '', 'Q2': 'TRUE'},
+            # Q1 is a boolean key not known yet
+            {'ID': '2', 'submitted': 2, 'version': '1', 'Q1': 'FALSE', 'Q2': 'TRUE'},
+            # Boolean strings in keys, nested values or other texts are kept
+            {'ID': '3', 'submitted': 3, 'version': '1', 'TRUE': 'x', 'Q3': {'items': [{'key': 'TRUE'}]}, 'Q4': 'say "TRUE"', 'Q5': 'x"TRUE'},
+            {'ID': '4', 'submitted': 4, 'version': '2', 'Q1': 'TRUE'},
+        ]
+        expected = self.decode(compressor, encode_items_loop(copy.deepcopy(items), compressor))
+        encoder = PageEncoder()
+        self.assertEqual(self.decode(compressor, encoder.encode(copy.deepcopy(items), compressor)), expected)
+        self.assertEqual(encoder.boolean_keys, {'1': ['Q2', 'Q1'], '2': ['Q1']})
+        self.assertEqual(expected[2][3]['Q3'], {'items': [{'key': 'TRUE'}]})
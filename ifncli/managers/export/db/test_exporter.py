@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from typing import Optional
+
+from .. import ExportProfile
+from .compress import Compressor, load_compressor, zstandard_available, ZSTD_DICT
+from .builder.decoder import register_compressor, decode_rows
+from .exporter import DbExporter, ExportSqlite, MultiSurveyExporter
+from .parquet import ParquetStore, PAYLOAD_JSON
+
+START_TIME = datetime(2024, 1, 1)
+
+class FakeClient:
+    """
+        Management API client returning responses from a list (one response every 6 hours from START_TIME)
+    """
+    def __init__(self, count: int, fail_after: int=0):
+        start = int(START_TIME.timestamp())
+        self.responses = [{'ID': 'r{}'.format(i), 'submitted': start + i * 6 * 3600, 'version': '1', 'Q1': 'TRUE'} for i in range(count)]
+        self.fail_after = fail_after
+        self.calls = 0
+        self.renewed = 0
+        self.in_flight = 0 # Requests running
+        self.renewed_in_flight = 0 # Renewals done while a request was running
+        self.lock = threading.Lock()
+
+    def is_token_expired(self, within_seconds=0):
+        return self.calls % 3 == 0
+
+    def renew_token(self):
+        self.renewed += 1
+        if self.in_flight > 0:
+            self.renewed_in_flight += 1
+
+    def get_survey_responses_json_paginated(self, study_key, survey_key, page, page_size, start, end, **kwargs):
+        with self.lock:
+            self.calls += 1
+            if self.fail_after > 0 and self.calls > self.fail_after:
+                raise ValueError("API failure")
+            self.in_flight += 1
+        try:
+            time.sleep(0.001)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        items = [r for r in self.responses if start <= r['submitted'] <= end]
+        page_count = max(1, (len(items) + page_size - 1) // page_size)
+        return {
+            'pagination': {'page': page, 'page_count': page_count, 'item_count': len(items)},
+            'responses': [dict(r) for r in items[(page - 1) * page_size:page * page_size]],
+        }
+
+class TestDbExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.profile = self.create_profile()
+
+    def create_profile(self, extra: str=''):
+        profile_file = os.path.join(self.path, 'profile.yaml')
+        with open(profile_file, 'w') as f:
+            f.write("survey_key: weekly\nstart_time: '2024-01-01T00:00:00'\nmax_time: '2024-03-01T00:00:00'\ncompressor: zlib\n" + extra)
+        return ExportProfile(profile_file, {'short_keys': True})
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def export(self, name: str, client: FakeClient, parallel: int, bulk: bool=False, compressor: Optional[Compressor]=None, prefetch: int=0):
+        exporter = DbExporter(self.profile, client, 'study', os.path.join(self.path, name), page_size=10, bulk=bulk, prefetch=prefetch)
+        exporter.compressor = compressor
+        exporter.export_all(START_TIME, parallel=parallel)
+        return exporter.db
+
+    def content(self, db: ExportSqlite):
+        rows = db.fetch_all("SELECT id, submitted, version, data FROM responses_weekly ORDER BY id")
+        return rows, self.content_imports(db)
+
+    def content_imports(self, db: ExportSqlite):
+        return db.fetch_all('SELECT survey_key, "start", "end" FROM import_log ORDER BY "start"')
+
+    def test_parallel_same_as_serial(self):
+        serial = self.content(self.export('serial.db', FakeClient(200), 1))
+        client = FakeClient(200)
+        parallel = self.content(self.export('parallel.db', client, 4))
+        self.assertEqual(len(serial[0]), 200)
+        self.assertEqual(parallel, serial)
+        self.assertTrue(client.renewed > 0)
+        self.assertEqual(client.renewed_in_flight, 0)
+
+    def test_parallel_failure(self):
+        with self.assertRaises(ValueError):
+            self.export('failure.db', FakeClient(200, fail_after=5), 3)
+
+    def test_prefetch(self):
+        serial = self.content(self.export('serial.db', FakeClient(200), 1))
+        for parallel in [1, 3]:
+            db = self.export('prefetch{}.db'.format(parallel), FakeClient(200), parallel, prefetch=2)
+            self.assertEqual(self.content(db), serial)
+        with self.assertRaises(ValueError):
+            self.export('failure.db', FakeClient(200, fail_after=5), 1, prefetch=2)
+
+    def test_concurrent_surveys(self):
+        serial = self.content(self.export('serial.db', FakeClient(200), 1))
+        profile_file = os.path.join(self.path, 'multiple.yaml')
+        with open(profile_file, 'w') as f:
+            f.write("surveys: [weekly, intake]\nstart_time: '2024-01-01T00:00:00'\nmax_time: '2024-03-01T00:00:00'\ncompressor: zlib\n")
+        profile = ExportProfile(profile_file, {'short_keys': True})
+        for parallel in [1, 2]:
+            exporter = MultiSurveyExporter(profile, FakeClient(200), 'study', os.path.join(self.path, 'multiple{}.db'.format(parallel)), 10, ['weekly', 'intake'], bulk=True)
+            self.assertEqual(exporter.export_all(START_TIME, parallel=parallel), {'weekly': 200, 'intake': 200})
+            db = exporter.db
+            for survey in ['weekly', 'intake']:
+                rows = db.fetch_all("SELECT id, submitted, version, data FROM responses_{} ORDER BY id".format(survey))
+                imports = db.fetch_all('SELECT survey_key, "start", "end" FROM import_log WHERE survey_key=? ORDER BY "start"', (survey,))
+                self.assertEqual(rows, serial[0])
+                self.assertEqual([r[1:] for r in imports], [r[1:] for r in serial[1]])
+        exporter = MultiSurveyExporter(profile, FakeClient(200, fail_after=5), 'study', os.path.join(self.path, 'failure.db'), 10, ['weekly', 'intake'])
+        with self.assertRaises(ValueError):
+            exporter.export_all(START_TIME)
+
+    def test_adaptive_periods(self):
+        fixed = self.content(self.export('fixed.db', FakeClient(200), 1))
+        # 4 responses by day, periods of 5 days are expected
+        self.profile = self.create_profile("period_target_rows: 20\n")
+        adaptive = self.content(self.export('adaptive.db', FakeClient(200), 1))
+        self.assertEqual(adaptive[0], fixed[0])
+        self.assertEqual(len(fixed[1]), 8)
+        self.assertEqual(len(adaptive[1]), 10)
+
+    def test_bulk_mode(self):
+        serial = self.content(self.export('serial.db', FakeClient(200), 1))
+        for parallel in [1, 3]:
+            db = self.export('bulk{}.db'.format(parallel), FakeClient(200), parallel, bulk=True)
+            self.assertEqual(self.content(db), serial)
+            self.assertEqual(db.fetch_one("PRAGMA journal_mode")[0], 'wal')
+            indexes = [row[0] for row in db.fetch_all("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='responses_weekly'")]
+            for (name, _) in db.response_indexes('responses_weekly'):
+                self.assertIn(name, indexes)
+
+    @unittest.skipUnless(zstandard_available, "zstandard not available")
+    def test_zstd_dict(self):
+        self.profile = self.create_profile("compressor: zstd-dict\n")
+        compressor = Compressor(ZSTD_DICT)
+        compressor.dictionaries.sample_size = 50
+        db = self.export('dict.db', FakeClient(200), 3, compressor=compressor)
+        dicts = db.get_compress_dicts('weekly')
+        self.assertEqual([d[0] for d in dicts], ['1'])
+        rows = db.fetch_all("SELECT data, version, id FROM responses_weekly ORDER BY submitted")
+        self.assertEqual(len(rows), 200)
+        # Rows are decoded with the dictionaries saved in the db, as the builder does
+        register_compressor(ZSTD_DICT, dicts)
+        _, _, decoded, errors = decode_rows(ZSTD_DICT, rows)
+        self.assertEqual(errors, [])
+        self.assertEqual([d[1]['ID'] for d in decoded], [row[2] for row in rows])
+        self.assertTrue(all([d[1]['Q1'] is True for d in decoded]))
+        loaded = load_compressor(db, ZSTD_DICT, 'weekly')
+        self.assertEqual(loaded.decompress(rows[-1][0]), compressor.decompress(rows[-1][0]))
+
+    def test_parquet_store(self):
+        serial = self.content(self.export('serial.db', FakeClient(200), 1))
+        self.profile = self.create_profile("raw_store: parquet\n")
+        for parallel in [1, 3]:
+            name = 'parquet{}.db'.format(parallel)
+            db = self.export(name, FakeClient(200), parallel)
+            self.assertFalse(db.table_exists('responses_weekly'))
+            self.assertEqual(db.get_raw_store('weekly'), ('parquet', 'parquet{}_parquet'.format(parallel)))
+            store = ParquetStore(os.path.join(self.path, 'parquet{}_parquet'.format(parallel)))
+            rows = store.conn.execute("SELECT DISTINCT ON (id) id, submitted, version, {} FROM {} ORDER BY id".format(PAYLOAD_JSON, store.scan('weekly'))).fetchall()
+            self.assertEqual([(r[0], r[1], r[2]) for r in rows], [(r[0], r[1], r[2]) for r in serial[0]])
+            self.assertEqual(json.loads(rows[0][3]), {'ID': 'r0', 'submitted': int(START_TIME.timestamp()), 'version': '1', 'Q1': True})
+            self.assertEqual(self.content_imports(db), serial[1])
+        # Raw store of a survey cannot be changed
+        with self.assertRaises(ValueError):
+            db.setup_raw_store('weekly', 'sqlite', 'x')
+        self.profile = self.create_profile()
+        with self.assertRaises(ValueError):
+            self.export('serial.db', FakeClient(0), 1).setup_raw_store('weekly', 'parquet', 'x')
@@ -0,0 +1,156 @@
+##
+# Streaming export of responses in csv (response:export-bulk with `stream: true` profile entry)
+# The response body is written to the file by chunks as it is downloaded, only the header line is kept in memory to rename the columns
+import gzip
+import os
+import re
+import requests
+from typing import Iterable, Iterator, Optional
+
+# Size of the chunks read from the response body
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def rename_header(response_modifier: dict, header: str):
+    for col in response_modifier:
+        header = re.sub(col, response_modifier[col], header)
+    return header
+
+def iter_response(r: requests.Response, chunk_size: int):
+    try:
+        for chunk in r.iter_content(chunk_size, decode_unicode=True):
+            if chunk:
+                yield chunk
+    finally:
+        r.close()
+
+def get_response_csv_stream(client, study_key: str, survey_key: str, key_separator: str, format: str='wide', short_keys=True, with_meta_infos=None, start=None, end=None, chunk_size: int=STREAM_CHUNK_SIZE)->Optional[Iterator[str]]:
+    """
+        Same request as client.get_response_csv() but returns an iterator on the chunks of the body (None if the request failed)
+    """
+    if client.auth_header is None or client.token is None:
+        raise ValueError('need to login first')
+    params = {"sep": key_separator}
+    if with_meta_infos is not None:
+        params = {**params, **with_meta_infos}
+    if start is not None:
+        params["from"] = int(start)
+    if end is not None:
+        params["until"] = int(end)
+    params["shortKeys"] = "true" if short_keys else "false"
+
+    url = "{}/v1/data/{}/survey/{}/response".format(client.management_api_url, study_key, survey_key)
+    if format == "long":
+        url += "/long-format"
+
+    # Pooled session of the client if available
+    http = getattr(client, 'session', requests)
+    r = http.get(url, headers=client.auth_header, params=params, stream=True)
+    if r.status_code != 200:
+        print(r.content)
+        r.close()
+        return None
+    r.encoding = 'utf-8'
+    return iter_response(r, chunk_size)
+
+class CsvRecordCounter:
+    """
+        Count the records of a csv text received by chunks, line ends inside quoted fields are not counted
+        Escaped quotes ("") close and reopen a quoted field, so they don't change the state
+    """
+    def __init__(self):
+        self.line_ends = 0
+        self.in_quotes = False
+        self.last = ''
+
+    def feed(self, chunk: str):
+        if chunk == '':
+            return
+        pos = 0
+        while True:
+            quote = chunk.find('"', pos)
+            end = len(chunk) if quote < 0 else quote
+            if not self.in_quotes:
+                self.line_ends += chunk.count('\n', pos, end)
+            if quote < 0:
+                break
+            self.in_quotes = not self.in_quotes
+            pos = quote + 1
+        self.last = chunk[-1]
+
+    def records(self):
+        """
+            Number of records, including the header (last line can have no line end)
+        """
+        if self.last == '':
+            return 0
+        if self.last == '\n':
+            return self.line_ends
+        return self.line_ends + 1
+
+def count_csv_rows(text: str):
+    """
+        Number of rows after the header line of a csv text
+    """
+    counter = CsvRecordCounter()
+    counter.feed(text)
+    return max(0, counter.records() - 1)
+
+def open_output(file_name: str, use_gzip: bool, newline: Optional[str]=None):
+    """
+        Open a text file for writing, gzip compressed if use_gzip. Use newline='' for csv to keep the line ends of the text
+    """
+    if use_gzip:
+        return gzip.open(file_name, 'wt', encoding='utf-8', newline=newline)
+    return open(file_name, 'w', encoding='utf-8', newline=newline)
+
+class CsvStreamWriter:
+    """
+        Write a csv text received by chunks to a file, renaming the columns of the header line
+
+        The file is written with a '.part' suffix and renamed once complete, so an interrupted export doesnt leave a truncated file.
+        rows is the number of records after the header (like count_rows(), line ends in quoted fields are not counted)
+    """
+    def __init__(self, file_name: str, rename_columns: Optional[dict]=None, use_gzip: bool=False):
+        self.file_name = file_name
+        self.rename_columns = rename_columns
+        self.use_gzip = use_gzip
+        self.rows = 0
+        self.size = 0 # Number of chars written
+
+    def write(self, chunks: Iterable[str]):
+        part_name = self.file_name + '.part'
+        header = None
+        buffer = ''
+        counter = CsvRecordCounter()
+        try:
+            with open_output(part_name, self.use_gzip, newline='') as f:
+                for chunk in chunks:
+                    counter.feed(chunk)
+                    if header is None:
+                        buffer += chunk
+                        pos = buffer.find('\n')
+                        if pos < 0:
+                            continue
+                        header = buffer[:pos]
+                        chunk = buffer[pos:]
+                        buffer = ''
+                        self.write_header(f, header)
+                    f.write(chunk)
+                    self.size += len(chunk)
+                if header is None and buffer != '':
+                    # Only a header without line end
+                    self.write_header(f, buffer)
+        except BaseException:
+            if os.path.exists(part_name):
+                os.remove(part_name)
+            raise
+        os.replace(part_name, self.file_name)
+        self.rows = max(0, counter.records() - 1)
+        print("File generated at: {}".format(self.file_name))
+        return self.rows
+
+    def write_header(self, f, header: str):
+        if self.rename_columns is not None:
+            header = rename_header(self.rename_columns, header)
+        f.write(header)
+        self.size += len(header)
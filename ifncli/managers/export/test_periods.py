@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime
+
+from . import ExportPeriods, count_rows
+
+class FakeStatsClient:
+
+    def __init__(self, counts):
+        self.counts = counts
+
+    def get_response_statistics(self, study_key, start=None, end=None):
+        return {'surveyResponseCounts': self.counts}
+
+class TestExportPeriods(unittest.TestCase):
+
+    def test_fixed(self):
+        periods = ExportPeriods(7)
+        start, end, next_start = periods.period(datetime(2024, 1, 1))
+        self.assertEqual(end, datetime(2024, 1, 7, 23, 59))
+        self.assertEqual(next_start, datetime(2024, 1, 8))
+        periods.update(10000, 7)
+        self.assertEqual(periods.days, 7)
+
+    def test_adaptive(self):
+        periods = ExportPeriods(7, target_rows=1000, min_days=1, max_days=30)
+        # Peak: 500 responses by day
+        periods.update(3500, 7)
+        self.assertEqual(periods.days, 2)
+        # Quiet, rate is smoothed
+        periods.update(0, 2)
+        self.assertEqual(periods.days, 4)
+        periods.update(0, 4)
+        self.assertEqual(periods.days, 8)
+        periods.update(0, 8)
+        self.assertEqual(periods.days, 16)
+        periods.update(0, 16)
+        self.assertEqual(periods.days, 30)
+
+    def test_adaptive_without_rows(self):
+        periods = ExportPeriods(7, target_rows=1000, max_days=20)
+        periods.update(0, 7)
+        self.assertEqual(periods.days, 14)
+        periods.update(0, 14)
+        self.assertEqual(periods.days, 20)
+
+    def test_seed_from_statistics(self):
+        periods = ExportPeriods(7, target_rows=1000)
+        periods.seed_from_statistics(FakeStatsClient({'weekly': 100}), 'study', 'weekly', datetime(2024, 1, 1), datetime(2024, 1, 11))
+        self.assertEqual(periods.days, 90)
+        periods = ExportPeriods(7, target_rows=1000)
+        periods.seed_from_statistics(FakeStatsClient({'intake': 100}), 'study', 'weekly', datetime(2024, 1, 1), datetime(2024, 1, 11))
+        self.assertEqual(periods.days, 7)
+
+    def test_count_rows(self):
+        self.assertEqual(count_rows("a,b\n1,2\n3,4\n", 'wide'), 2)
+        self.assertEqual(count_rows("a,b\n", 'wide'), 0)
+        self.assertEqual(count_rows('[{"a":1}]', 'json'), 1)
+        self.assertEqual(count_rows('a,b\n1,"x\ny"\n3,"z""\n"', 'wide'), 2)
+        self.assertEqual(count_rows("a,b\n1,2", 'wide'), 1)
+        self.assertEqual(count_rows("", 'wide'), 0)
@@ -0,0 +1,81 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from . import Exporter, ExportProfile, replace_columns, count_rows
+from .stream import CsvStreamWriter
+
+CSV = "ID,weekly.Q1,weekly.Q2\nr1,1,a\nr2,0,b\nr3,1,c\n"
+
+RENAME = {'weekly\\.': ''}
+
+def chunked(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class FakeStreamExporter(Exporter):
+    """
+        Exporter returning the response body from a text (by chunks of chunk_size chars)
+    """
+    def __init__(self, profile: ExportProfile, body: str, chunk_size: int):
+        super(FakeStreamExporter, self).__init__(profile, None, 'study')
+        self.body = body
+        self.chunk_size = chunk_size
+
+    def fetch_stream(self, start_time, end_time):
+        return iter(chunked(self.body, self.chunk_size))
+
+class TestCsvStreamWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self, file_name: str, use_gzip: bool=False):
+        opener = gzip.open if use_gzip else open
+        with opener(file_name, 'rt', encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def test_same_as_replace_columns(self):
+        expected = replace_columns(RENAME, CSV)
+        file_name = os.path.join(self.path, 'out.csv')
+        multiline = 'ID,weekly.Q1\n1,"a\nb"\n2,"say ""x""\n"\n'
+        for body in [CSV, CSV.rstrip('\n'), "ID,weekly.Q1\n", "ID,weekly.Q1", multiline]:
+            for size in [1, 3, 1000]:
+                writer = CsvStreamWriter(file_name, RENAME)
+                rows = writer.write(chunked(body, size))
+                self.assertEqual(self.read(file_name), replace_columns(RENAME, body))
+                self.assertEqual(rows, count_rows(body, 'wide'))
+                self.assertFalse(os.path.exists(file_name + '.part'))
+        self.assertTrue(expected.startswith("ID,Q1,Q2\n"))
+        self.assertEqual(count_rows(multiline, 'wide'), 2)
+
+    def test_gzip(self):
+        file_name = os.path.join(self.path, 'out.csv.gz')
+        CsvStreamWriter(file_name, None, use_gzip=True).write(chunked(CSV, 5))
+        self.assertEqual(self.read(file_name, True), CSV)
+
+    def test_failure_removes_file(self):
+        def failing():
+            yield CSV
+            raise ConnectionError("Connection lost")
+        file_name = os.path.join(self.path, 'out.csv')
+        with self.assertRaises(ConnectionError):
+            CsvStreamWriter(file_name).write(failing())
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_exporter_stream(self):
+        profile_file = os.path.join(self.path, 'profile.yaml')
+        with open(profile_file, 'w') as f:
+            f.write("survey_key: weekly\nstart_time: '2024-01-01T00:00:00'\nstream: true\ngzip: true\nrename_columns:\n  'weekly\\.': ''\n")
+        profile = ExportProfile(profile_file)
+        exporter = FakeStreamExporter(profile, CSV, 4)
+        output = os.path.join(self.path, 'weekly')
+        name = exporter.export(datetime(2024, 1, 1), datetime(2024, 1, 7, 23, 59), output)
+        self.assertEqual(name, 'weekly_responses_2024-01-01-00-00-00_2024-01-07-23-59-00.csv.gz')
+        self.assertEqual(exporter.exported_rows, 3)
+        self.assertEqual(self.read(os.path.join(output, name), True), replace_columns(RENAME, CSV))
@@ -17,5 +17,6 @@ class BasePlugin:
     def get_management_api_class(self):
         """
             Return management api class to allow extension
+            Subclass ifncli.api.session.PooledManagementAPIClient to keep the pooled http session (default class)
         """
         pass
\ No newline at end of file
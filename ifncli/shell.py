@@ -57,6 +57,10 @@ class MyApp(App):
 
     def get_management_api(self):
         return self.appConfigManager.get_management_api()
+
+    def clean_up(self, cmd, result, err):
+        if hasattr(self, 'appConfigManager'):
+            self.appConfigManager.show_api_stats()
     
     def get_platform(self, resources_path=None)->PlatformResources:
         return self.appConfigManager.get_platform(resources_path)
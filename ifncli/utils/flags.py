@@ -0,0 +1,132 @@
+##
+# Expressions and helpers to synchronize participant flags (participants:flags:sync)
+import json
+from typing import Iterable
+
+from .io import read_json
+from .participants import JSON_LINES_EXTENSIONS
+
+# Expression giving the participant id in the study engine context, compared to each id of a group (--pid-expression option)
+PARTICIPANT_ID_EXPRESSION = 'getParticipantID'
+
+# Max number of participants in the condition of one grouped rule
+DEFAULT_GROUP_SIZE = 500
+
+def expr_str(value: str):
+    return {"str": value, "dtype": "str"}
+
+def expr_arg(exp: dict):
+    return {"exp": exp, "dtype": "exp"}
+
+def expr_update_flag(name: str, value:str):
+    return {
+            "name": "UPDATE_FLAG",
+            "data": [
+                expr_str(name),
+                expr_str(value),
+            ]
+            }
+
+def expr_participant_in(ids: list[str], pid_expression: str=PARTICIPANT_ID_EXPRESSION):
+    """
+        Condition true if the participant id is one of ids (or of eq expressions)
+    """
+    pid = {"name": pid_expression}
+    conditions = [{"name": "eq", "data": [expr_arg(pid), expr_str(id)]} for id in ids]
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"name": "or", "data": [expr_arg(c) for c in conditions]}
+
+def expr_grouped_update(ids: list[str], updates: dict, pid_expression: str=PARTICIPANT_ID_EXPRESSION):
+    """
+        Rule updating the flags of the participants with their id in ids
+    """
+    data = [expr_arg(expr_participant_in(ids, pid_expression))]
+    for name, value in updates.items():
+        data.append(expr_arg(expr_update_flag(name, value)))
+    return {"name": "IFTHEN", "data": data}
+
+def diff_flags(current: dict, target: dict):
+    """
+        Flags of target with a value different from the current one (or not set)
+    """
+    update = {}
+    for name, value in target.items():
+        cur_value = current.get(name)
+        if cur_value is None or cur_value != value:
+            update[name] = value
+    return update
+
+def group_updates(to_update: dict[str, dict], group_size: int=DEFAULT_GROUP_SIZE):
+    """
+        Group the participants with identical flags updates
+        Returns a list of (updates, ids) with at most group_size ids, in the order of the first participant of each update set
+    """
+    if group_size < 1:
+        raise ValueError("Group size must be >= 1")
+    groups: dict[tuple, list[str]] = {}
+    for participant_id, updates in to_update.items():
+        key = tuple(sorted(updates.items()))
+        groups.setdefault(key, []).append(participant_id)
+    result = []
+    for key, ids in groups.items():
+        for start in range(0, len(ids), group_size):
+            result.append((dict(key), ids[start:start + group_size]))
+    return result
+
+def count_changes(r: object):
+    """
+        Number of participants changed by the first rule from the response of a rules run (None if unknown)
+    """
+    if isinstance(r, dict) and 'participantStateChangePerRule' in r:
+        return r['participantStateChangePerRule'][0]
+    return None
+
+def read_flags_lines(path: str):
+    """
+        Flags to sync from a json lines file, yields (participant_id, flags) for each line
+        A line is an object {"participantId": id, "flags": {...}} or an array [id, {...}]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if line.strip() == '':
+                continue
+            value = json.loads(line)
+            if isinstance(value, list) and len(value) == 2:
+                participant_id, flags = value
+            elif isinstance(value, dict) and 'participantId' in value:
+                participant_id, flags = value['participantId'], value.get('flags')
+            else:
+                raise ValueError("Invalid flags entry at line %d of %s" % (number, path))
+            yield participant_id, flags
+
+def read_flags_chunks(path: str, chunk_size: int):
+    """
+        Flags to sync by chunks of at most chunk_size participants (participant_id => flags), json lines files are read line by line
+        An id repeated in a chunk keeps its last flags (like load_flags), only the current chunk is kept in memory
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be >= 1")
+    if path.endswith(JSON_LINES_EXTENSIONS):
+        entries = read_flags_lines(path)
+    else:
+        entries = load_flags(path).items()
+    chunk = {}
+    for participant_id, flags in entries:
+        chunk[participant_id] = flags
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = {}
+    if len(chunk) > 0:
+        yield chunk
+
+def load_flags(path: str)->dict:
+    """
+        Flags to sync for each participant, from a json dictionary or a json lines file (read line by line)
+    """
+    if path.endswith(JSON_LINES_EXTENSIONS):
+        return dict(read_flags_lines(path))
+    flags = read_json(path)
+    if not isinstance(flags, dict):
+        raise ValueError("Flags file does not contains a dictionary")
+    return flags
@@ -0,0 +1,108 @@
+import json
+import os
+from typing import Optional
+
+class DoneJournal:
+    """
+        Append-only journal of the participants done by a command, with the result of each one
+
+        The file has one json array [participant_id, result] by line, lines are flushed when appended and synced to disk every `sync_every` lines.
+        compact() rewrites the file with only the last entry of each participant.
+
+        Previous formats are read and converted to the journal when opened:
+         - json dictionary participant_id => result (done file of study:rules:bulk)
+         - text file with one participant id by line (done file of study:custom-rules), the result is None
+    """
+    def __init__(self, path: str, sync_every: int=100):
+        self.path = path
+        self.sync_every = sync_every
+        self.entries: dict[str, object] = {}
+        self.file = None
+        self.pending = 0 # Lines written since the last sync
+        self.converted = None # Format converted to journal (if any)
+        if os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        start = content.lstrip()[:1]
+        if start == '' or start == '[':
+            self.load_lines(content)
+            return
+        if start == '{':
+            self.entries = json.loads(content)
+            self.converted = 'json'
+        else:
+            for line in content.splitlines():
+                pid = line.strip()
+                if pid != '':
+                    self.entries[pid] = None
+            self.converted = 'text'
+        self.compact()
+
+    def load_lines(self, content: str):
+        lines = content.splitlines()
+        for index, line in enumerate(lines):
+            if line.strip() == '':
+                continue
+            try:
+                pid, result = json.loads(line)
+            except ValueError:
+                if index == len(lines) - 1:
+                    # Last line partially written (interrupted), the participant will be done again
+                    print("Ignoring incomplete last line of %s" % (self.path))
+                    continue
+                raise ValueError("Invalid line %d in journal %s" % (index + 1, self.path))
+            self.entries[pid] = result
+
+    def __contains__(self, pid: str):
+        return pid in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ids(self)->set[str]:
+        return set(self.entries.keys())
+
+    def append(self, pid: str, result: Optional[object]=None):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps([pid, result]) + "\n")
+        self.file.flush()
+        self.entries[pid] = result
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def compact(self):
+        """
+            Rewrite the journal with one line by participant (replaced atomically)
+        """
+        self.close()
+        if len(self.entries) == 0 and not os.path.exists(self.path):
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for pid, result in self.entries.items():
+                f.write(json.dumps([pid, result]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
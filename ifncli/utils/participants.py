@@ -0,0 +1,102 @@
+import json
+from collections import OrderedDict
+from typing import Container, Iterable, Optional
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# Number of the last distinct ids remembered to remove duplicates
+DEDUPE_WINDOW = 100000
+
+def read_pid_lines(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.strip()
+
+def read_pid_json_lines(path: str):
+    """
+        Participant ids from a json lines file, each line is a string, an array with the id as first element (like a done journal)
+        or an object with a `participantId` or `id` field
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if line.strip() == '':
+                continue
+            value = json.loads(line)
+            if isinstance(value, list) and len(value) > 0:
+                value = value[0]
+            elif isinstance(value, dict):
+                value = value.get('participantId', value.get('id'))
+            if not isinstance(value, str):
+                raise ValueError("No participant id at line %d of %s" % (number, path))
+            yield value
+
+def read_pid_json(path: str, json_keys: bool=False, json_values: bool=False):
+    """
+        Participant ids from a json list, or from the keys or the values of a json dictionary (the document is loaded at once)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if not json_keys and not json_values:
+            raise Exception("Participant json dictionary must have either --pid-json-keys or --pid-json-values options")
+        if json_keys:
+            return data.keys()
+        return data.values()
+    raise Exception("participant json file must be a dictionary or a list")
+
+class ParticipantSource:
+    """
+        Participant ids from a list or a file (text with one id by line, json or json lines), yielded lazily
+
+        Ids are stripped, empty ones are skipped, duplicates and ids in `exclude` are removed.
+        Text and json lines files are read line by line, only the last `dedupe_window` distinct ids are kept in memory
+        (a duplicate further in the list is not removed, None keeps all the ids).
+        Counters are available once iterated.
+    """
+    def __init__(self, ids: Optional[Iterable[str]]=None, path: Optional[str]=None, json_keys: bool=False, json_values: bool=False, exclude: Optional[Container[str]]=None, dedupe_window: Optional[int]=DEDUPE_WINDOW):
+        if (ids is None) == (path is None):
+            raise ValueError("Participant source needs either ids or a file path")
+        self.ids = ids
+        self.path = path
+        self.json_keys = json_keys
+        self.json_values = json_values
+        self.exclude = exclude if exclude is not None else set()
+        self.dedupe_window = dedupe_window
+        self.loaded = 0
+        self.duplicates = 0
+        self.excluded = 0
+        self.kept = 0
+
+    def read(self):
+        if self.ids is not None:
+            return self.ids
+        if self.path.endswith('.json'):
+            return read_pid_json(self.path, self.json_keys, self.json_values)
+        if self.path.endswith(JSON_LINES_EXTENSIONS):
+            return read_pid_json_lines(self.path)
+        return read_pid_lines(self.path)
+
+    def __iter__(self):
+        # The oldest id is forgotten when the window is full
+        seen: OrderedDict[str, None] = OrderedDict()
+        for pid in self.read():
+            pid = pid.strip()
+            if pid == '':
+                continue
+            self.loaded += 1
+            if pid in seen:
+                self.duplicates += 1
+                continue
+            seen[pid] = None
+            if self.dedupe_window is not None and len(seen) > self.dedupe_window:
+                seen.popitem(last=False)
+            if pid in self.exclude:
+                self.excluded += 1
+                continue
+            self.kept += 1
+            yield pid
+
+    def show(self):
+        print(" Participants loaded : %d (duplicates %d, excluded %d), kept : %d" % (self.loaded, self.duplicates, self.excluded, self.kept))
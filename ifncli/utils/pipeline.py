@@ -0,0 +1,82 @@
+import threading
+import queue
+
+# Marker sent through a channel when the producer has no more items
+END = object()
+
+class PipelineStopped(Exception):
+    """
+        Raised in a stage when the pipeline has been stopped (error in another stage)
+    """
+    pass
+
+class Channel:
+    """
+        Bounded queue between two stages of a pipeline
+        put() blocks when the queue is full (backpressure), both put() and get() give up if the pipeline is stopped
+    """
+    def __init__(self, size: int, stop: threading.Event):
+        self.queue = queue.Queue(maxsize=size)
+        self.stop = stop
+
+    def put(self, item):
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self):
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def close(self):
+        self.put(END)
+
+class Pipeline:
+    """
+        Run stages in threads, connected by bounded channels
+        If a stage fails the whole pipeline is stopped and the first error is raised by join()
+    """
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.threads: list[threading.Thread] = []
+        self.errors: list[Exception] = []
+
+    def channel(self):
+        return Channel(self.queue_size, self.stop)
+
+    def start(self, name: str, func, *args):
+        """
+            Start a stage in a thread
+        """
+        thread = threading.Thread(target=self.run, name=name, args=(func, args), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def run(self, func, args):
+        try:
+            func(*args)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            self.fail(e)
+
+    def fail(self, e: Exception):
+        self.errors.append(e)
+        self.stop.set()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if len(self.errors) > 0:
+            raise self.errors[0]
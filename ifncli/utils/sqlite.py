@@ -16,7 +16,9 @@ class SqliteDb:
             db_exists = os.path.exists(db_path)
         else:
             db_exists = False 
-        self.db = sqlite3.connect(db_path)
+        self.db_path = db_path
+        # Connection can be handed over to another thread (e.g. a pipeline stage), but must not be used concurrently
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
         if not db_exists and not allow_create:
             raise DbError("Database '%s' doesnt exists" % (db_path))
         self.setup(not db_exists)
@@ -64,6 +66,18 @@ class SqliteDb:
 
     def cursor(self):
         return self.db.cursor()
+
+    def commit(self):
+        self.db.commit()
+
+    def pragma(self, name: str, value):
+        """
+            Set a pragma value, returns the value reported by sqlite (if any)
+        """
+        r = self.fetch_one("PRAGMA {}={}".format(name, value))
+        if r is None:
+            return None
+        return r[0]
     
     def is_sqlite_version_greater(self, version: tuple[int, int]):
         sqlite_version = sqlite3.sqlite_version_info
@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .flags import diff_flags, group_updates, expr_grouped_update, expr_participant_in, count_changes, load_flags, read_flags_chunks
+
+class TestFlags(unittest.TestCase):
+
+    def test_diff(self):
+        self.assertEqual(diff_flags({'a': '1', 'b': '2'}, {'a': '1', 'b': '3', 'c': '0'}), {'b': '3', 'c': '0'})
+        self.assertEqual(diff_flags({'a': '1'}, {'a': '1'}), {})
+
+    def test_group(self):
+        to_update = {
+            'p1': {'a': '1', 'b': '2'},
+            'p2': {'c': '0'},
+            'p3': {'b': '2', 'a': '1'},
+            'p4': {'a': '1', 'b': '2'},
+        }
+        groups = group_updates(to_update)
+        self.assertEqual(groups, [({'a': '1', 'b': '2'}, ['p1', 'p3', 'p4']), ({'c': '0'}, ['p2'])])
+        groups = group_updates(to_update, group_size=2)
+        self.assertEqual([ids for _, ids in groups], [['p1', 'p3'], ['p4'], ['p2']])
+        with self.assertRaises(ValueError):
+            group_updates(to_update, group_size=0)
+
+    def test_expression(self):
+        cond = expr_participant_in(['p1'], 'pid')
+        self.assertEqual(cond, {"name": "eq", "data": [{"exp": {"name": "pid"}, "dtype": "exp"}, {"str": "p1", "dtype": "str"}]})
+        rule = expr_grouped_update(['p1', 'p2'], {'a': '1', 'b': '2'}, 'pid')
+        self.assertEqual(rule['name'], 'IFTHEN')
+        self.assertEqual(len(rule['data']), 3)
+        condition = rule['data'][0]['exp']
+        self.assertEqual(condition['name'], 'or')
+        self.assertEqual([c['exp']['data'][1]['str'] for c in condition['data']], ['p1', 'p2'])
+        update = rule['data'][2]['exp']
+        self.assertEqual(update, {"name": "UPDATE_FLAG", "data": [{"str": "b", "dtype": "str"}, {"str": "2", "dtype": "str"}]})
+
+    def test_changes(self):
+        self.assertEqual(count_changes({'participantStateChangePerRule': [3]}), 3)
+        self.assertIsNone(count_changes(None))
+
+class TestLoadFlags(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name: str, content: str):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_json_lines(self):
+        path = self.write('flags.jsonl', '{"participantId": "p1", "flags": {"a": "1"}}\n\n["p2", {"b": "2"}]\n')
+        self.assertEqual(load_flags(path), {'p1': {'a': '1'}, 'p2': {'b': '2'}})
+        path = self.write('bad.jsonl', '{"id": "p1"}\n')
+        with self.assertRaises(ValueError):
+            load_flags(path)
+
+    def test_json(self):
+        path = self.write('flags.json', json.dumps({'p1': {'a': '1'}}))
+        self.assertEqual(load_flags(path), {'p1': {'a': '1'}})
+        path = self.write('list.json', json.dumps(['p1']))
+        with self.assertRaises(ValueError):
+            load_flags(path)
+
+    def test_chunks(self):
+        path = self.write('flags.jsonl', '["p1", {"a": "1"}]\n["p1", {"a": "2"}]\n["p2", {"a": "1"}]\n["p3", {"b": "1"}]\n["p2", {}]\n')
+        self.assertEqual(list(read_flags_chunks(path, 2)), [{'p1': {'a': '2'}, 'p2': {'a': '1'}}, {'p3': {'b': '1'}, 'p2': {}}])
+        path = self.write('flags.json', json.dumps({'p1': {'a': '1'}, 'p2': {}, 'p3': {}}))
+        self.assertEqual([list(chunk.keys()) for chunk in read_flags_chunks(path, 2)], [['p1', 'p2'], ['p3']])
+        with self.assertRaises(ValueError):
+            list(read_flags_chunks(path, 0))
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .journal import DoneJournal
+
+class TestDoneJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file = os.path.join(self.path, 'rules.json.done')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def lines(self):
+        with open(self.file, 'r') as f:
+            return [json.loads(line) for line in f]
+
+    def test_append_and_resume(self):
+        with DoneJournal(self.file, sync_every=2) as journal:
+            journal.append('p1', {'participantStateChangePerRule': [1]})
+            journal.append('p2', {'error': 'failed'})
+            journal.append('p1', {'participantStateChangePerRule': [0]})
+            self.assertEqual(journal.pending, 1)
+        self.assertEqual(len(self.lines()), 3)
+        journal = DoneJournal(self.file)
+        self.assertIsNone(journal.converted)
+        self.assertEqual(journal.ids(), {'p1', 'p2'})
+        self.assertEqual(journal.entries['p1'], {'participantStateChangePerRule': [0]})
+        journal.compact()
+        self.assertEqual(self.lines(), [['p1', {'participantStateChangePerRule': [0]}], ['p2', {'error': 'failed'}]])
+
+    def test_incomplete_last_line(self):
+        with open(self.file, 'w') as f:
+            f.write('["p1", null]\n["p2", {"err')
+        journal = DoneJournal(self.file)
+        self.assertEqual(journal.ids(), {'p1'})
+        with open(self.file, 'w') as f:
+            f.write('["p1", null]\n["p2", {"err\n["p3", null]\n')
+        with self.assertRaises(ValueError):
+            DoneJournal(self.file)
+
+    def test_previous_formats(self):
+        with open(self.file, 'w') as f:
+            json.dump({'p1': {'error': 'x'}, 'p2': None}, f)
+        journal = DoneJournal(self.file)
+        self.assertEqual(journal.converted, 'json')
+        self.assertEqual(self.lines(), [['p1', {'error': 'x'}], ['p2', None]])
+        journal.append('p3')
+        journal.close()
+        self.assertEqual(DoneJournal(self.file).ids(), {'p1', 'p2', 'p3'})
+
+        with open(self.file, 'w') as f:
+            f.write("p1\np2\n\n")
+        journal = DoneJournal(self.file)
+        self.assertEqual(journal.converted, 'text')
+        self.assertEqual(journal.ids(), {'p1', 'p2'})
+        self.assertEqual(self.lines(), [['p1', None], ['p2', None]])
+
+    def test_no_file(self):
+        journal = DoneJournal(self.file)
+        self.assertEqual(len(journal), 0)
+        journal.compact()
+        self.assertFalse(os.path.exists(self.file))
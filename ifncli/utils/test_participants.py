@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from .participants import ParticipantSource
+
+class TestParticipantSource(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name: str, content: str):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_formats(self):
+        expected = ['p1', 'p2', 'p3']
+        sources = [
+            ParticipantSource(ids=' p1, p2,p3,p1'.split(',')),
+            ParticipantSource(path=self.write('pids.txt', "p1\n p2 \n\np3\np2\n")),
+            ParticipantSource(path=self.write('pids.json', json.dumps(['p1', 'p2', 'p3']))),
+            ParticipantSource(path=self.write('dict.json', json.dumps({'p1': 'a', 'p2': 'b', 'p3': 'c'})), json_keys=True),
+            ParticipantSource(path=self.write('values.json', json.dumps({'a': 'p1', 'b': 'p2', 'c': 'p3'})), json_values=True),
+            ParticipantSource(path=self.write('pids.jsonl', '"p1"\n["p2", {"error": "x"}]\n{"participantId": "p3"}\n\n{"id": "p1"}\n')),
+        ]
+        for source in sources:
+            self.assertEqual(list(source), expected)
+            self.assertEqual(source.kept, 3)
+
+    def test_exclude_and_counters(self):
+        source = ParticipantSource(path=self.write('pids.txt', "p1\np2\np3\np2\np4\n"), exclude={'p3', 'p4'})
+        pids = iter(source)
+        self.assertEqual(next(pids), 'p1')
+        # File is read lazily
+        self.assertEqual(source.loaded, 1)
+        self.assertEqual(list(pids), ['p2'])
+        self.assertEqual((source.loaded, source.duplicates, source.excluded, source.kept), (5, 1, 2, 2))
+
+    def test_dedupe_window(self):
+        source = ParticipantSource(ids=['p1', 'p2', 'p1', 'p3', 'p1', 'p2'], dedupe_window=2)
+        # p1 and p2 are forgotten once 2 other distinct ids are read
+        self.assertEqual(list(source), ['p1', 'p2', 'p3', 'p1', 'p2'])
+        self.assertEqual(source.duplicates, 1)
+        source = ParticipantSource(ids=['p1', 'p2', 'p3', 'p1'], dedupe_window=None)
+        self.assertEqual(list(source), ['p1', 'p2', 'p3'])
+
+    def test_errors(self):
+        with self.assertRaises(Exception):
+            list(ParticipantSource(path=self.write('dict.json', json.dumps({'p1': 'a'}))))
+        with self.assertRaises(ValueError):
+            list(ParticipantSource(path=self.write('bad.jsonl', '{"name": "p1"}\n')))
+        with self.assertRaises(ValueError):
+            ParticipantSource()